@@ -43,7 +43,8 @@ const EditorPage = () => {
         const uploadResult = await imageAPI.uploadImage(file)
         
         if (uploadResult.success) {
-          setUploadedImage(uploadResult.image_data)
+          // Screen-size preview for editing; boxes are percentages so they line up at any size
+          setUploadedImage(uploadResult.preview_url || uploadResult.image_url || uploadResult.image_data)
           setFileId(uploadResult.file_id)
           
           // Automatically start person detection
@@ -93,6 +94,7 @@ const EditorPage = () => {
       setIsProcessing(true)
       setCurrentStep('process')
       setProcessingProgress(0)
+      setProcessedImage(null)
 
       // Simulate progress updates
       const progressInterval = setInterval(() => {
@@ -105,18 +107,19 @@ const EditorPage = () => {
         })
       }, 500)
 
-      const result = await imageAPI.removePeople(
+      // Show the low-res preview as soon as it arrives; the full result replaces it
+      const result = await imageAPI.removePeopleProgressive(
         fileId, 
         selectedPeople, 
-        detectedPeople, 
-        qualityMode
+        qualityMode,
+        (preview) => setProcessedImage(preview.preview_image)
       )
 
       clearInterval(progressInterval)
       setProcessingProgress(100)
 
       if (result.success) {
-        setProcessedImage(result.result_image)
+        setProcessedImage(result.result_preview_url || result.result_url || result.result_image)
         setResultId(result.result_id)
         setCurrentStep('complete')
       } else {
@@ -452,7 +455,7 @@ const EditorPage = () => {
                 <div className="h-full flex items-center justify-center">
                   <div className="relative max-w-full max-h-full">
                     <img 
-                      src={currentStep === 'complete' ? processedImage : uploadedImage}
+                      src={(currentStep === 'complete' || currentStep === 'process') && processedImage ? processedImage : uploadedImage}
                       alt="Uploaded photo" 
                       className="max-w-full max-h-full object-contain rounded-lg shadow-lg"
                     />
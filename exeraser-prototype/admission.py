@@ -0,0 +1,332 @@
+import asyncio
+import contextvars
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from src.services.circuit_breaker import VendorUnavailableError
+from src.services.metrics import record_admission
+
+PRIORITIES = ('interactive', 'batch')
+
+# Work outside an interactive request (job workers, batch fan-out) is batch by default
+current_priority = contextvars.ContextVar('admission_priority', default='batch')
+
+# Endpoints whose callers are not waiting on the result
+BATCH_ENDPOINTS = ('detect_people_batch',)
+
+# Concurrent calls allowed per backend (override with <NAME>_CONCURRENCY);
+# the vendor limits match their connection pools, local inpainting is CPU-bound
+DEFAULT_CONCURRENCY = {'roboflow': 32, 'clipdrop': 10, 'segmind': 10, 'local': os.cpu_count() or 2}
+
+# Async waiters re-check for a free slot this often
+ASYNC_POLL_SECONDS = 0.02
+
+
+class OverloadedError(VendorUnavailableError):
+    """Raised when a request is shed because its queue would miss the latency SLO"""
+
+
+class ClientRateLimiter:
+    """Non-blocking token bucket per client address, least recently seen evicted first"""
+
+    def __init__(self, rate, burst=None, max_clients=10000):
+        self.rate = float(rate)
+        self.capacity = float(burst or max(1.0, rate))
+        self.max_clients = max_clients
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+        self.limited = 0
+
+    def check(self, client):
+        """Take a token for client and return 0, or seconds until one is available"""
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated = self._buckets.pop(client, (self.capacity, now))
+            tokens = min(self.capacity, tokens + (now - updated) * self.rate)
+            if tokens >= 1:
+                tokens -= 1
+                wait = 0
+            else:
+                self.limited += 1
+                wait = (1 - tokens) / self.rate
+            self._buckets[client] = (tokens, now)
+            while len(self._buckets) > self.max_clients:
+                self._buckets.popitem(last=False)
+            return wait
+
+    def stats(self):
+        with self._lock:
+            return {
+                'rate': self.rate,
+                'burst': self.capacity,
+                'clients': len(self._buckets),
+                'limited': self.limited
+            }
+
+
+class ConcurrencyBudget:
+    """Bounded concurrent calls to one backend, granted by priority with SLO-based shedding
+
+    Interactive waiters always go before batch ones, and batch work may only
+    fill batch_share of the slots so interactive requests keep headroom. A
+    caller whose estimated queue wait exceeds its class SLO is shed at once
+    with OverloadedError rather than queued behind work it cannot outrun.
+    """
+
+    def __init__(self, name, limit, slo=None, batch_share=0.75):
+        self.name = name
+        self.limit = max(1, int(limit))
+        self.slo = slo or {'interactive': 2.0, 'batch': 30.0}
+        self.batch_limit = max(1, int(self.limit * batch_share))
+        self._cond = threading.Condition()
+        self._active = 0
+        self._waiting = {priority: 0 for priority in PRIORITIES}
+        # Moving average of how long a slot is held, for queue wait estimates
+        self._hold_seconds = None
+        self.admitted = {priority: 0 for priority in PRIORITIES}
+        self.shed = {priority: 0 for priority in PRIORITIES}
+
+    def acquire(self, priority=None):
+        """Block until a slot is free, returning a token for release()"""
+        priority = priority or current_priority.get()
+        deadline = self._enqueue(priority)
+        try:
+            with self._cond:
+                while not self._try_enter(priority):
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise self._shed(priority)
+                    self._cond.wait(remaining)
+        finally:
+            self._dequeue(priority)
+        return self._admitted(priority, deadline)
+
+    async def acquire_async(self, priority=None):
+        """acquire() for coroutines, polling instead of blocking the event loop"""
+        priority = priority or current_priority.get()
+        deadline = self._enqueue(priority)
+        try:
+            while True:
+                with self._cond:
+                    if self._try_enter(priority):
+                        break
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise self._shed(priority)
+                await asyncio.sleep(min(ASYNC_POLL_SECONDS, remaining))
+        finally:
+            self._dequeue(priority)
+        return self._admitted(priority, deadline)
+
+    def release(self, token):
+        """Free the slot taken by acquire()"""
+        held = time.monotonic() - token
+        with self._cond:
+            self._active -= 1
+            if self._hold_seconds is None:
+                self._hold_seconds = held
+            else:
+                self._hold_seconds += 0.1 * (held - self._hold_seconds)
+            self._cond.notify_all()
+
+    def estimated_wait(self, priority):
+        """Seconds a new caller of this class would queue before getting a slot"""
+        with self._cond:
+            return self._estimate(priority)
+
+    def _enqueue(self, priority):
+        with self._cond:
+            estimate = self._estimate(priority)
+            if estimate > self.slo[priority]:
+                raise self._shed(priority, estimate)
+            self._waiting[priority] += 1
+            return time.monotonic() + self.slo[priority]
+
+    def _dequeue(self, priority):
+        with self._cond:
+            self._waiting[priority] -= 1
+
+    def _admitted(self, priority, deadline):
+        now = time.monotonic()
+        record_admission(self.name, priority, now - (deadline - self.slo[priority]), True)
+        with self._cond:
+            self.admitted[priority] += 1
+        return now
+
+    def _try_enter(self, priority):
+        # Caller holds the lock
+        if priority == 'batch' and (self._waiting['interactive'] or self._active >= self.batch_limit):
+            return False
+        if self._active >= self.limit:
+            return False
+        self._active += 1
+        return True
+
+    def _estimate(self, priority):
+        # Caller holds the lock; queued work drains `limit` calls per average hold time
+        ahead = self._waiting['interactive']
+        limit = self.limit
+        if priority == 'batch':
+            ahead += self._waiting['batch']
+            limit = self.batch_limit
+        excess = self._active + ahead - limit + 1
+        if excess <= 0 or self._hold_seconds is None:
+            return 0.0
+        return math.ceil(excess / float(limit)) * self._hold_seconds
+
+    def _shed(self, priority, estimate=None):
+        # Caller holds the lock
+        self.shed[priority] += 1
+        record_admission(self.name, priority, 0.0, False)
+        retry_after = estimate if estimate is not None else self._estimate(priority)
+        return OverloadedError(
+            f"{self.name} is at capacity ({self.limit} concurrent calls)",
+            retry_after=max(retry_after, self._hold_seconds or 1.0)
+        )
+
+    def stats(self):
+        with self._cond:
+            return {
+                'limit': self.limit,
+                'batch_limit': self.batch_limit,
+                'active': self._active,
+                'waiting': dict(self._waiting),
+                'admitted': dict(self.admitted),
+                'shed': dict(self.shed),
+                'avg_hold_ms': self._hold_seconds * 1000 if self._hold_seconds is not None else None,
+                'estimated_wait_ms': {priority: self._estimate(priority) * 1000 for priority in PRIORITIES}
+            }
+
+
+_budgets = {}
+_budgets_lock = threading.Lock()
+
+
+def get_budget(name):
+    """Return the process-wide concurrency budget for a backend, or None when disabled"""
+    if os.getenv('ADMISSION_CONTROL', '1') != '1':
+        return None
+    budget = _budgets.get(name)
+    if budget is not None:
+        return budget
+    with _budgets_lock:
+        budget = _budgets.get(name)
+        if budget is None:
+            limit = os.getenv(f'{name.upper()}_CONCURRENCY') or DEFAULT_CONCURRENCY.get(name, 8)
+            budget = ConcurrencyBudget(
+                name, int(limit),
+                slo={
+                    'interactive': float(os.getenv('ADMISSION_SLO_INTERACTIVE', '2')),
+                    'batch': float(os.getenv('ADMISSION_SLO_BATCH', '30'))
+                },
+                batch_share=float(os.getenv('ADMISSION_BATCH_SHARE', '0.75'))
+            )
+            _budgets[name] = budget
+        return budget
+
+
+def create_client_limiter():
+    """Per-client limiter from CLIENT_RATE_LIMIT (requests/second, 0 disables) and CLIENT_BURST"""
+    rate = float(os.getenv('CLIENT_RATE_LIMIT', '10'))
+    if os.getenv('ADMISSION_CONTROL', '1') != '1' or rate <= 0:
+        return None
+    return ClientRateLimiter(rate, burst=float(os.getenv('CLIENT_BURST', '40')))
+
+
+client_limiter = create_client_limiter()
+
+# Header carrying the client address when behind a reverse proxy (e.g. X-Forwarded-For);
+# only set this when the proxy overwrites or appends to it, or clients can spoof it
+TRUSTED_PROXY_HEADER = os.getenv('TRUSTED_PROXY_HEADER', '')
+
+
+def admission_stats():
+    """Client limiter and per-backend budget counters for /status"""
+    with _budgets_lock:
+        budgets = dict(_budgets)
+    return {
+        'enabled': os.getenv('ADMISSION_CONTROL', '1') == '1',
+        'clients': client_limiter.stats() if client_limiter else None,
+        'budgets': {name: budget.stats() for name, budget in budgets.items()}
+    }
+
+
+def request_priority(current_request, data=None):
+    """Priority class of a request: batch endpoints, background jobs and self-declared batch callers"""
+    if current_request.endpoint and current_request.endpoint.rsplit('.', 1)[-1] in BATCH_ENDPOINTS:
+        return 'batch'
+    if current_request.headers.get('X-Priority', '').lower() == 'batch':
+        return 'batch'
+    if isinstance(data, dict) and data.get('async'):
+        return 'batch'
+    return 'interactive'
+
+
+def client_id(current_request):
+    """Rate limit key: the caller's address, as reported by a trusted proxy when configured
+
+    X-API-Key is not checked against anything, so keying on it would let a
+    client dodge its limit (and push out other clients' buckets) by sending
+    a fresh key per request.
+    """
+    if TRUSTED_PROXY_HEADER:
+        forwarded = current_request.headers.get(TRUSTED_PROXY_HEADER, '')
+        # The proxy appends the address it saw, so the last hop is the one it vouches for
+        address = forwarded.rsplit(',', 1)[-1].strip()
+        if address:
+            return f"ip:{address}"
+    return f"ip:{current_request.remote_addr}"
+
+
+def _admit(current_request, data):
+    # Returns the Retry-After seconds for a rate-limited request, or None
+    current_priority.set(request_priority(current_request, data))
+    if client_limiter is None or current_request.method != 'POST':
+        return None
+    wait = client_limiter.check(client_id(current_request))
+    if wait:
+        record_admission('client', current_priority.get(), 0.0, False)
+        return wait
+    return None
+
+
+def _too_many_requests(jsonify, message, retry_after):
+    response = jsonify({'error': message})
+    response.headers['Retry-After'] = str(max(1, math.ceil(retry_after or 1)))
+    return response, 429
+
+
+def admit_blueprint(blueprint):
+    """Apply per-client rate limits and set each request's priority class for a blueprint"""
+    from flask import jsonify, request
+
+    @blueprint.before_request
+    def _admit_request():
+        data = request.get_json(silent=True) if request.is_json else None
+        wait = _admit(request, data)
+        if wait is not None:
+            return _too_many_requests(jsonify, 'Rate limit exceeded, slow down', wait)
+
+    return blueprint
+
+
+def admit_async_blueprint(blueprint):
+    """admit_blueprint for Quart blueprints served by the ASGI app"""
+    from quart import jsonify, request
+
+    @blueprint.before_request
+    async def _admit_request():
+        data = await request.get_json(silent=True) if request.is_json else None
+        wait = _admit(request, data)
+        if wait is not None:
+            return _too_many_requests(jsonify, 'Rate limit exceeded, slow down', wait)
+
+    return blueprint
+
+
+def overloaded_response(jsonify, error):
+    """429 for a request shed by a concurrency budget"""
+    return _too_many_requests(jsonify, str(error), error.retry_after)
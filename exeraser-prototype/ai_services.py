@@ -1,52 +1,162 @@
 import os
-import requests
+import asyncio
+import threading
 import base64
 import json
 from io import BytesIO
-from PIL import Image, ImageDraw
-import numpy as np
+from pathlib import Path
+from src.services.vendor_transport import get_transport
+from src.services.async_transport import get_async_transport
+from src.services.circuit_breaker import VendorUnavailableError
+from src.services.admission import OverloadedError, get_budget
+from src.services.metrics import span
+from src.services.image_metadata import image_dimensions
+from src.services.vendor_payload import decode_mask, downscale_with_mask, prepare_image_payload
+from src.services.region_inpaint import composite_region, encode_jpeg, prepare_region, region_bounds
+from src.services.local_inpaint import inpaint_array
+from src.services import local_detector
+from src.services.cpu_pool import cpu_pool
+from src.services.mask_engine import (
+    encode_mask_png, mask_hash, percent_boxes_to_pixels, percent_polygon_to_pixels
+)
+from src.services.segment_masks import segment_matches
+from src.services.startup import LazyModule
+
+Image = LazyModule('PIL.Image')
+np = LazyModule('numpy')
 
 class RoboflowPersonDetector:
     """Roboflow People Detection API integration"""
     
-    def __init__(self, api_key=None):
+    def __init__(self, api_key=None, transport=None, cache=None, input_size=None, input_quality=85,
+                 async_transport=None, fallback=None, local_detector=None):
         self.api_key = api_key or os.getenv('ROBOFLOW_API_KEY')
-        self.base_url = "https://detect.roboflow.com/people-detection-general/5"
+        self.model_version = "people-detection-general/5"
+        self.base_url = f"{os.getenv('ROBOFLOW_API_URL', 'https://detect.roboflow.com')}/{self.model_version}"
+        self.transport = transport or get_transport('roboflow')
+        # Created on first async call so aiohttp is only needed in ASGI mode
+        self.async_transport = async_transport
+        # On vendor failure: 'stale' (expired cache entry, else error), 'local', 'error' or 'mock'
+        self.fallback = fallback or os.getenv('DETECTION_FALLBACK', 'stale')
+        self.local_detector = local_detector
+        self.hedging = os.getenv('DETECTION_HEDGING', '1') == '1'
+        self.cache = cache
+        # The model runs at 640px, so larger uploads only cost bandwidth
+        self.input_size = input_size or int(os.getenv('ROBOFLOW_INPUT_SIZE', '640'))
+        self.input_quality = input_quality
         
     def detect_people(self, image_path):
         """Detect people in an image using Roboflow API"""
+        if not self.api_key:
+            if self._local_fallback():
+                return self.local_detector.detect_people(image_path)
+            # Return mock data if no API key
+            return self._get_mock_detection()
+        
+        cache_key = None
         try:
-            if not self.api_key:
-                # Return mock data if no API key
-                return self._get_mock_detection()
+            cache_key, cached_people, image_data, sent_size = self._prepare_request(image_path)
+            if cached_people is not None:
+                return cached_people
             
-            # Convert image to base64
-            with open(image_path, 'rb') as f:
-                image_data = base64.b64encode(f.read()).decode('utf-8')
-            
-            # Make API request
-            response = requests.post(
+            # Make API request; detection is idempotent, so slow calls may be hedged
+            post = self.transport.hedged_post if self.hedging else self.transport.post
+            response = post(
                 f"{self.base_url}?api_key={self.api_key}",
-                data=image_data,
-                headers={"Content-Type": "application/x-www-form-urlencoded"}
+                files={'file': ('image.jpg', image_data, 'image/jpeg')}
+            )
+            return self._handle_response(response, cache_key, sent_size)
+                
+        except Exception as e:
+            print(f"Person detection error: {e}")
+            return self._fallback(cache_key, e, image_path)
+    
+    async def detect_people_async(self, image_path):
+        """Detect people without blocking the event loop on the vendor call"""
+        if not self.api_key:
+            if self._local_fallback():
+                return await self.local_detector.detect_people_async(image_path)
+            return self._get_mock_detection()
+        
+        cache_key = None
+        try:
+            # Hashing and payload encoding are CPU/disk work, keep them off the loop
+            cache_key, cached_people, image_data, sent_size = await asyncio.to_thread(
+                self._prepare_request, image_path
             )
+            if cached_people is not None:
+                return cached_people
             
-            if response.status_code == 200:
-                result = response.json()
-                return self._format_detection_result(result)
-            else:
-                print(f"Roboflow API error: {response.status_code}")
-                return self._get_mock_detection()
+            transport = self.async_transport or get_async_transport('roboflow')
+            post = transport.hedged_post if self.hedging else transport.post
+            response = await post(
+                f"{self.base_url}?api_key={self.api_key}",
+                files={'file': ('image.jpg', image_data, 'image/jpeg')}
+            )
+            return self._handle_response(response, cache_key, sent_size)
                 
         except Exception as e:
             print(f"Person detection error: {e}")
+            if self._local_fallback():
+                # Local inference is CPU work, keep it off the loop
+                return await asyncio.to_thread(self._fallback, cache_key, e, image_path)
+            return self._fallback(cache_key, e, image_path)
+    
+    def _prepare_request(self, image_path):
+        """Return (cache_key, cached_people, payload, sent_size); payload is None on a cache hit"""
+        # Identical images were already paid for, serve them from the cache
+        cache_key = None
+        if self.cache:
+            cache_key = self.cache.make_key(image_path, f"{self.model_version}@{self.input_size}")
+            cached_people = self.cache.get(cache_key)
+            if cached_people is not None:
+                return cache_key, cached_people, None, None
+        
+        # Send a compact JPEG at the model's input size as binary multipart
+        with span('detector_payload_encode'):
+            image_data, _, sent_size = prepare_image_payload(
+                image_path, self.input_size, self.input_quality
+            )
+        return cache_key, None, image_data, sent_size
+    
+    def _handle_response(self, response, cache_key, sent_size):
+        """Turn a Roboflow response into people, caching real results"""
+        if response.status_code == 200:
+            result = response.json()
+            people = self._format_detection_result(result, sent_size)
+            if cache_key:
+                self.cache.set(cache_key, people)
+            return people
+        else:
+            raise VendorUnavailableError(f"Roboflow API error: {response.status_code}")
+    
+    def _local_fallback(self):
+        return self.fallback == 'local' and self.local_detector is not None and self.local_detector.available
+    
+    def _fallback(self, cache_key, error, image_path=None):
+        """Serve the configured fallback after Roboflow failed, or raise VendorUnavailableError"""
+        if self.fallback == 'mock':
             return self._get_mock_detection()
+        if self._local_fallback() and image_path:
+            return self.local_detector.detect_people(image_path)
+        if self.fallback == 'stale' and cache_key and self.cache:
+            people = self.cache.get_stale(cache_key)
+            if people is not None:
+                return people
+        if isinstance(error, OverloadedError):
+            # Shed under load: the client should back off, the vendor itself is fine
+            raise error
+        raise VendorUnavailableError(
+            f"Person detection is unavailable: {error}", retry_after=getattr(error, 'retry_after', None)
+        )
     
-    def _format_detection_result(self, result):
+    def _format_detection_result(self, result, image_size=(1, 1)):
         """Format Roboflow API response to our format"""
+        # Percentages are resolution independent, so boxes found on the
+        # downscaled payload map straight back onto the original image
         people = []
-        image_width = result.get('image', {}).get('width', 1)
-        image_height = result.get('image', {}).get('height', 1)
+        image_width = result.get('image', {}).get('width') or image_size[0]
+        image_height = result.get('image', {}).get('height') or image_size[1]
         
         for i, prediction in enumerate(result.get('predictions', [])):
             # Convert absolute coordinates to percentages
@@ -80,141 +190,409 @@ class RoboflowPersonDetector:
             {"id": 3, "x": 75, "y": 35, "width": 15, "height": 35, "confidence": 0.92}
         ]
 
-class ClipDropImageProcessor:
+class LocalPersonDetector:
+    """On-device person detection (ONNX Runtime, CPU) with the RoboflowPersonDetector contract"""
+    
+    def __init__(self, model_path=None, cache=None):
+        # A YOLOv8/YOLO11-style ONNX export, e.g. `yolo export model=yolov8n.pt format=onnx dynamic=True`
+        self.model_path = model_path or os.getenv('LOCAL_DETECTOR_MODEL')
+        self.cache = cache
+    
+    @property
+    def available(self):
+        """Whether a model is configured and ONNX Runtime is installed"""
+        return bool(self.model_path) and local_detector.onnxruntime.available
+    
+    @property
+    def model_version(self):
+        return f"local:{os.path.basename(self.model_path or '')}"
+    
+    def detect_people(self, image_path):
+        """Detect people locally; concurrent calls share batched inference"""
+        if not self.available:
+            raise VendorUnavailableError('Local person detector is not configured')
+        
+        cache_key = None
+        if self.cache:
+            cache_key = self.cache.make_key(image_path, self.model_version)
+            cached_people = self.cache.get(cache_key)
+            if cached_people is not None:
+                return cached_people
+        
+        # The model is loaded once per process and shared across requests
+        engine = local_detector.get_local_detector(self.model_path)
+        with span('local_detect'):
+            people = engine.detect(image_path)
+        if cache_key:
+            self.cache.set(cache_key, people)
+        return people
+    
+    async def detect_people_async(self, image_path):
+        """Local detection in a worker thread so batches still form across requests"""
+        return await asyncio.to_thread(self.detect_people, image_path)
+    
+    def stats(self):
+        status = {'available': self.available, 'model': self.model_version}
+        engine = local_detector.peek_local_detector(self.model_path)
+        if engine is not None:
+            status.update(engine.stats())
+        return status
+
+class ImageProcessor:
+    """Base interface for backends that remove masked regions from an image"""
+    
+    name = None
+    
+    def __init__(self, mask_dilate=None, mask_feather=None):
+        self.mask_dilate = mask_dilate if mask_dilate is not None else int(os.getenv('MASK_DILATE_PX', '0'))
+        self.mask_feather = mask_feather if mask_feather is not None else int(os.getenv('MASK_FEATHER_PX', '0'))
+    
+    @property
+    def available(self):
+        """Whether the backend can currently process requests"""
+        return True
+    
+    def retry_after(self):
+        """Seconds until a failing backend is worth retrying, if known"""
+        return None
+    
+    def inpaint(self, image_path, mask, quality_mode='fast'):
+        """Return JPEG bytes with the masked area filled, or None when unavailable"""
+        raise NotImplementedError
+    
+    async def inpaint_async(self, image_path, mask, quality_mode='fast'):
+        """Async inpaint; CPU-bound backends run in a worker thread"""
+        return await asyncio.to_thread(self.inpaint, image_path, mask, quality_mode)
+    
+    def render_mask(self, image_path, people_data, selected_people, segments=None):
+        """Render a single-channel uint8 mask for selected people
+
+        segments maps person ids to cached segmentation masks; people without
+        a matching segment fall back to their polygon or box.
+        """
+        # Dimensions come from the upload's metadata record when available
+        width, height = image_dimensions(image_path)
+        
+        selected = set(selected_people)
+        boxes = []
+        polygons = []
+        person_segments = []
+        for person in people_data:
+            if person['id'] not in selected:
+                continue
+            segment = (segments or {}).get(person['id'])
+            if segment is not None and segment_matches(segment, person):
+                # Still bit-packed; unpacked where the mask is built
+                person_segments.append(segment)
+            elif person.get('polygon'):
+                polygons.append(percent_polygon_to_pixels(person['polygon'], width, height))
+            else:
+                boxes.append(person)
+        
+        with span('mask_build'):
+            return cpu_pool.render_mask(
+                width, height,
+                boxes=percent_boxes_to_pixels(boxes, width, height),
+                polygons=polygons,
+                segments=person_segments,
+                dilate=self.mask_dilate,
+                feather=self.mask_feather
+            )
+    
+    @staticmethod
+    def mask_hash(mask):
+        """Return a canonical hash of a rendered mask's pixels"""
+        return mask_hash(mask)
+
+class LocalInpaintProcessor(ImageProcessor):
+    """Offline CPU inpainting (OpenCV Telea/Navier-Stokes when installed, NumPy otherwise)"""
+    
+    name = 'local'
+    
+    def __init__(self, radius=5, **kwargs):
+        super().__init__(**kwargs)
+        self.radius = radius
+    
+    def inpaint(self, image_path, mask, quality_mode='fast'):
+        """Fill the masked area locally, returning None on failure
+
+        Raises OverloadedError when the CPU budget sheds the call.
+        """
+        budget = get_budget('local')
+        token = budget.acquire() if budget else None
+        try:
+            method = 'ns' if quality_mode == 'quality' else 'telea'
+            # Decode, fill and encode in one CPU worker task, the mask passed through shared memory
+            with span('local_inpaint'):
+                return cpu_pool.inpaint_jpeg(image_path, mask, method=method, radius=self.radius)
+        except Exception as e:
+            print(f"Local inpainting error: {e}")
+            return None
+        finally:
+            if token is not None:
+                budget.release(token)
+    
+    def preview(self, image_path, mask, max_side=512, quality=80):
+        """Fast low-resolution fill for progressive removal, returning JPEG bytes or None"""
+        try:
+            with span('preview_decode'):
+                image, preview_mask = downscale_with_mask(image_path, mask, max_side)
+            with span('preview_inpaint'):
+                result = inpaint_array(image, preview_mask, method='telea', radius=max(2, self.radius // 2))
+            with span('encode'):
+                return encode_jpeg(Image.fromarray(result), quality=quality)
+        except Exception as e:
+            print(f"Preview inpainting error: {e}")
+            return None
+
+class ClipDropImageProcessor(ImageProcessor):
     """ClipDrop Cleanup API integration"""
     
-    def __init__(self, api_key=None):
+    name = 'clipdrop'
+    
+    def __init__(self, api_key=None, transport=None, mask_dilate=None, mask_feather=None,
+                 roi_enabled=None, max_pixels=None, seam_feather=8, async_transport=None):
+        super().__init__(mask_dilate=mask_dilate, mask_feather=mask_feather)
         self.api_key = api_key or os.getenv('CLIPDROP_API_KEY')
-        self.base_url = "https://clipdrop-api.co/cleanup/v1"
-        
-    def remove_people(self, image_path, people_data, selected_people, quality_mode='fast'):
-        """Remove selected people from image using ClipDrop API"""
+        self.base_url = os.getenv('CLIPDROP_API_URL', "https://clipdrop-api.co/cleanup/v1")
+        self.transport = transport or get_transport('clipdrop')
+        self.async_transport = async_transport
+        # Only send the region around the selected people, downscaled to a pixel budget
+        self.roi_enabled = roi_enabled if roi_enabled is not None else os.getenv('CLIPDROP_ROI', '1') == '1'
+        self.max_pixels = max_pixels if max_pixels is not None else int(os.getenv('CLIPDROP_MAX_PIXELS', '4000000'))
+        self.seam_feather = seam_feather
+    
+    @property
+    def available(self):
+        return bool(self.api_key)
+    
+    def retry_after(self):
+        return self.transport.breaker.retry_after() if self.transport.breaker else None
+    
+    def inpaint(self, image_path, mask, quality_mode='fast'):
+        """Send image and rendered mask to ClipDrop, returning None when unavailable
+
+        Raises OverloadedError when the ClipDrop budget sheds the call.
+        """
         try:
             if not self.api_key:
-                # Return original image if no API key
-                return self._copy_original_image(image_path)
-            
-            # Create mask for selected people
-            mask_path = self._create_mask(image_path, people_data, selected_people)
+                return None
             
-            # Prepare files for API request
-            with open(image_path, 'rb') as image_file:
-                with open(mask_path, 'rb') as mask_file:
-                    files = {
-                        'image_file': image_file,
-                        'mask_file': mask_file
-                    }
-                    
-                    data = {
-                        'mode': quality_mode
-                    }
-                    
-                    headers = {
-                        'x-api-key': self.api_key
-                    }
+            image_file, mask_data, region = self._prepare_cleanup(image_path, mask)
+            result = self._request_cleanup(image_file, mask_data, quality_mode)
+            if result is None or region is None:
+                return result
+            return self._finish_cleanup(result, mask, region)
                     
-                    response = requests.post(
-                        self.base_url,
-                        files=files,
-                        data=data,
-                        headers=headers
-                    )
+        except OverloadedError:
+            raise
+        except Exception as e:
+            print(f"Image processing error: {e}")
+            return None
+    
+    async def inpaint_async(self, image_path, mask, quality_mode='fast'):
+        """ClipDrop cleanup with the vendor call on the event loop and image work in threads"""
+        try:
+            if not self.api_key:
+                return None
+            
+            image_file, mask_data, region = await asyncio.to_thread(self._prepare_cleanup, image_path, mask)
+            transport = self.async_transport or get_async_transport('clipdrop')
+            response = await transport.post(self.base_url, **self._cleanup_request(image_file, mask_data, quality_mode))
+            result = self._cleanup_result(response)
+            if result is None or region is None:
+                return result
+            return await asyncio.to_thread(self._finish_cleanup, result, mask, region)
                     
-                    if response.status_code == 200:
-                        return response.content
-                    else:
-                        print(f"ClipDrop API error: {response.status_code}")
-                        return self._copy_original_image(image_path)
-                        
+        except OverloadedError:
+            raise
         except Exception as e:
             print(f"Image processing error: {e}")
-            return self._copy_original_image(image_path)
-        finally:
-            # Clean up temporary mask file
-            if 'mask_path' in locals() and os.path.exists(mask_path):
-                os.remove(mask_path)
+            return None
     
-    def _create_mask(self, image_path, people_data, selected_people):
-        """Create a binary mask for selected people"""
-        # Load original image to get dimensions
-        with Image.open(image_path) as img:
-            width, height = img.size
+    def _prepare_cleanup(self, image_path, mask):
+        """Return (image_file, mask_data, region); region is None when the result is used as-is"""
+        height, width = mask.shape
+        bounds = region_bounds(mask) if self.roi_enabled else None
         
-        # Create black mask
-        mask = Image.new('RGB', (width, height), (0, 0, 0))
-        draw = ImageDraw.Draw(mask)
+        if bounds is None and width * height <= self.max_pixels:
+            # Small enough to send as-is: the transport streams the stored file
+            # into the request body, the mask never touches disk
+            return ('image.jpg', Path(image_path), 'image/jpeg'), encode_mask_png(mask), None
         
-        # Draw white rectangles for selected people
-        for person in people_data:
-            if person['id'] in selected_people:
-                # Convert percentages back to pixels
-                x = int((person['x'] / 100) * width)
-                y = int((person['y'] / 100) * height)
-                w = int((person['width'] / 100) * width)
-                h = int((person['height'] / 100) * height)
-                
-                # Draw white rectangle (area to be removed)
-                draw.rectangle([x, y, x + w, y + h], fill=(255, 255, 255))
-        
-        # Save mask temporarily
-        mask_path = image_path.replace('.jpg', '_mask.png')
-        mask.save(mask_path, 'PNG')
-        return mask_path
-    
-    def _copy_original_image(self, image_path):
-        """Return original image data when API is not available"""
-        with open(image_path, 'rb') as f:
-            return f.read()
-
+        # Crop to the selection and/or downscale, then blend the result back
+        bounds = bounds or (0, 0, width, height)
+        with span('decode'):
+            with Image.open(image_path) as img:
+                image = img.convert('RGB')
+        with span('region_prepare'):
+            region_image, region_mask = prepare_region(image, mask, bounds, self.max_pixels)
+            region_data = encode_jpeg(region_image)
+        return ('image.jpg', region_data, 'image/jpeg'), encode_mask_png(region_mask), (image, bounds)
+    
+    def _finish_cleanup(self, result, mask, region):
+        """Blend a cleaned-up region back into the full image"""
+        image, bounds = region
+        with span('composite'):
+            image = composite_region(image, result, mask, bounds, self.seam_feather)
+        with span('encode'):
+            return encode_jpeg(image)
+    
+    def _request_cleanup(self, image_file, mask_data, quality_mode):
+        """Post one cleanup request, returning the result bytes or None"""
+        response = self.transport.post(self.base_url, **self._cleanup_request(image_file, mask_data, quality_mode))
+        return self._cleanup_result(response)
+    
+    def _cleanup_request(self, image_file, mask_data, quality_mode):
+        """Multipart body and headers for a cleanup request"""
+        # Prepare files for API request
+        files = {
+            'image_file': image_file,
+            'mask_file': ('mask.png', mask_data, 'image/png')
+        }
+        
+        data = {
+            'mode': quality_mode
+        }
+        
+        headers = {
+            'x-api-key': self.api_key
+        }
+        
+        return {'files': files, 'data': data, 'headers': headers}
+    
+    def _cleanup_result(self, response):
+        if response.status_code == 200:
+            return response.content
+        else:
+            print(f"ClipDrop API error: {response.status_code}")
+            return None
+    
 class SegmindMaskGenerator:
     """Segmind Automatic Mask Generator API integration"""
     
-    def __init__(self, api_key=None):
+    def __init__(self, api_key=None, transport=None, input_size=None, input_quality=85,
+                 async_transport=None):
         self.api_key = api_key or os.getenv('SEGMIND_API_KEY')
-        self.base_url = "https://api.segmind.com/v1/automatic-mask-generator"
+        self.base_url = os.getenv('SEGMIND_API_URL', "https://api.segmind.com/v1/automatic-mask-generator")
+        self.transport = transport or get_transport('segmind')
+        self.async_transport = async_transport
+        self.input_size = input_size or int(os.getenv('SEGMIND_INPUT_SIZE', '1024'))
+        self.input_quality = input_quality
     
-    def generate_person_masks(self, image_path):
-        """Generate masks for people using Segmind API"""
+    def generate_person_mask_array(self, image_path):
+        """Person mask as a uint8 array at the model's resolution, or None when unavailable"""
+        if not self.api_key:
+            return None
         try:
-            if not self.api_key:
-                return None
-            
-            # Convert image to base64
-            with open(image_path, 'rb') as f:
-                image_data = base64.b64encode(f.read()).decode('utf-8')
-            
-            data = {
-                "prompt": "person",
-                "image": image_data,
-                "threshold": 0.2,
-                "invert_mask": False,
-                "return_mask": True,
-                "return_alpha": False,
-                "grow_mask": 10,
-                "seed": 468685,
-                "base64": True
-            }
-            
-            headers = {'x-api-key': self.api_key}
-            
-            response = requests.post(self.base_url, json=data, headers=headers)
-            
-            if response.status_code == 200:
-                return response.content
-            else:
-                print(f"Segmind API error: {response.status_code}")
-                return None
-                
+            response = self.transport.post(self.base_url, **self._request(image_path))
+            return self._decode_response(response)
+        except Exception as e:
+            print(f"Mask generation error: {e}")
+            return None
+    
+    async def generate_person_mask_array_async(self, image_path):
+        """Async generate_person_mask_array; encoding and decoding run in a worker thread"""
+        if not self.api_key:
+            return None
+        try:
+            request = await asyncio.to_thread(self._request, image_path)
+            transport = self.async_transport or get_async_transport('segmind')
+            response = await transport.post(self.base_url, **request)
+            return await asyncio.to_thread(self._decode_response, response)
         except Exception as e:
             print(f"Mask generation error: {e}")
             return None
+    
+    def _request(self, image_path):
+        """Return the keyword arguments (JSON body and headers) for a mask request"""
+        # The API only takes base64 JSON, so shrink the image before encoding it
+        with span('segmenter_payload_encode'):
+            image_data, _, _ = prepare_image_payload(image_path, self.input_size, self.input_quality)
+        
+        data = {
+            "prompt": "person",
+            "image": base64.b64encode(image_data).decode('ascii'),
+            "threshold": 0.2,
+            "invert_mask": False,
+            "return_mask": True,
+            "return_alpha": False,
+            "grow_mask": 10,
+            "seed": 468685,
+            "base64": False
+        }
+        return {'json': data, 'headers': {'x-api-key': self.api_key}}
+    
+    def _decode_response(self, response):
+        if response.status_code == 200:
+            with span('mask_decode'):
+                return decode_mask(response.content)
+        else:
+            print(f"Segmind API error: {response.status_code}")
+            return None
 
-# Factory function to create AI service instances
-def create_ai_services():
-    """Create and return AI service instances"""
-    return {
-        'person_detector': RoboflowPersonDetector(),
-        'image_processor': ClipDropImageProcessor(),
-        'mask_generator': SegmindMaskGenerator()
-    }
+class LazyServices:
+    """The ai_services mapping, constructing each service on first use
 
+    Vendor clients and their transports are built by the first request that
+    needs them instead of at import, once per name under a lock.
+    """
+    
+    def __init__(self, factories):
+        self._factories = factories
+        self._services = {}
+        # Re-entrant: one service's factory may look up another
+        self._lock = threading.RLock()
+    
+    def __getitem__(self, name):
+        service = self._services.get(name)
+        if service is None:
+            with self._lock:
+                service = self._services.get(name)
+                if service is None:
+                    service = self._services[name] = self._factories[name]()
+        return service
+    
+    def __contains__(self, name):
+        return name in self._factories
+    
+    def get(self, name, default=None):
+        return self[name] if name in self._factories else default
+    
+    def keys(self):
+        return self._factories.keys()
+    
+    def peek(self, name):
+        """The service if it has been constructed, otherwise None (never builds it)"""
+        return self._services.get(name)
+    
+    def built(self):
+        """Names of the services constructed so far"""
+        with self._lock:
+            return sorted(self._services)
+
+# Factory function to create AI service instances
+def create_ai_services(detection_cache=None):
+    """Return the AI services mapping; each service is created when first used"""
+    def person_detectors():
+        detectors = {'local': LocalPersonDetector(cache=detection_cache)}
+        detectors['roboflow'] = RoboflowPersonDetector(
+            cache=detection_cache, local_detector=detectors['local']
+        )
+        return detectors
+    
+    def image_processors():
+        return {
+            'clipdrop': ClipDropImageProcessor(),
+            'local': LocalInpaintProcessor()
+        }
+    
+    services = LazyServices({
+        # DETECTOR_BACKEND=local runs detection on this machine instead of Roboflow
+        'person_detector': lambda: services['person_detectors'][os.getenv('DETECTOR_BACKEND', 'roboflow')],
+        'person_detectors': person_detectors,
+        'image_processor': lambda: services['image_processors']['clipdrop'],
+        'image_processors': image_processors,
+        'mask_generator': SegmindMaskGenerator
+    })
+    return services
@@ -0,0 +1,96 @@
+"""ASGI entry point: async image API with the Flask app mounted for everything else
+
+    python src/asgi.py                      # uvicorn, WEB_WORKERS processes
+    uvicorn src.asgi:app --workers 4        # or any ASGI server
+"""
+import asyncio
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+from src.services.startup import mark_ready
+from quart import Quart, Response, request
+from src.main import app as wsgi_app
+from src.routes.image_async import image_async_bp
+from src.services.async_transport import close_async_transports
+from src.services.metrics import METRICS_CONTENT_TYPE, render_metrics
+
+try:
+    from a2wsgi import WSGIMiddleware
+except ImportError:  # uvicorn's bundled adapter works too, a2wsgi is preferred
+    from uvicorn.middleware.wsgi import WSGIMiddleware
+
+# Paths served by the async app; users, static files and the SPA stay on Flask
+ASYNC_PREFIXES = ('/api/image/', '/metrics')
+
+async_app = Quart(__name__)
+async_app.config['MAX_CONTENT_LENGTH'] = wsgi_app.config['MAX_CONTENT_LENGTH']
+async_app.register_blueprint(image_async_bp, url_prefix='/api/image')
+
+
+@async_app.route('/metrics', methods=['GET'])
+async def prometheus_metrics():
+    """Prometheus text exposition of all pipeline metrics"""
+    return Response(render_metrics(), mimetype=METRICS_CONTENT_TYPE)
+
+
+@async_app.after_request
+async def _cors(response):
+    # Same open policy as flask_cors in main.py
+    response.headers['Access-Control-Allow-Origin'] = '*'
+    if request.method == 'OPTIONS':
+        response.headers['Access-Control-Allow-Methods'] = response.headers.get('Allow', 'GET, POST, OPTIONS')
+        requested = request.headers.get('Access-Control-Request-Headers')
+        if requested:
+            response.headers['Access-Control-Allow-Headers'] = requested
+    return response
+
+
+@async_app.before_serving
+async def _size_worker_pool():
+    # Decode/encode/hash steps hop to threads; the stdlib default of cpu+4 is too few
+    workers = int(os.getenv('ASYNC_WORKER_THREADS', '32'))
+    asyncio.get_running_loop().set_default_executor(
+        ThreadPoolExecutor(max_workers=workers, thread_name_prefix='asgi-worker')
+    )
+
+
+@async_app.after_serving
+async def _close_vendor_clients():
+    await close_async_transports()
+
+
+wsgi = WSGIMiddleware(wsgi_app)
+
+
+async def app(scope, receive, send):
+    """Route the image API to the async app and all other paths to Flask"""
+    if scope['type'] == 'lifespan' or scope.get('path', '').startswith(ASYNC_PREFIXES):
+        await async_app(scope, receive, send)
+    else:
+        await wsgi(scope, receive, send)
+
+
+mark_ready('asgi')
+
+
+def serve():
+    """Production launcher"""
+    import uvicorn
+
+    uvicorn.run(
+        'src.asgi:app',
+        host=os.getenv('HOST', '0.0.0.0'),
+        port=int(os.getenv('PORT', '5000')),
+        workers=int(os.getenv('WEB_WORKERS', '1')),
+        # Only the per-vendor client pools bound concurrency, not a thread count
+        limit_concurrency=int(os.getenv('WEB_MAX_CONNECTIONS', '1000')),
+        timeout_keep_alive=int(os.getenv('WEB_KEEPALIVE', '5')),
+        proxy_headers=True,
+        access_log=os.getenv('WEB_ACCESS_LOG', '0') == '1'
+    )
+
+
+if __name__ == '__main__':
+    serve()
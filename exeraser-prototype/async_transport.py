@@ -0,0 +1,221 @@
+import asyncio
+import json
+import os
+import random
+import threading
+import time
+
+from src.services.circuit_breaker import VendorUnavailableError
+from src.services.vendor_transport import RETRY_STATUSES, VENDOR_TRANSPORT_CONFIG, RateLimiter, get_transport
+
+from src.services.startup import LazyModule
+
+# Only needed for the ASGI serving mode; imported with the first async transport
+aiohttp = LazyModule('aiohttp')
+
+# In-flight requests per vendor; the event loop holds these without a thread each
+ASYNC_MAX_CONNECTIONS = int(os.getenv('VENDOR_ASYNC_CONNECTIONS', '256'))
+
+
+class VendorResponse:
+    """Fully read vendor response exposing the parts of requests.Response the services use"""
+
+    def __init__(self, status_code, headers, content):
+        self.status_code = status_code
+        self.headers = headers
+        self.content = content
+
+    def json(self):
+        return json.loads(self.content)
+
+
+class AsyncVendorTransport:
+    """Non-blocking pooled HTTP client for a single AI vendor
+
+    Accepts the same files/data/json/headers arguments as VendorTransport.
+    Latency, errors and health are recorded on the vendor's sync transport so
+    /status and the Prometheus metrics cover both serving modes.
+    """
+
+    def __init__(self, name, max_connections=ASYNC_MAX_CONNECTIONS, connect_timeout=3.05,
+                 read_timeout=30, max_retries=2, backoff_factor=0.5, backoff_jitter=0.5,
+                 rate_limit=None):
+        if not aiohttp.available:
+            raise RuntimeError('The async transport requires the aiohttp package')
+        self.name = name
+        self.timeout = aiohttp.ClientTimeout(sock_connect=connect_timeout, sock_read=read_timeout)
+        self.max_connections = max_connections
+        self.max_retries = max_retries
+        self.backoff_factor = backoff_factor
+        self.backoff_jitter = backoff_jitter
+        self.rate_limiter = RateLimiter(rate_limit) if rate_limit else None
+        self.stats_transport = get_transport(name)
+        self._sessions = {}
+
+    def _session(self):
+        # aiohttp sessions are bound to the event loop that created them
+        loop = asyncio.get_running_loop()
+        session = self._sessions.get(loop)
+        if session is None:
+            connector = aiohttp.TCPConnector(limit=self.max_connections, keepalive_timeout=30)
+            session = aiohttp.ClientSession(connector=connector, timeout=self.timeout)
+            self._sessions[loop] = session
+        return session
+
+    async def post(self, url, **kwargs):
+        """POST without blocking the event loop, recording latency and errors"""
+        return await self.request('POST', url, **kwargs)
+
+    async def request(self, method, url, **kwargs):
+        budget = self.stats_transport.budget
+        breaker = self.stats_transport.breaker
+        generation = None
+        if breaker:
+            # An open circuit fails fast without queueing for the budget
+            generation = breaker.before_call()
+        if budget is None:
+            return await self._request(method, url, generation, **kwargs)
+        # The budget is shared with the sync transport, so both serving modes draw on it
+        try:
+            token = await budget.acquire_async()
+        except BaseException:
+            # Shed (or cancelled) while queueing; the call never reached the vendor
+            if breaker:
+                breaker.cancel_call(generation)
+            raise
+        try:
+            return await self._request(method, url, generation, **kwargs)
+        finally:
+            budget.release(token)
+
+    async def _request(self, method, url, generation=None, files=None, data=None, **kwargs):
+        breaker = self.stats_transport.breaker
+        if self.rate_limiter:
+            await self.rate_limiter.acquire_async()
+        session = self._session()
+        start = time.perf_counter()
+        failed = True
+        vendor_failed = True
+        retries = 0
+        try:
+            while True:
+                try:
+                    # Multipart bodies are single-use in aiohttp, so rebuild per attempt
+                    body = _form(files, data) if files else data
+                    async with session.request(method, url, data=body, **kwargs) as response:
+                        content = await response.read()
+                except (aiohttp.ClientConnectionError, asyncio.TimeoutError) as e:
+                    if retries >= self.max_retries:
+                        raise VendorUnavailableError(f"{self.name} request failed: {e!r}") from e
+                    retries += 1
+                    await asyncio.sleep(self._backoff(retries))
+                    continue
+                except aiohttp.ClientError as e:
+                    raise VendorUnavailableError(f"{self.name} request failed: {e!r}") from e
+                if response.status in RETRY_STATUSES and retries < self.max_retries:
+                    retries += 1
+                    await asyncio.sleep(self._backoff(retries, response.headers.get('Retry-After')))
+                    continue
+                failed = response.status >= 400
+                vendor_failed = response.status in RETRY_STATUSES or response.status >= 500
+                return VendorResponse(response.status, response.headers, content)
+        except asyncio.CancelledError:
+            # A lost hedge or a client disconnect says nothing about the vendor
+            if breaker:
+                breaker.cancel_call(generation)
+            start = None
+            raise
+        finally:
+            if start is not None:
+                elapsed = time.perf_counter() - start
+                self.stats_transport._record(elapsed, failed, retries, vendor_failed, generation)
+
+    async def hedged_post(self, url, **kwargs):
+        """Async VendorTransport.hedged_post: race a duplicate once the first outlives p95"""
+        delay = self.stats_transport.hedge_delay()
+        if delay is None:
+            return await self.post(url, **kwargs)
+
+        first = asyncio.ensure_future(self.post(url, **kwargs))
+        done, _ = await asyncio.wait({first}, timeout=delay)
+        if done:
+            return first.result()
+
+        with self.stats_transport._lock:
+            self.stats_transport.hedges += 1
+        second = asyncio.ensure_future(self.post(url, **kwargs))
+        pending = {first, second}
+        response, error = None, None
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is not None:
+                        error = error or task.exception()
+                        continue
+                    result = task.result()
+                    if result.status_code < 500:
+                        if task is second:
+                            with self.stats_transport._lock:
+                                self.stats_transport.hedges_won += 1
+                        return result
+                    response = result
+        finally:
+            for task in pending:
+                task.cancel()
+        if response is not None:
+            return response
+        raise error
+
+    def _backoff(self, attempt, retry_after=None):
+        if retry_after and retry_after.isdigit():
+            return float(retry_after)
+        return self.backoff_factor * (2 ** (attempt - 1)) + random.uniform(0, self.backoff_jitter)
+
+    async def aclose(self):
+        for session in list(self._sessions.values()):
+            await session.close()
+        self._sessions.clear()
+
+
+def _form(files, data):
+    # requests-style files={'field': (filename, bytes or path, content_type)} as aiohttp multipart
+    form = aiohttp.FormData()
+    for field, value in (data or {}).items():
+        form.add_field(field, str(value))
+    for field, (filename, content, content_type) in files.items():
+        if isinstance(content, os.PathLike):
+            # aiohttp streams (and then closes) file objects chunk by chunk
+            content = open(content, 'rb')
+        form.add_field(field, content, filename=filename, content_type=content_type)
+    return form
+
+
+_async_transports = {}
+_async_transports_lock = threading.Lock()
+
+
+def get_async_transport(name):
+    """Return the process-wide async transport for a vendor, creating it on first use"""
+    transport = _async_transports.get(name)
+    if transport is not None:
+        return transport
+    with _async_transports_lock:
+        transport = _async_transports.get(name)
+        if transport is None:
+            config = dict(VENDOR_TRANSPORT_CONFIG.get(name, {}))
+            config.pop('pool_size', None)
+            rate_limit = os.getenv(f'{name.upper()}_RATE_LIMIT')
+            if rate_limit:
+                config['rate_limit'] = float(rate_limit)
+            transport = AsyncVendorTransport(name, **config)
+            _async_transports[name] = transport
+        return transport
+
+
+async def close_async_transports():
+    """Close every async vendor client (call on ASGI shutdown)"""
+    with _async_transports_lock:
+        transports = list(_async_transports.values())
+    for transport in transports:
+        await transport.aclose()
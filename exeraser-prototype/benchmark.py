@@ -0,0 +1,338 @@
+"""Throughput/latency benchmark for the image API against local vendor stand-ins
+
+Starts fake Roboflow, ClipDrop and Segmind servers with configurable latency
+and error rates, launches the Flask app from src/main.py in a subprocess
+pointed at them, drives upload -> detect -> remove workloads and writes a JSON
+report. With --baseline, exits non-zero when p95 latency or throughput
+regresses beyond --tolerance.
+
+    python benchmark.py --project-root . --requests 200 --concurrency 8 \\
+        --image-size 1920x1080 --output bench.json --baseline bench_baseline.json
+"""
+import argparse
+import json
+import os
+import random
+import resource
+import socket
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import BytesIO
+
+import numpy as np
+import requests
+from PIL import Image
+
+STEPS = ('upload', 'detect', 'remove')
+
+
+class VendorProfile:
+    """Latency (lognormal around a median) and error-rate model for a fake vendor"""
+
+    def __init__(self, median_ms, sigma=0.3, error_rate=0.0):
+        self.median_ms = median_ms
+        self.sigma = sigma
+        self.error_rate = error_rate
+
+    def sample_delay(self):
+        return self.median_ms / 1000.0 * random.lognormvariate(0, self.sigma)
+
+    def should_fail(self):
+        return random.random() < self.error_rate
+
+
+def _fake_result_jpeg():
+    buffer = BytesIO()
+    Image.new('RGB', (256, 256), (90, 120, 90)).save(buffer, format='JPEG', quality=85)
+    return buffer.getvalue()
+
+
+def _fake_mask_png():
+    buffer = BytesIO()
+    Image.new('L', (256, 256), 0).save(buffer, format='PNG')
+    return buffer.getvalue()
+
+
+def start_fake_vendor(kind, profile):
+    """Start a fake vendor server in a daemon thread and return (server, base_url)"""
+    result_jpeg = _fake_result_jpeg()
+    mask_png = _fake_mask_png()
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def do_POST(self):
+            length = int(self.headers.get('Content-Length', 0))
+            self.rfile.read(length)
+            time.sleep(profile.sample_delay())
+            if profile.should_fail():
+                self._send(503, b'{"error": "unavailable"}', 'application/json')
+            elif kind == 'roboflow':
+                body = json.dumps({
+                    'image': {'width': 640, 'height': 480},
+                    'predictions': [
+                        {'x': 160, 'y': 240, 'width': 100, 'height': 220, 'confidence': 0.93},
+                        {'x': 420, 'y': 250, 'width': 90, 'height': 210, 'confidence': 0.88}
+                    ]
+                }).encode('utf-8')
+                self._send(200, body, 'application/json')
+            elif kind == 'clipdrop':
+                self._send(200, result_jpeg, 'image/jpeg')
+            else:
+                self._send(200, mask_png, 'image/png')
+
+        def _send(self, status, body, content_type):
+            try:
+                self.send_response(status)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+            except (BrokenPipeError, ConnectionResetError):
+                # The losing copy of a hedged request was abandoned by the client
+                self.close_connection = True
+
+        def log_message(self, *args):
+            pass
+
+    class Server(ThreadingHTTPServer):
+        # The default listen backlog of 5 drops connection bursts at high concurrency
+        request_queue_size = 1024
+        daemon_threads = True
+
+    server = Server(('127.0.0.1', 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_port}"
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def start_app(project_root, port, vendor_urls, extra_env=None, server='flask'):
+    """Launch the app in a subprocess wired to the fake vendors
+
+    server='flask' runs src/main.py's threaded dev server, 'asgi' runs src/asgi.py under uvicorn.
+    """
+    env = dict(os.environ)
+    env.update({
+        'EXERASE_AI_MODE': 'full',
+        'ROBOFLOW_API_KEY': 'benchmark', 'ROBOFLOW_API_URL': vendor_urls['roboflow'],
+        'CLIPDROP_API_KEY': 'benchmark', 'CLIPDROP_API_URL': vendor_urls['clipdrop'],
+        'SEGMIND_API_KEY': 'benchmark', 'SEGMIND_API_URL': vendor_urls['segmind'],
+        # Every simulated user shares one address; measure capacity, not the per-client limit
+        'CLIENT_RATE_LIMIT': '0',
+    })
+    env.update(extra_env or {})
+    if server == 'asgi':
+        code = (
+            "import sys; sys.path.insert(0, sys.argv[1]); import uvicorn; "
+            "uvicorn.run('src.asgi:app', host='127.0.0.1', port=int(sys.argv[2]), log_level='warning')"
+        )
+    else:
+        code = (
+            "import sys; sys.path.insert(0, sys.argv[1]); from src.main import app; "
+            "app.run(host='127.0.0.1', port=int(sys.argv[2]), debug=False, threaded=True)"
+        )
+    return subprocess.Popen(
+        [sys.executable, '-c', code, os.path.abspath(project_root), str(port)],
+        env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+
+
+def wait_ready(base_url, timeout=60):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            if requests.get(f"{base_url}/api/image/status", timeout=1).status_code == 200:
+                return
+        except requests.RequestException:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError('App did not become ready in time')
+
+
+def make_image(width, height, seed):
+    rng = np.random.default_rng(seed)
+    # Smooth gradients plus noise compress like a photo rather than pure noise
+    base = np.linspace(0, 255, width, dtype=np.float32)[None, :, None]
+    pixels = base + rng.normal(0, 20, (height, width, 3)).astype(np.float32)
+    buffer = BytesIO()
+    Image.fromarray(np.clip(pixels, 0, 255).astype(np.uint8)).save(buffer, format='JPEG', quality=90)
+    return buffer.getvalue()
+
+
+def run_workload(base_url, total, concurrency, images, quality_mode):
+    """Drive upload -> detect -> remove flows and collect per-step latencies"""
+    samples = {step: [] for step in STEPS}
+    errors = {step: 0 for step in STEPS}
+    lock = threading.Lock()
+    local = threading.local()
+
+    def session():
+        if not hasattr(local, 'session'):
+            local.session = requests.Session()
+        return local.session
+
+    def timed(step, call):
+        start = time.perf_counter()
+        try:
+            response = call()
+            ok = response.status_code < 400
+        except requests.RequestException:
+            response, ok = None, False
+        elapsed = time.perf_counter() - start
+        with lock:
+            if ok:
+                samples[step].append(elapsed)
+            else:
+                errors[step] += 1
+        return response if ok else None
+
+    def flow(i):
+        http = session()
+        image = images[i % len(images)]
+        uploaded = timed('upload', lambda: http.post(
+            f"{base_url}/api/image/upload",
+            files={'image': ('bench.jpg', image, 'image/jpeg')}
+        ))
+        if uploaded is None:
+            return
+        file_id = uploaded.json()['file_id']
+        detected = timed('detect', lambda: http.post(
+            f"{base_url}/api/image/detect-people", json={'file_id': file_id}
+        ))
+        if detected is None:
+            return
+        people = detected.json()['people']
+        timed('remove', lambda: http.post(f"{base_url}/api/image/remove-people", json={
+            'file_id': file_id,
+            'selected_people': [person['id'] for person in people[:1]] or [1],
+            'quality_mode': quality_mode
+        }))
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(flow, range(total)))
+    wall = time.perf_counter() - start
+
+    report = {'wall_seconds': wall, 'flows_per_second': total / wall if wall else 0.0, 'steps': {}}
+    for step in STEPS:
+        values = sorted(samples[step])
+        report['steps'][step] = {
+            'count': len(values),
+            'errors': errors[step],
+            'requests_per_second': len(values) / wall if wall else 0.0,
+            'p50_ms': _percentile(values, 50),
+            'p95_ms': _percentile(values, 95),
+            'p99_ms': _percentile(values, 99)
+        }
+    return report
+
+
+def _percentile(sorted_values, pct):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, int(round(pct / 100.0 * (len(sorted_values) - 1))))
+    return sorted_values[index] * 1000
+
+
+def compare_to_baseline(report, baseline, tolerance):
+    """Return a list of human-readable regressions against a baseline report"""
+    regressions = []
+    for step in STEPS:
+        current, previous = report['steps'].get(step), baseline.get('steps', {}).get(step)
+        if not current or not previous:
+            continue
+        if previous.get('p95_ms') and current.get('p95_ms') is not None:
+            if current['p95_ms'] > previous['p95_ms'] * (1 + tolerance):
+                regressions.append(f"{step} p95 {current['p95_ms']:.1f}ms > baseline {previous['p95_ms']:.1f}ms")
+        if previous.get('requests_per_second'):
+            if current['requests_per_second'] < previous['requests_per_second'] * (1 - tolerance):
+                regressions.append(
+                    f"{step} throughput {current['requests_per_second']:.2f}/s < "
+                    f"baseline {previous['requests_per_second']:.2f}/s"
+                )
+    if baseline.get('peak_rss_mb') and report['peak_rss_mb'] > baseline['peak_rss_mb'] * (1 + tolerance):
+        regressions.append(f"peak RSS {report['peak_rss_mb']:.0f}MB > baseline {baseline['peak_rss_mb']:.0f}MB")
+    return regressions
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--project-root', default='.', help='directory containing the src package')
+    parser.add_argument('--server', default='flask', choices=['flask', 'asgi'], help='serving mode to benchmark')
+    parser.add_argument('--requests', type=int, default=100, help='number of upload->detect->remove flows')
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--image-size', default='1920x1080', help='WIDTHxHEIGHT of generated uploads')
+    parser.add_argument('--distinct-images', type=int, default=10, help='distinct images to cycle through')
+    parser.add_argument('--quality-mode', default='fast', choices=['fast', 'quality'])
+    parser.add_argument('--detect-latency-ms', type=float, default=300)
+    parser.add_argument('--cleanup-latency-ms', type=float, default=1500)
+    parser.add_argument('--segment-latency-ms', type=float, default=800)
+    parser.add_argument('--latency-sigma', type=float, default=0.3, help='lognormal spread of vendor latency')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='fraction of vendor calls returning 503')
+    parser.add_argument('--seed', type=int, default=1234)
+    parser.add_argument('--output', help='write the JSON report here (default: stdout)')
+    parser.add_argument('--baseline', help='JSON report to compare against')
+    parser.add_argument('--tolerance', type=float, default=0.15, help='allowed relative regression')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    random.seed(args.seed)
+    width, height = (int(v) for v in args.image_size.lower().split('x'))
+
+    profiles = {
+        'roboflow': VendorProfile(args.detect_latency_ms, args.latency_sigma, args.error_rate),
+        'clipdrop': VendorProfile(args.cleanup_latency_ms, args.latency_sigma, args.error_rate),
+        'segmind': VendorProfile(args.segment_latency_ms, args.latency_sigma, args.error_rate)
+    }
+    servers, vendor_urls = [], {}
+    for kind, profile in profiles.items():
+        server, url = start_fake_vendor(kind, profile)
+        servers.append(server)
+        vendor_urls[kind] = url
+
+    port = _free_port()
+    app = start_app(args.project_root, port, vendor_urls, server=args.server)
+    base_url = f"http://127.0.0.1:{port}"
+    try:
+        wait_ready(base_url)
+        images = [make_image(width, height, args.seed + i) for i in range(args.distinct_images)]
+        report = run_workload(base_url, args.requests, args.concurrency, images, args.quality_mode)
+    finally:
+        app.terminate()
+        app.wait(timeout=30)
+        for server in servers:
+            server.shutdown()
+
+    # ru_maxrss of reaped children is the app's peak RSS (kilobytes on Linux)
+    report['peak_rss_mb'] = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024.0
+    report['config'] = {key: value for key, value in vars(args).items() if key not in ('output', 'baseline')}
+
+    output = json.dumps(report, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+    else:
+        print(output)
+
+    if args.baseline:
+        with open(args.baseline, 'r') as f:
+            regressions = compare_to_baseline(report, json.load(f), args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION: {regression}", file=sys.stderr)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
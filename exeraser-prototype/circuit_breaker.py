@@ -0,0 +1,116 @@
+import threading
+import time
+from collections import deque
+
+
+class VendorUnavailableError(Exception):
+    """An AI vendor could not serve the request and no fallback applied"""
+
+    def __init__(self, message, retry_after=None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class CircuitOpenError(VendorUnavailableError):
+    """Raised instead of calling a vendor whose circuit is open"""
+
+
+class CircuitBreaker:
+    """Per-vendor circuit breaker tripping on error rate or slow-call rate
+
+    closed: calls flow and outcomes are tracked over a rolling window.
+    open: calls fail fast for open_seconds.
+    half_open: up to half_open_calls probes are let through; a success closes
+    the circuit again, a failure re-opens it.
+
+    Every state change starts a new generation. before_call() returns the
+    current one and record() ignores calls started in an earlier generation,
+    so a request that was already in flight when the circuit tripped cannot
+    close or re-open it later in place of the probe.
+    """
+
+    def __init__(self, name, error_rate=0.5, slow_call_rate=0.5, slow_call_seconds=None,
+                 window=20, min_calls=10, open_seconds=30, half_open_calls=1):
+        self.name = name
+        self.error_rate = error_rate
+        self.slow_call_rate = slow_call_rate
+        self.slow_call_seconds = slow_call_seconds
+        self.min_calls = min_calls
+        self.open_seconds = open_seconds
+        self.half_open_calls = half_open_calls
+        self.state = 'closed'
+        self._outcomes = deque(maxlen=window)
+        self._opened_at = 0.0
+        self._probes = 0
+        self._generation = 0
+        self._lock = threading.Lock()
+        self.rejected = 0
+        self.opened = 0
+
+    def before_call(self):
+        """Raise CircuitOpenError unless a call may be made now, else return its generation"""
+        with self._lock:
+            if self.state == 'open':
+                remaining = self._opened_at + self.open_seconds - time.monotonic()
+                if remaining > 0:
+                    self.rejected += 1
+                    raise CircuitOpenError(f"{self.name} circuit is open", retry_after=remaining)
+                self.state = 'half_open'
+                self._probes = 0
+                self._generation += 1
+            if self.state == 'half_open':
+                if self._probes >= self.half_open_calls:
+                    self.rejected += 1
+                    raise CircuitOpenError(f"{self.name} circuit is half-open", retry_after=1)
+                self._probes += 1
+            return self._generation
+
+    def record(self, failed, elapsed, generation):
+        """Record the outcome of a call, given the generation before_call() returned"""
+        slow = self.slow_call_seconds is not None and elapsed >= self.slow_call_seconds
+        with self._lock:
+            if generation != self._generation:
+                return
+            if self.state == 'half_open':
+                if failed or slow:
+                    self._trip()
+                else:
+                    self.state = 'closed'
+                    self._outcomes.clear()
+                    self._generation += 1
+                return
+            self._outcomes.append((failed, slow))
+            if self.state == 'closed' and len(self._outcomes) >= self.min_calls:
+                count = len(self._outcomes)
+                errors = sum(1 for failed_call, _ in self._outcomes if failed_call)
+                slow_calls = sum(1 for _, slow_call in self._outcomes if slow_call)
+                if errors / count >= self.error_rate or slow_calls / count >= self.slow_call_rate:
+                    self._trip()
+
+    def cancel_call(self, generation):
+        """Forget a call that was abandoned before it finished"""
+        with self._lock:
+            if generation == self._generation and self.state == 'half_open' and self._probes > 0:
+                self._probes -= 1
+
+    def _trip(self):
+        self.state = 'open'
+        self._opened_at = time.monotonic()
+        self._outcomes.clear()
+        self._generation += 1
+        self.opened += 1
+
+    def retry_after(self):
+        """Seconds until the circuit lets a probe through (0 when closed)"""
+        with self._lock:
+            if self.state != 'open':
+                return 0
+            return max(0.0, self._opened_at + self.open_seconds - time.monotonic())
+
+    def stats(self):
+        with self._lock:
+            return {
+                'state': self.state,
+                'opened': self.opened,
+                'rejected': self.rejected
+            }
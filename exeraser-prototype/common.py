@@ -0,0 +1,392 @@
+import os
+import math
+import base64
+import json
+import uuid
+from src.services.ai_services import create_ai_services
+from src.services.vendor_transport import transport_stats
+from src.services.metrics import span
+from src.services.jobs import create_job_queue
+from src.services.detection_cache import DetectionCache
+from src.services.detection_sessions import DetectionSessions
+from src.services.result_cache import ResultCache
+from src.services.content_hash import HashingReader, file_content_hash, remember_content_hash
+from src.services.image_metadata import image_dimensions, write_metadata
+from src.services.segment_masks import SegmentCache, segment_matches, split_person_masks
+from src.services.cpu_pool import cpu_pool
+from src.services.derivatives import derivative_path, within_size
+from src.services.startup import LazyModule, startup_stats
+from src.services.circuit_breaker import VendorUnavailableError
+from src.services.admission import OverloadedError, admission_stats
+
+Image = LazyModule('PIL.Image')
+
+# State and helpers shared by the WSGI (image.py) and ASGI (image_async.py) image
+# routes, so both serving modes hit the same caches, backends and job queue.
+# Helpers that build a response take the framework's jsonify.
+
+# Detection results keyed by image content, persisted across restarts under
+# <app>/uploads/detection_cache (or DETECTION_CACHE_DIR; 'off' keeps them in
+# memory only), up to DETECTION_CACHE_DISK_SIZE entries on disk
+DETECTION_CACHE_DIR = os.getenv('DETECTION_CACHE_DIR', '')
+detection_cache = DetectionCache(
+    max_entries=int(os.getenv('DETECTION_CACHE_SIZE', '1024')),
+    ttl=int(os.getenv('DETECTION_CACHE_TTL', str(24 * 3600))),
+    disk_dir=DETECTION_CACHE_DIR if DETECTION_CACHE_DIR not in ('', 'off') else None,
+    max_disk_entries=int(os.getenv('DETECTION_CACHE_DISK_SIZE', '100000'))
+)
+
+def enable_detection_disk_cache(state):
+    """Blueprint setup hook: put the detection disk tier under the app's uploads by default"""
+    if DETECTION_CACHE_DIR != 'off':
+        detection_cache.set_disk_dir(os.path.join(state.app.root_path, 'uploads', 'detection_cache'))
+
+# Latest detections per file_id, so removal requests send only the selected ids
+detection_sessions = DetectionSessions(
+    max_entries=int(os.getenv('DETECTION_SESSION_SIZE', '4096')),
+    ttl=int(os.getenv('DETECTION_SESSION_TTL', str(24 * 3600)))
+)
+
+# Removal results keyed by (image, mask, quality mode), pointing at *_result.jpg files
+result_cache = ResultCache(
+    max_entries=int(os.getenv('RESULT_CACHE_SIZE', '512')),
+    validate=lambda entry: entry['storage'].lookup(entry['result_key']) is not None
+)
+
+# Per-person segmentation masks (bit-packed) keyed by image content; filled by
+# /detect-people when segmentation is requested or DETECTION_SEGMENTATION=1
+segment_cache = SegmentCache(max_entries=int(os.getenv('SEGMENT_CACHE_SIZE', '256')))
+DETECTION_SEGMENTATION = os.getenv('DETECTION_SEGMENTATION', '0') == '1'
+
+# AI service clients, each constructed by the first request that uses it
+ai_services = create_ai_services(detection_cache=detection_cache)
+
+# Inpainting backends: default, override for 'fast' requests, and fallback when
+# the chosen backend is unavailable (set INPAINT_FALLBACK=none to disable)
+INPAINT_BACKEND = os.getenv('INPAINT_BACKEND', 'clipdrop')
+INPAINT_FAST_BACKEND = os.getenv('INPAINT_FAST_BACKEND')
+INPAINT_FALLBACK = os.getenv('INPAINT_FALLBACK', 'local')
+
+# Uploads and results are immutable under their uuid, so clients may cache them
+IMAGE_MAX_AGE = 24 * 3600
+# Size-specific URLs are only handed out by the API, so they may be cached for good
+DERIVATIVE_MAX_AGE = 365 * 24 * 3600
+
+EXIF_ORIENTATION = 0x0112
+
+# Background workers for removal jobs
+removal_jobs = create_job_queue('removal')
+
+# Progressive removal streams a local fill at this size before the full result
+PREVIEW_MAX_SIDE = int(os.getenv('PREVIEW_MAX_SIDE', '512'))
+
+DETECTION_BATCH_LIMIT = int(os.getenv('DETECTION_BATCH_LIMIT', '500'))
+
+# Proxies must not buffer the stream or the preview arrives with the result
+SSE_HEADERS = {'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+
+def sse_event(event, payload):
+    return f"event: {event}\ndata: {json.dumps(payload)}\n\n"
+
+def retry_after_seconds(error):
+    """Whole seconds a client should wait after a VendorUnavailableError"""
+    return max(1, math.ceil(error.retry_after or 5))
+
+def unavailable_response(jsonify, error):
+    """503 for a vendor outage with no usable fallback, telling clients when to retry"""
+    response = jsonify({'error': str(error)})
+    response.headers['Retry-After'] = str(retry_after_seconds(error))
+    return response, 503
+
+def queue_full_response(jsonify):
+    """503 when the removal job queue is full"""
+    response = jsonify({'error': 'Too many removal jobs queued, try again shortly'})
+    response.headers['Retry-After'] = '5'
+    return response, 503
+
+def is_storable_as_is(image):
+    """Whether uploaded bytes can be stored without re-encoding"""
+    if image.format != 'JPEG' or image.mode != 'RGB':
+        return False
+    # Re-encoding drops EXIF, so rotated JPEGs must go through PIL to stay consistent
+    return image.getexif().get(EXIF_ORIENTATION, 1) == 1
+
+def store_upload(storage, file_id, stream):
+    """Store an uploaded image stream as JPEG and return (response, stored entry)
+
+    Upright RGB JPEGs are copied into storage chunk by chunk and hashed on the
+    way, so memory stays flat whatever the upload size; anything else is
+    decoded and re-encoded exactly once.
+    """
+    # Only the header is parsed here: format, dimensions and EXIF orientation
+    with span('header_sniff'):
+        image = Image.open(stream)
+        width, height = image.size
+        original_format = image.format
+        storable = is_storable_as_is(image)
+
+    key = f"{file_id}.jpg"
+    if storable:
+        stream.seek(0)
+        reader = HashingReader(stream)
+        with span('disk_write'):
+            stored = storage.save_stream(key, reader, 'image/jpeg', alias=file_id)
+        digest = reader.hexdigest()
+    else:
+        # Decode, encode and hash run in a CPU worker process for large images
+        with span('reencode'):
+            image_data, digest = cpu_pool.reencode_jpeg(stream, width, height, quality=95)
+        with span('disk_write'):
+            stored = storage.save_bytes(key, image_data, 'image/jpeg', alias=file_id)
+
+    # Later stages read the hash and dimensions from here instead of the image
+    remember_content_hash(stored['path'], digest)
+    write_metadata(stored['path'], {
+        'width': width,
+        'height': height,
+        'format': 'JPEG',
+        'original_format': original_format,
+        'bytes': stored['size'],
+        'sha256': digest
+    })
+
+    # Thumbnail and preview for the editor, from one reduced-size decode
+    make_derivatives(storage, stored, width, height)
+
+    response = {
+        'success': True,
+        'file_id': file_id,
+        'image_url': f"/api/image/images/{file_id}",
+        'thumbnail_url': f"/api/image/images/{file_id}/thumb",
+        'preview_url': f"/api/image/images/{file_id}/preview",
+        'width': width,
+        'height': height,
+        'message': 'Image uploaded successfully'
+    }
+    return response, stored
+
+def image_data_uri(storage, key):
+    """Legacy base64 data URI of a stored JPEG"""
+    with span('base64'):
+        image_base64 = cpu_pool.b64encode_file(storage.local_path(key)).decode('ascii')
+    return f"data:image/jpeg;base64,{image_base64}"
+
+def cut_segments(image_path, mask, people):
+    """Split a whole-image person mask into per-person segments"""
+    width, height = image_dimensions(image_path)
+    with span('segment_split'):
+        return split_person_masks(mask, people, width, height)
+
+def mark_segmented(people, segments):
+    for person in people:
+        segment = segments.get(person['id'])
+        person['segmented'] = segment is not None and segment_matches(segment, person)
+
+def select_processor(backend, quality_mode):
+    """Pick the inpainting backend for a request, or None if the name is unknown"""
+    processors = ai_services['image_processors']
+    if not backend and quality_mode == 'fast':
+        backend = INPAINT_FAST_BACKEND
+    return processors.get(backend or INPAINT_BACKEND)
+
+def run_removal(processor, image_path, storage, people_data, selected_people, quality_mode,
+                inline=False):
+    """Run the removal pipeline and return the response payload"""
+    mask, cache_key = prepare_removal(processor, image_path, people_data, selected_people, quality_mode)
+    return finish_removal(processor, image_path, storage, mask, cache_key, selected_people, quality_mode, inline)
+
+def prepare_removal(processor, image_path, people_data, selected_people, quality_mode):
+    """Render the removal mask and return (mask, result cache key)"""
+    image_hash = file_content_hash(image_path)
+    mask = processor.render_mask(image_path, people_data, selected_people, segment_cache.get(image_hash))
+    cache_key = result_cache.make_key(
+        image_hash, processor.mask_hash(mask), f"{processor.name}:{quality_mode}"
+    )
+    return mask, cache_key
+
+def finish_removal(processor, image_path, storage, mask, cache_key, selected_people, quality_mode,
+                   inline=False):
+    """Inpaint a rendered mask (or reuse its cached result) and return the response payload"""
+    fallback = ai_services['image_processors'].get(INPAINT_FALLBACK)
+
+    def compute():
+        # Use AI service to remove people
+        try:
+            processed_image_data = processor.inpaint(image_path, mask, quality_mode)
+        except OverloadedError:
+            # A saturated backend degrades to the fallback when there is one
+            if fallback is None or fallback is processor:
+                raise
+            processed_image_data = None
+        backend = processor.name
+        cacheable = processed_image_data is not None
+        if not cacheable and fallback is not None and fallback is not processor:
+            # Vendor is down or unconfigured; the fallback result is real but not
+            # memoized so the preferred backend is retried next time
+            processed_image_data = fallback.inpaint(image_path, mask, quality_mode)
+            backend = fallback.name
+        if processed_image_data is None:
+            raise inpainting_unavailable(processor)
+        return store_result(storage, processed_image_data, backend), cacheable
+
+    with span('remove'):
+        entry, source = result_cache.get_or_compute(cache_key, compute)
+
+    return removal_response(entry, source, storage, selected_people, inline)
+
+def render_preview(image_path, mask):
+    """Low-resolution local fill of the removal mask as an event payload, or None"""
+    with span('preview'):
+        preview_data = ai_services['image_processors']['local'].preview(image_path, mask, PREVIEW_MAX_SIDE)
+    if preview_data is None:
+        return None
+    return {
+        'preview': True,
+        'preview_image': f"data:image/jpeg;base64,{base64.b64encode(preview_data).decode('utf-8')}",
+        'backend': 'local'
+    }
+
+def inpainting_unavailable(processor):
+    # Returning the untouched original as a "result" would be fake data, so fail instead
+    return VendorUnavailableError(
+        f"Inpainting backend '{processor.name}' is unavailable and no fallback succeeded",
+        retry_after=processor.retry_after()
+    )
+
+def store_result(storage, processed_image_data, backend):
+    """Save a removal result and return its result cache entry"""
+    # Generate result filename and save
+    result_id = str(uuid.uuid4())
+    result_key = f"{result_id}_result.jpg"
+    with span('disk_write'):
+        stored = storage.save_bytes(result_key, processed_image_data, 'image/jpeg')
+    make_derivatives(storage, stored, *image_dimensions(stored['path']))
+
+    return {
+        'result_id': result_id,
+        'result_key': result_key,
+        'storage': storage,
+        'backend': backend
+    }
+
+def removal_response(entry, source, storage, selected_people, inline=False):
+    """Build the /remove-people response for a result cache entry"""
+    response = {
+        'success': True,
+        'result_id': entry['result_id'],
+        'result_url': f"/api/image/results/{entry['result_id']}",
+        'result_thumbnail_url': f"/api/image/results/{entry['result_id']}/thumb",
+        'result_preview_url': f"/api/image/results/{entry['result_id']}/preview",
+        'removed_people': selected_people,
+        'backend': entry['backend'],
+        'cached': source != 'computed',
+        'message': f'Successfully removed {len(selected_people)} people from the image'
+    }
+
+    if inline:
+        # Legacy clients still expect the result inlined as a data URI
+        response['result_image'] = image_data_uri(storage, entry['result_key'])
+
+    return response
+
+def job_payload(job):
+    """Public view of a removal job"""
+    response = {
+        'job_id': job['job_id'],
+        'status': job['status'],
+        'created_at': job['created_at'],
+        'started_at': job['started_at'],
+        'finished_at': job['finished_at']
+    }
+    if job['status'] == 'completed':
+        response['result'] = job['result']
+    elif job['status'] == 'failed':
+        response['error'] = f"Processing failed: {job['error']}"
+    return response
+
+def sized_image_path(storage, key, size):
+    """Local path of a stored image at one of the SIZES, or None if the image is gone"""
+    image_path = storage.local_path(key)
+    if image_path is None or size == 'full':
+        return image_path
+    # Small images are their own thumbnail and preview; no file is written for them
+    if within_size(*image_dimensions(image_path), size):
+        return image_path
+    path = derivative_path(image_path, size)
+    if os.path.exists(path):
+        return path
+    # Not made yet, or dropped with a local cache copy (S3 only keeps originals)
+    with span('derivatives'):
+        paths = cpu_pool.derivatives(image_path, *image_dimensions(image_path))
+    storage.refresh(key)
+    return paths[size]
+
+def make_derivatives(storage, stored, width, height):
+    """Best-effort derivatives for a newly stored image; a failure leaves them to sized_image_path"""
+    try:
+        with span('derivatives'):
+            cpu_pool.derivatives(stored['path'], width, height)
+    except Exception as e:
+        print(f"Derivative generation error: {e}")
+    # The quota counts the metadata and derivatives written beside the image
+    storage.refresh(stored['key'])
+
+def _vendor_status(provider, vendor, transports):
+    """Live health and latency percentiles for one AI vendor, without creating its client"""
+    # Clients read their key from <VENDOR>_API_KEY, so /status can tell without building one
+    configured = bool(os.getenv(f'{vendor.upper()}_API_KEY'))
+    status = {'provider': provider, 'configured': configured, 'loaded': vendor in transports}
+    status.update(transports.get(vendor, {'health': 'not_loaded'}))
+    if not configured:
+        status['health'] = 'unconfigured'
+    return status
+
+def _loaded_status(name, describe):
+    """describe(service) for a service already in use, or a not-loaded marker"""
+    service = ai_services.peek(name)
+    if service is None:
+        return {'loaded': False}
+    return describe(service)
+
+def status_payload(storage):
+    """Service health, vendor latency and cache/storage counters"""
+    # Services not used yet are reported as not loaded; building them here
+    # would do the imports and setup that startup defers
+    transports = transport_stats()
+    vendors = {
+        'person_detection': _vendor_status('Roboflow People Detection API', 'roboflow', transports),
+        'image_processing': _vendor_status('ClipDrop Cleanup API', 'clipdrop', transports),
+        'mask_generation': _vendor_status('Segmind Automatic Mask Generator', 'segmind', transports)
+    }
+    degraded = any(vendor['health'] in ('degraded', 'down') for vendor in vendors.values())
+
+    return {
+        'status': 'degraded' if degraded else 'healthy',
+        'service': 'Exerase Image Processing API',
+        'version': '1.0.0',
+        'ai_services': vendors,
+        'local_detector': _loaded_status('person_detectors', lambda detectors: detectors['local'].stats()),
+        'inpainting_backends': _loaded_status('image_processors', lambda processors: {
+            name: {'available': backend.available}
+            for name, backend in processors.items()
+        }),
+        'removal_jobs': removal_jobs.metrics(),
+        'detection_cache': detection_cache.stats(),
+        'detection_sessions': detection_sessions.stats(),
+        'result_cache': result_cache.stats(),
+        'segment_cache': segment_cache.stats(),
+        'admission': admission_stats(),
+        'cpu_pool': cpu_pool.stats(),
+        'startup': dict(startup_stats(), services_built=ai_services.built()),
+        'storage': storage.stats(),
+        'endpoints': {
+            'upload': '/api/image/upload',
+            'detect': '/api/image/detect-people',
+            'detect_batch': '/api/image/detect-people/batch',
+            'remove': '/api/image/remove-people',
+            'download': '/api/image/download/<result_id>',
+            'image': '/api/image/images/<file_id>',
+            'result': '/api/image/results/<result_id>',
+            'jobs': '/api/image/jobs/<job_id>'
+        }
+    }
@@ -0,0 +1,63 @@
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+
+_path_hashes = OrderedDict()
+_path_hashes_lock = threading.Lock()
+MAX_REMEMBERED_PATHS = 4096
+
+
+def hash_file(path, chunk_size=1024 * 1024):
+    """Return the SHA-256 hex digest of a file, read in chunks"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class HashingReader:
+    """File-like wrapper hashing everything read through it, for single-pass uploads"""
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.digest = hashlib.sha256()
+        self.size = 0
+
+    def read(self, size=-1):
+        chunk = self.stream.read(size)
+        self.digest.update(chunk)
+        self.size += len(chunk)
+        return chunk
+
+    def hexdigest(self):
+        return self.digest.hexdigest()
+
+
+def remember_content_hash(path, digest):
+    """Record a hash computed while the file was written so it is never re-read"""
+    st = os.stat(path)
+    _remember(path, (st.st_mtime_ns, st.st_size), digest)
+
+
+def file_content_hash(path):
+    """Return the content hash of a file, remembered while the file is unchanged"""
+    st = os.stat(path)
+    signature = (st.st_mtime_ns, st.st_size)
+    with _path_hashes_lock:
+        cached = _path_hashes.get(path)
+    if cached and cached[0] == signature:
+        return cached[1]
+
+    digest = hash_file(path)
+    _remember(path, signature, digest)
+    return digest
+
+
+def _remember(path, signature, digest):
+    with _path_hashes_lock:
+        _path_hashes[path] = (signature, digest)
+        _path_hashes.move_to_end(path)
+        while len(_path_hashes) > MAX_REMEMBERED_PATHS:
+            _path_hashes.popitem(last=False)
@@ -0,0 +1,303 @@
+import base64
+import hashlib
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import contextmanager
+from io import BytesIO
+from multiprocessing import shared_memory
+
+from src.services.derivatives import make_derivatives
+from src.services.local_inpaint import inpaint_array
+from src.services.mask_engine import build_mask
+from src.services.metrics import record_cpu_task
+from src.services.region_inpaint import encode_jpeg
+from src.services.segment_masks import unpack_segment
+from src.services.startup import LazyModule
+
+np = LazyModule('numpy')
+Image = LazyModule('PIL.Image')
+
+# Work on fewer pixels than this stays on the calling thread, where it is
+# cheaper than the round trip to a worker
+INLINE_BELOW = 256 * 1024
+# Same for base64: files smaller than this many bytes are encoded inline
+INLINE_BYTES_BELOW = 1024 * 1024
+# Headroom over the raw pixel size for JPEG output buffers
+JPEG_SLACK = 64 * 1024
+READ_CHUNK = 1024 * 1024
+
+
+def _warm_worker():
+    # Process initializer: pay for imports, codec registration and the first
+    # encode once per worker instead of on a request
+    Image.init()
+    buffer = BytesIO()
+    Image.fromarray(np.zeros((16, 16, 3), dtype=np.uint8)).save(buffer, format='JPEG')
+    inpaint_array(np.zeros((16, 16, 3), dtype=np.uint8), np.zeros((16, 16), dtype=np.uint8))
+
+
+def _ready():
+    return os.getpid()
+
+
+def _call(func, args):
+    # Runs in the worker; the run time lets the parent split queueing from work
+    start = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - start
+
+
+@contextmanager
+def _attached(name):
+    block = shared_memory.SharedMemory(name=name)
+    try:
+        yield block
+    finally:
+        block.close()
+
+
+@contextmanager
+def _shared(size):
+    # Parent-owned block: created per task and unlinked when it is done
+    block = shared_memory.SharedMemory(create=True, size=max(1, size))
+    try:
+        yield block
+    finally:
+        block.close()
+        block.unlink()
+
+
+def _write(out, capacity, data):
+    # Returns the byte count written to the output block, or the bytes
+    # themselves in the rare case they outgrew it
+    if out is None or len(data) > capacity:
+        return data
+    with _attached(out) as block:
+        block.buf[:len(data)] = data
+    return len(data)
+
+
+def _read(block, result):
+    if isinstance(result, int):
+        return bytes(block.buf[:result])
+    return result
+
+
+# Task bodies; each runs in a worker or, for small inputs, on the caller
+
+def _reencode_jpeg(data, quality):
+    with Image.open(BytesIO(data)) as image:
+        if image.mode != 'RGB':
+            image = image.convert('RGB')
+        else:
+            image.load()
+        encoded = encode_jpeg(image, quality=quality)
+    return encoded, hashlib.sha256(encoded).hexdigest()
+
+
+def _reencode_task(source, length, out, capacity, quality):
+    with _attached(source) as block:
+        data = bytes(block.buf[:length])
+    encoded, digest = _reencode_jpeg(data, quality)
+    return _write(out, capacity, encoded), digest
+
+
+def _mask_task(width, height, boxes, polygons, segments, dilate, feather, out):
+    mask = build_mask(
+        width, height, boxes=boxes, polygons=polygons,
+        segments=[unpack_segment(segment) for segment in segments],
+        dilate=dilate, feather=feather
+    )
+    if out is None:
+        return mask
+    with _attached(out) as block:
+        target = np.ndarray((height, width), dtype=np.uint8, buffer=block.buf)
+        target[...] = mask
+        del target
+    return None
+
+
+def _inpaint_jpeg(image_path, mask, method, radius, quality):
+    with Image.open(image_path) as img:
+        image = np.asarray(img.convert('RGB'))
+    result = inpaint_array(image, mask, method=method, radius=radius)
+    return encode_jpeg(Image.fromarray(result), quality=quality)
+
+
+def _inpaint_task(image_path, mask_name, shape, method, radius, quality, out, capacity):
+    with _attached(mask_name) as block:
+        mask = np.ndarray(shape, dtype=np.uint8, buffer=block.buf)
+        try:
+            encoded = _inpaint_jpeg(image_path, mask, method, radius, quality)
+        finally:
+            del mask
+    return _write(out, capacity, encoded)
+
+
+def _b64encode_file(path, out=None, capacity=0):
+    with open(path, 'rb') as f:
+        encoded = base64.b64encode(f.read())
+    return _write(out, capacity, encoded)
+
+
+class CpuPool:
+    """Worker processes for CPU-bound image stages, exchanging pixels through shared memory
+
+    Decoding, encoding, mask rendering and base64 hold the GIL (or most of
+    it), so on threads they serialize across requests. Here they run in
+    separate processes. Inputs and outputs travel through parent-owned
+    shared_memory blocks, so only block names and sizes are pickled. Workers
+    import PIL, NumPy and the inpainting code when they start, and warm()
+    starts all of them before the first request. With no workers, inside a
+    worker, or for small images, tasks run on the calling thread.
+    """
+
+    def __init__(self, workers):
+        self.workers = max(0, int(workers))
+        self._executor = None
+        self._lock = threading.Lock()
+        self._tasks = {}
+        self.restarts = 0
+
+    @property
+    def enabled(self):
+        # Workers re-import the app's main module, which must not start pools of its own
+        return self.workers > 0 and multiprocessing.parent_process() is None
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                # Forking a threaded server is unsafe; forkserver workers start clean
+                methods = multiprocessing.get_all_start_methods()
+                context = multiprocessing.get_context('forkserver' if 'forkserver' in methods else 'spawn')
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers, mp_context=context, initializer=_warm_worker
+                )
+            return self._executor
+
+    def warm(self):
+        """Start every worker now rather than on the first requests (does not wait)"""
+        if not self.enabled:
+            return
+        executor = self._get_executor()
+        for _ in range(self.workers):
+            executor.submit(_ready)
+
+    def offload(self, pixels):
+        """Whether work over this many pixels should go to a worker"""
+        return self.enabled and pixels >= INLINE_BELOW
+
+    def run(self, task, func, *args):
+        """Run func(*args) in a worker, recording queue and run time under task"""
+        start = time.perf_counter()
+        executor = self._get_executor()
+        try:
+            result, run_seconds = executor.submit(_call, func, args).result()
+        except BrokenProcessPool as e:
+            # A worker died (e.g. killed for memory); replace the pool and do this task here
+            print(f"CPU pool error: {e}")
+            self._reset(executor)
+            result, run_seconds = _call(func, args)
+        self._record(task, run_seconds, time.perf_counter() - start - run_seconds)
+        return result
+
+    def _reset(self, executor):
+        with self._lock:
+            if self._executor is executor:
+                self._executor = None
+                self.restarts += 1
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    def _record(self, task, run_seconds, wait_seconds):
+        record_cpu_task(task, run_seconds, wait_seconds)
+        with self._lock:
+            totals = self._tasks.setdefault(task, [0, 0.0, 0.0])
+            totals[0] += 1
+            totals[1] += run_seconds
+            totals[2] += wait_seconds
+
+    def reencode_jpeg(self, stream, width, height, quality=95):
+        """Decode an image stream and re-encode it as RGB JPEG, returning (bytes, sha256)"""
+        stream.seek(0)
+        if not self.offload(width * height):
+            return _reencode_jpeg(stream.read(), quality)
+        length = stream.seek(0, os.SEEK_END)
+        stream.seek(0)
+        capacity = width * height * 3 + JPEG_SLACK
+        with _shared(length) as source, _shared(capacity) as out:
+            position = 0
+            for chunk in iter(lambda: stream.read(READ_CHUNK), b''):
+                source.buf[position:position + len(chunk)] = chunk
+                position += len(chunk)
+            result, digest = self.run(
+                'reencode', _reencode_task, source.name, position, out.name, capacity, quality
+            )
+            return _read(out, result), digest
+
+    def render_mask(self, width, height, boxes=None, polygons=None, segments=None, dilate=0, feather=0):
+        """build_mask with bit-packed segments, returning a (height, width) uint8 array"""
+        args = (width, height, boxes, polygons, segments or [], dilate, feather)
+        # Box-only masks are a few memsets, cheaper than any hand-off
+        if not (polygons or segments or feather) or not self.offload(width * height):
+            return _mask_task(*args, None)
+        with _shared(width * height) as out:
+            self.run('mask', _mask_task, *args, out.name)
+            return np.ndarray((height, width), dtype=np.uint8, buffer=out.buf).copy()
+
+    def inpaint_jpeg(self, image_path, mask, method='telea', radius=5, quality=95):
+        """Decode image_path, fill the masked pixels and return JPEG bytes"""
+        height, width = mask.shape
+        if not self.offload(width * height):
+            return _inpaint_jpeg(image_path, mask, method, radius, quality)
+        capacity = width * height * 3 + JPEG_SLACK
+        with _shared(mask.nbytes) as source, _shared(capacity) as out:
+            np.ndarray(mask.shape, dtype=np.uint8, buffer=source.buf)[...] = mask
+            result = self.run(
+                'inpaint', _inpaint_task, image_path, source.name, mask.shape, method, radius,
+                quality, out.name, capacity
+            )
+            return _read(out, result)
+
+    def b64encode_file(self, path):
+        """Base64 of a file's contents as ASCII bytes"""
+        size = os.path.getsize(path)
+        if not (self.enabled and size >= INLINE_BYTES_BELOW):
+            return _b64encode_file(path)
+        capacity = 4 * ((size + 2) // 3)
+        with _shared(capacity) as out:
+            result = self.run('base64', _b64encode_file, path, out.name, capacity)
+            return _read(out, result)
+
+    def derivatives(self, image_path, width, height):
+        """make_derivatives for a stored image, in a worker when it is large"""
+        if not self.offload(width * height):
+            return make_derivatives(image_path)
+        return self.run('derivatives', make_derivatives, image_path)
+
+    def stats(self):
+        with self._lock:
+            tasks = {
+                task: {
+                    'count': count,
+                    'avg_run_ms': run / count * 1000,
+                    'avg_wait_ms': wait / count * 1000
+                }
+                for task, (count, run, wait) in self._tasks.items()
+            }
+        return {'workers': self.workers if self.enabled else 0, 'restarts': self.restarts, 'tasks': tasks}
+
+
+def _default_workers():
+    # Each web process (WEB_WORKERS) starts its own pool, so they split the cores;
+    # with a single core per process there is nothing to run in parallel with
+    web_workers = max(1, int(os.getenv('WEB_WORKERS', '1')))
+    workers = (os.cpu_count() or 1) // web_workers
+    return workers if workers > 1 else 0
+
+
+# CPU_WORKERS=0 keeps every stage on the request threads
+cpu_pool = CpuPool(int(os.getenv('CPU_WORKERS') or _default_workers()))
@@ -0,0 +1,64 @@
+import os
+import threading
+
+from src.services.startup import LazyModule
+from src.services.vendor_payload import fit_size
+
+Image = LazyModule('PIL.Image')
+
+
+# Screen-size renditions kept next to each stored image: name -> (longest side, JPEG quality)
+DERIVATIVES = {
+    'thumb': (int(os.getenv('DERIVATIVE_THUMB_SIZE', '320')), 80),
+    'preview': (int(os.getenv('DERIVATIVE_PREVIEW_SIZE', '1600')), 85)
+}
+SIZES = tuple(DERIVATIVES) + ('full',)
+
+
+def derivative_path(image_path, name):
+    """Path of a derivative, stored as <stem>.<name>.jpg beside the image"""
+    return f"{os.path.splitext(image_path)[0]}.{name}.jpg"
+
+
+def within_size(width, height, name):
+    """Whether an image is already no larger than a derivative, which is then the image itself"""
+    return max(width, height) <= DERIVATIVES[name][0]
+
+
+def make_derivatives(image_path):
+    """Write every derivative of a JPEG from a single decode, returning {name: path}
+
+    The decode uses libjpeg's DCT scaling (draft) to land just above the
+    largest derivative, and each smaller one is resized from the previous
+    rather than from the original. Images already within a derivative's size
+    map to the original path instead of getting a copy.
+    """
+    paths = {}
+    pending = sorted(DERIVATIVES.items(), key=lambda item: -item[1][0])
+    with Image.open(image_path) as img:
+        original_size = img.size
+        targets = [(name, fit_size(original_size, max_side), quality) for name, (max_side, quality) in pending]
+        resized = [(name, target, quality) for name, target, quality in targets if target != original_size]
+        for name, target, _ in targets:
+            if target == original_size:
+                paths[name] = image_path
+        if not resized:
+            return paths
+        if img.format == 'JPEG':
+            img.draft('RGB', resized[0][1])
+        image = img.convert('RGB')
+
+    for name, target, quality in resized:
+        if image.size != target:
+            image = image.resize(target, Image.LANCZOS, reducing_gap=2.0)
+        path = derivative_path(image_path, name)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            image.save(tmp_path, format='JPEG', quality=quality, progressive=True)
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        paths[name] = path
+    return paths
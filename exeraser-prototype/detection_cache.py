@@ -0,0 +1,226 @@
+import contextvars
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from src.services.content_hash import file_content_hash
+
+
+# The lookups made on behalf of the current request, when it is tracking them
+_trace = contextvars.ContextVar('detection_cache_trace', default=None)
+
+
+def _note(outcome):
+    trace = _trace.get()
+    if trace is not None:
+        trace[outcome] += 1
+
+
+class DetectionCache:
+    """Content-addressed detection cache with an LRU memory tier and optional disk tier"""
+
+    def __init__(self, max_entries=1024, ttl=24 * 3600, disk_dir=None, max_disk_entries=100000,
+                 sweep_interval=300):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.disk_dir = disk_dir
+        self.max_disk_entries = max_disk_entries
+        self.sweep_interval = sweep_interval
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.stale_hits = 0
+        self.evictions = 0
+        self.disk_evictions = 0
+        # Disk entries as of the last sweep plus writes since, so the cap is enforced
+        # between sweeps; the first write sweeps (and counts) what an earlier run left
+        self._disk_entries = 0
+        self._last_sweep = 0.0
+        self._sweeping = False
+
+        if self.disk_dir:
+            os.makedirs(self.disk_dir, exist_ok=True)
+
+    def set_disk_dir(self, disk_dir):
+        """Enable the disk tier under disk_dir unless one is already configured"""
+        if self.disk_dir or not disk_dir:
+            return
+        os.makedirs(disk_dir, exist_ok=True)
+        self.disk_dir = disk_dir
+
+    @staticmethod
+    @contextmanager
+    def track():
+        """Record the cache lookups made inside the block, for reporting one request's outcome"""
+        trace = {'hit': 0, 'miss': 0, 'stale': 0}
+        token = _trace.set(trace)
+        try:
+            yield trace
+        finally:
+            _trace.reset(token)
+
+    @staticmethod
+    def outcome(trace):
+        """'hit', 'stale' or 'miss' for a trace from track()"""
+        if trace['stale']:
+            return 'stale'
+        if trace['hit'] and not trace['miss']:
+            return 'hit'
+        return 'miss'
+
+    def make_key(self, image_path, model_version):
+        """Build the cache key from the image content hash and the model version"""
+        image_hash = file_content_hash(image_path)
+        model_key = hashlib.sha256(model_version.encode('utf-8')).hexdigest()[:16]
+        return f"{image_hash}-{model_key}"
+
+    def get(self, key):
+        """Return cached detections for key, or None on a miss"""
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                stored_at, people = entry
+                if now - stored_at <= self.ttl:
+                    self._entries.move_to_end(key)
+                    self.memory_hits += 1
+                    _note('hit')
+                    return [dict(person) for person in people]
+                # Expired entries stay until evicted so get_stale() can serve them
+
+        entry = self._read_disk(key)
+        if entry is not None and now - entry['stored_at'] <= self.ttl:
+            with self._lock:
+                self._store(key, entry['stored_at'], entry['people'])
+                self.disk_hits += 1
+            _note('hit')
+            return [dict(person) for person in entry['people']]
+
+        with self._lock:
+            self.misses += 1
+        _note('miss')
+        return None
+
+    def get_stale(self, key):
+        """Return detections for key even if expired, for use while the vendor is down"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self.stale_hits += 1
+                _note('stale')
+                return [dict(person) for person in entry[1]]
+        entry = self._read_disk(key)
+        if entry is None:
+            return None
+        with self._lock:
+            self.stale_hits += 1
+        _note('stale')
+        return [dict(person) for person in entry['people']]
+
+    def set(self, key, people):
+        """Store detections for key in every enabled tier"""
+        stored_at = time.time()
+        people = [dict(person) for person in people]
+        with self._lock:
+            self._store(key, stored_at, people)
+        self._write_disk(key, {'stored_at': stored_at, 'people': people})
+
+    def _store(self, key, stored_at, people):
+        self._entries[key] = (stored_at, people)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def _disk_path(self, key):
+        return os.path.join(self.disk_dir, f"{key}.json")
+
+    def _read_disk(self, key):
+        if not self.disk_dir:
+            return None
+        try:
+            with open(self._disk_path(key), 'r') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            print(f"Detection cache read error: {e}")
+            return None
+
+    def _write_disk(self, key, entry):
+        if not self.disk_dir:
+            return
+        path = self._disk_path(key)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_path, 'w') as f:
+                json.dump(entry, f)
+            os.replace(tmp_path, path)
+        except Exception as e:
+            print(f"Detection cache write error: {e}")
+            return
+        with self._lock:
+            self._disk_entries += 1
+            sweep_due = (
+                self._disk_entries > self.max_disk_entries
+                or time.time() - self._last_sweep >= self.sweep_interval
+            )
+        if sweep_due:
+            self.evict_disk()
+
+    def evict_disk(self):
+        """Delete disk entries older than the TTL, then the oldest ones until under max_disk_entries"""
+        with self._lock:
+            if self._sweeping:
+                return
+            self._sweeping = True
+            self._last_sweep = time.time()
+        try:
+            entries = []
+            with os.scandir(self.disk_dir) as scan:
+                for entry in scan:
+                    if entry.name.endswith('.json'):
+                        try:
+                            entries.append((entry.stat().st_mtime, entry.path))
+                        except FileNotFoundError:
+                            pass
+            entries.sort()
+            cutoff = time.time() - self.ttl
+            # Cut back to a little under the cap so the next sweep is not on the next write
+            excess = len(entries) - int(self.max_disk_entries * 0.9)
+            victims = [path for i, (mtime, path) in enumerate(entries) if mtime < cutoff or i < excess]
+            for path in victims:
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+            with self._lock:
+                self._disk_entries = len(entries) - len(victims)
+                self.disk_evictions += len(victims)
+        except Exception as e:
+            print(f"Detection cache sweep error: {e}")
+        finally:
+            with self._lock:
+                self._sweeping = False
+
+    def stats(self):
+        """Return hit/miss counters for the cache"""
+        with self._lock:
+            hits = self.memory_hits + self.disk_hits
+            lookups = hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'memory_hits': self.memory_hits,
+                'disk_hits': self.disk_hits,
+                'misses': self.misses,
+                'stale_hits': self.stale_hits,
+                'evictions': self.evictions,
+                'disk_entries': self._disk_entries if self.disk_dir else 0,
+                'disk_evictions': self.disk_evictions,
+                'hit_rate': (hits / lookups) if lookups else 0.0
+            }
@@ -0,0 +1,99 @@
+import threading
+import time
+from collections import OrderedDict
+
+from src.services.startup import LazyModule
+
+np = LazyModule('numpy')
+
+
+class Detection:
+    """One detected person in the percentage-box format, without a per-instance dict"""
+
+    __slots__ = ('id', 'x', 'y', 'width', 'height', 'confidence', 'segmented', 'polygon')
+
+    def __init__(self, person):
+        self.id = person['id']
+        self.x = float(person['x'])
+        self.y = float(person['y'])
+        self.width = float(person['width'])
+        self.height = float(person['height'])
+        self.confidence = float(person.get('confidence', 0.0))
+        self.segmented = person.get('segmented')
+        polygon = person.get('polygon')
+        self.polygon = np.asarray(polygon, dtype=np.float32).reshape(-1, 2) if polygon else None
+
+    def as_dict(self):
+        person = {
+            'id': self.id,
+            'x': self.x,
+            'y': self.y,
+            'width': self.width,
+            'height': self.height,
+            'confidence': self.confidence
+        }
+        if self.segmented is not None:
+            person['segmented'] = self.segmented
+        if self.polygon is not None:
+            person['polygon'] = self.polygon.tolist()
+        return person
+
+
+class DetectionSessions:
+    """Latest detections per upload, keyed by file_id, so removal requests only name ids
+
+    Each session is an id -> Detection index; sessions are LRU-bounded and
+    expire after ttl seconds.
+    """
+
+    def __init__(self, max_entries=4096, ttl=24 * 3600):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def set(self, file_id, people):
+        """Replace the session for file_id with freshly detected people"""
+        index = {person['id']: Detection(person) for person in people}
+        with self._lock:
+            self._sessions[file_id] = (time.time(), index)
+            self._sessions.move_to_end(file_id)
+            while len(self._sessions) > self.max_entries:
+                self._sessions.popitem(last=False)
+                self.evictions += 1
+
+    def select(self, file_id, ids):
+        """Return (people, unknown ids) for the selected ids, or None without a live session"""
+        with self._lock:
+            entry = self._sessions.get(file_id)
+            if entry is None or time.time() - entry[0] > self.ttl:
+                if entry is not None:
+                    del self._sessions[file_id]
+                self.misses += 1
+                return None
+            self._sessions.move_to_end(file_id)
+            self.hits += 1
+            index = entry[1]
+
+        people = []
+        unknown = []
+        for person_id in ids:
+            detection = index.get(person_id)
+            if detection is None:
+                unknown.append(person_id)
+            else:
+                people.append(detection.as_dict())
+        return people, unknown
+
+    def stats(self):
+        with self._lock:
+            return {
+                'sessions': len(self._sessions),
+                'max_entries': self.max_entries,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions
+            }
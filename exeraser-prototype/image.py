@@ -1,17 +1,55 @@
 import os
-import base64
 import uuid
-import requests
-from io import BytesIO
-from PIL import Image
-from flask import Blueprint, request, jsonify, current_app, send_from_directory
-import time
-from src.services.ai_services import create_ai_services
+from flask import Blueprint, request, jsonify, current_app, send_file, Response, stream_with_context
+import json
+import contextvars
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from src.services.metrics import instrument_blueprint, span
+from src.services.jobs import QueueFullError
+from src.services.content_hash import file_content_hash
+from src.services.storage import get_storage
+from src.services.cpu_pool import cpu_pool
+from src.services.derivatives import SIZES
+from src.services.circuit_breaker import VendorUnavailableError
+from src.services.admission import OverloadedError, admit_blueprint, overloaded_response
+# Caches, backends and job queue are shared with the ASGI routes
+from src.routes.common import (
+    ai_services, detection_cache, detection_sessions, result_cache, segment_cache, removal_jobs,
+    DERIVATIVE_MAX_AGE, DETECTION_BATCH_LIMIT, DETECTION_SEGMENTATION, IMAGE_MAX_AGE, SSE_HEADERS,
+    cut_segments, enable_detection_disk_cache, finish_removal, image_data_uri, job_payload, mark_segmented,
+    prepare_removal, queue_full_response, render_preview, retry_after_seconds, run_removal, select_processor,
+    sized_image_path, sse_event, status_payload, store_upload, unavailable_response
+)
 
-image_bp = Blueprint('image', __name__)
+# Per-client rate limits and priority classes; vendor concurrency budgets live in the transports
+image_bp = admit_blueprint(instrument_blueprint(Blueprint('image', __name__)))
+# Start the CPU worker processes when the app is set up, not on the first upload
+image_bp.record_once(lambda state: cpu_pool.warm())
+image_bp.record_once(enable_detection_disk_cache)
 
-# Initialize AI services
-ai_services = create_ai_services()
+def _storage():
+    """Return the storage backend for this app's uploads"""
+    return get_storage(os.path.join(current_app.root_path, 'uploads'))
+
+def _wants_inline():
+    """Whether the client asked for legacy base64 data URIs in the response"""
+    flag = request.args.get('inline') or request.form.get('inline')
+    if flag is None and request.is_json:
+        flag = (request.get_json(silent=True) or {}).get('inline')
+    return str(flag).lower() in ('1', 'true', 'yes')
+
+# Progressive removal: full-resolution passes run here while the request thread
+# renders and streams a low-resolution local preview
+progressive_executor = ThreadPoolExecutor(
+    max_workers=int(os.getenv('PROGRESSIVE_WORKERS', '8')),
+    thread_name_prefix='progressive'
+)
+
+# Shared fan-out pool for batch detection, bounding vendor concurrency across requests
+detection_executor = ThreadPoolExecutor(
+    max_workers=int(os.getenv('DETECTION_BATCH_CONCURRENCY', '8')),
+    thread_name_prefix='detection'
+)
 
 @image_bp.route('/upload', methods=['POST'])
 def upload_image():
@@ -33,33 +71,14 @@ def upload_image():
         
         # Read and validate image
         try:
-            image = Image.open(file.stream)
-            width, height = image.size
-            
-            # Convert to RGB if necessary
-            if image.mode != 'RGB':
-                image = image.convert('RGB')
-            
-            # Save image temporarily (in production, use cloud storage)
-            upload_dir = os.path.join(current_app.root_path, 'uploads')
-            os.makedirs(upload_dir, exist_ok=True)
-            
-            image_path = os.path.join(upload_dir, f"{file_id}.jpg")
-            image.save(image_path, 'JPEG', quality=95)
+            storage = _storage()
+            response, stored = store_upload(storage, file_id, file.stream)
             
-            # Convert to base64 for frontend
-            buffer = BytesIO()
-            image.save(buffer, format='JPEG', quality=95)
-            image_base64 = base64.b64encode(buffer.getvalue()).decode('utf-8')
+            if _wants_inline():
+                # Legacy clients still expect the image inlined as a data URI
+                response['image_data'] = image_data_uri(storage, stored['key'])
             
-            return jsonify({
-                'success': True,
-                'file_id': file_id,
-                'image_data': f"data:image/jpeg;base64,{image_base64}",
-                'width': width,
-                'height': height,
-                'message': 'Image uploaded successfully'
-            })
+            return jsonify(response)
             
         except Exception as e:
             return jsonify({'error': f'Invalid image file: {str(e)}'}), 400
@@ -78,25 +97,101 @@ def detect_people():
             return jsonify({'error': 'No file_id provided'}), 400
         
         # Get image path
-        upload_dir = os.path.join(current_app.root_path, 'uploads')
-        image_path = os.path.join(upload_dir, f"{file_id}.jpg")
+        image_path = _storage().local_path(f"{file_id}.jpg")
         
-        if not os.path.exists(image_path):
+        if not image_path:
             return jsonify({'error': 'Image file not found'}), 404
         
         # Use AI service to detect people
-        detected_people = ai_services['person_detector'].detect_people(image_path)
+        with span('detect'), detection_cache.track() as lookups:
+            detected_people = ai_services['person_detector'].detect_people(image_path)
+        
+        if data.get('segment', DETECTION_SEGMENTATION):
+            # Precise per-person masks make removal regenerate far less background
+            mark_segmented(detected_people, _segment_people(image_path, detected_people))
+        
+        detection_sessions.set(file_id, detected_people)
         
         return jsonify({
             'success': True,
             'people': detected_people,
             'count': len(detected_people),
+            'cache': detection_cache.outcome(lookups),
             'message': f'Detected {len(detected_people)} people in the image'
         })
         
+    except OverloadedError as e:
+        return overloaded_response(jsonify, e)
+    except VendorUnavailableError as e:
+        return unavailable_response(jsonify, e)
     except Exception as e:
         return jsonify({'error': f'Detection failed: {str(e)}'}), 500
 
+def _segment_people(image_path, people):
+    """Return cached per-person segments for an image, generating them on a miss"""
+    key = file_content_hash(image_path)
+    segments = segment_cache.get(key)
+    if segments is None:
+        with span('segment'):
+            mask = ai_services['mask_generator'].generate_person_mask_array(image_path)
+        if mask is None:
+            return {}
+        segments = cut_segments(image_path, mask, people)
+        segment_cache.set(key, segments)
+    return segments
+
+@image_bp.route('/detect-people/batch', methods=['POST'])
+def detect_people_batch():
+    """Detect people in many uploaded images, streaming NDJSON results as they finish"""
+    try:
+        data = request.get_json()
+        file_ids = data.get('file_ids')
+        
+        if not file_ids or not isinstance(file_ids, list):
+            return jsonify({'error': 'No file_ids provided'}), 400
+        
+        if len(file_ids) > DETECTION_BATCH_LIMIT:
+            return jsonify({'error': f'At most {DETECTION_BATCH_LIMIT} file_ids per batch'}), 400
+        
+        storage = _storage()
+        
+    except Exception as e:
+        return jsonify({'error': f'Detection failed: {str(e)}'}), 500
+    
+    def detect_one(file_id):
+        image_path = storage.local_path(f"{file_id}.jpg")
+        if not image_path:
+            return {'file_id': file_id, 'success': False, 'error': 'Image file not found'}
+        with span('detect'), detection_cache.track() as lookups:
+            detected_people = ai_services['person_detector'].detect_people(image_path)
+        detection_sessions.set(file_id, detected_people)
+        return {
+            'file_id': file_id,
+            'success': True,
+            'people': detected_people,
+            'count': len(detected_people),
+            'cache': detection_cache.outcome(lookups)
+        }
+    
+    def generate():
+        futures = {detection_executor.submit(detect_one, str(file_id)): str(file_id) for file_id in file_ids}
+        completed = 0
+        try:
+            for future in as_completed(futures):
+                try:
+                    result = future.result()
+                except Exception as e:
+                    result = {'file_id': futures[future], 'success': False, 'error': f'Detection failed: {str(e)}'}
+                completed += 1
+                yield json.dumps(result) + '\n'
+            yield json.dumps({'done': True, 'count': completed}) + '\n'
+        finally:
+            # Client went away: don't spend vendor calls on results nobody will read
+            for future in futures:
+                future.cancel()
+    
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
 @image_bp.route('/remove-people', methods=['POST'])
 def remove_people():
     """Remove selected people from the image using AI"""
@@ -104,7 +199,6 @@ def remove_people():
         data = request.get_json()
         file_id = data.get('file_id')
         selected_people = data.get('selected_people', [])
-        people_data = data.get('people_data', [])
         quality_mode = data.get('quality_mode', 'fast')  # 'fast' or 'quality'
         
         if not file_id:
@@ -114,49 +208,150 @@ def remove_people():
             return jsonify({'error': 'No people selected for removal'}), 400
         
         # Get image path
-        upload_dir = os.path.join(current_app.root_path, 'uploads')
-        image_path = os.path.join(upload_dir, f"{file_id}.jpg")
+        storage = _storage()
+        image_path = storage.local_path(f"{file_id}.jpg")
         
-        if not os.path.exists(image_path):
+        if not image_path:
             return jsonify({'error': 'Original image not found'}), 404
         
-        # Use AI service to remove people
-        processed_image_data = ai_services['image_processor'].remove_people(
-            image_path, people_data, selected_people, quality_mode
-        )
-        
-        # Generate result filename and save
-        result_id = str(uuid.uuid4())
-        result_path = os.path.join(upload_dir, f"{result_id}_result.jpg")
-        
-        with open(result_path, 'wb') as f:
-            f.write(processed_image_data)
+        people_data, unknown = _removal_people(file_id, image_path, selected_people, data.get('people_data'))
+        if unknown:
+            return jsonify({'error': f'Unknown person ids: {unknown}'}), 400
         
-        # Convert to base64 for frontend
-        image_base64 = base64.b64encode(processed_image_data).decode('utf-8')
+        processor = select_processor(data.get('backend'), quality_mode)
+        if processor is None:
+            return jsonify({'error': f"Unknown backend: {data.get('backend')}"}), 400
         
-        return jsonify({
-            'success': True,
-            'result_id': result_id,
-            'result_image': f"data:image/jpeg;base64,{image_base64}",
-            'removed_people': selected_people,
-            'message': f'Successfully removed {len(selected_people)} people from the image'
-        })
+        if data.get('async'):
+            try:
+                job_id = removal_jobs.submit(
+                    run_removal, processor, image_path, storage, people_data,
+                    selected_people, quality_mode, _wants_inline()
+                )
+            except QueueFullError:
+                return queue_full_response(jsonify)
+
+            return jsonify({
+                'success': True,
+                'job_id': job_id,
+                'status': 'queued',
+                'status_url': f"/api/image/jobs/{job_id}"
+            }), 202
+
+        if data.get('progressive'):
+            mask, cache_key = prepare_removal(processor, image_path, people_data, selected_people, quality_mode)
+            # Start the full pass now; it finishes (and is cached) even if the client leaves
+            full = progressive_executor.submit(
+                contextvars.copy_context().run, finish_removal, processor, image_path, storage, mask, cache_key,
+                selected_people, quality_mode, _wants_inline()
+            )
+            return Response(
+                stream_with_context(_progressive_events(image_path, mask, cache_key, full)),
+                mimetype='text/event-stream',
+                headers=SSE_HEADERS
+            )
+
+        return jsonify(run_removal(
+            processor, image_path, storage, people_data, selected_people, quality_mode,
+            _wants_inline()
+        ))
         
+    except OverloadedError as e:
+        return overloaded_response(jsonify, e)
+    except VendorUnavailableError as e:
+        return unavailable_response(jsonify, e)
     except Exception as e:
         return jsonify({'error': f'Processing failed: {str(e)}'}), 500
 
+def _removal_people(file_id, image_path, selected_people, people_data=None):
+    """Return (people, unknown ids) to remove: the request's people_data when sent,
+    otherwise the selected records of the upload's detection session"""
+    if people_data:
+        # Older clients still send the whole detection list back
+        return people_data, []
+    selection = detection_sessions.select(file_id, selected_people)
+    if selection is None:
+        # No session here (expired, restarted, or detected by another worker); detections
+        # are cached by image content, so rebuilding it rarely reaches the vendor
+        with span('detect'):
+            detection_sessions.set(file_id, ai_services['person_detector'].detect_people(image_path))
+        selection = detection_sessions.select(file_id, selected_people)
+    return selection
+
+def _progressive_events(image_path, mask, cache_key, full):
+    """Stream Server-Sent Events: a low-res preview as soon as it exists, then the full result"""
+    if not result_cache.contains(cache_key) and not full.done():
+        preview = render_preview(image_path, mask)
+        if preview is not None and not full.done():
+            yield sse_event('preview', preview)
+    try:
+        yield sse_event('result', full.result())
+    except VendorUnavailableError as e:
+        yield sse_event('error', {'error': str(e), 'retry_after': retry_after_seconds(e)})
+    except Exception as e:
+        yield sse_event('error', {'error': f'Processing failed: {str(e)}'})
+
+@image_bp.route('/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    """Return the status and, once finished, the result of a removal job"""
+    job = removal_jobs.get(job_id)
+    if not job:
+        return jsonify({'error': 'Job not found'}), 404
+    
+    return jsonify(job_payload(job))
+
+@image_bp.route('/images/<file_id>', methods=['GET'])
+def get_image(file_id):
+    """Serve an uploaded image with ETag, Range and conditional GET support"""
+    image_path = _storage().local_path(f"{file_id}.jpg")
+    
+    if not image_path:
+        return jsonify({'error': 'Image file not found'}), 404
+    
+    return send_file(image_path, mimetype='image/jpeg', max_age=IMAGE_MAX_AGE)
+
+@image_bp.route('/results/<result_id>', methods=['GET'])
+def get_result(result_id):
+    """Serve a processed image inline with ETag, Range and conditional GET support"""
+    result_path = _storage().local_path(f"{result_id}_result.jpg")
+    
+    if not result_path:
+        return jsonify({'error': 'Result image not found'}), 404
+    
+    return send_file(result_path, mimetype='image/jpeg', max_age=IMAGE_MAX_AGE)
+
+@image_bp.route('/images/<file_id>/<size>', methods=['GET'])
+def get_image_size(file_id, size):
+    """Serve an upload as a thumbnail, preview or full image with long-lived cache headers"""
+    return _send_derivative(f"{file_id}.jpg", size, 'Image file not found')
+
+@image_bp.route('/results/<result_id>/<size>', methods=['GET'])
+def get_result_size(result_id, size):
+    """Serve a result as a thumbnail, preview or full image with long-lived cache headers"""
+    return _send_derivative(f"{result_id}_result.jpg", size, 'Result image not found')
+
+def _send_derivative(key, size, missing):
+    if size not in SIZES:
+        return jsonify({'error': f'Unknown size: {size}'}), 404
+    
+    path = sized_image_path(_storage(), key, size)
+    if not path:
+        return jsonify({'error': missing}), 404
+    
+    response = send_file(path, mimetype='image/jpeg', max_age=DERIVATIVE_MAX_AGE)
+    response.cache_control.immutable = True
+    return response
+
 @image_bp.route('/download/<result_id>', methods=['GET'])
 def download_result(result_id):
     """Download the processed image"""
     try:
-        upload_dir = os.path.join(current_app.root_path, 'uploads')
-        result_path = os.path.join(upload_dir, f"{result_id}_result.jpg")
+        result_path = _storage().local_path(f"{result_id}_result.jpg")
         
-        if not os.path.exists(result_path):
+        if not result_path:
             return jsonify({'error': 'Result image not found'}), 404
         
-        return send_from_directory(upload_dir, f"{result_id}_result.jpg", as_attachment=True)
+        return send_file(result_path, as_attachment=True)
         
     except Exception as e:
         return jsonify({'error': f'Download failed: {str(e)}'}), 500
@@ -164,20 +359,4 @@ def download_result(result_id):
 @image_bp.route('/status', methods=['GET'])
 def api_status():
     """API health check"""
-    return jsonify({
-        'status': 'healthy',
-        'service': 'Exerase Image Processing API',
-        'version': '1.0.0',
-        'ai_services': {
-            'person_detection': 'Roboflow People Detection API',
-            'image_processing': 'ClipDrop Cleanup API',
-            'mask_generation': 'Segmind Automatic Mask Generator'
-        },
-        'endpoints': {
-            'upload': '/api/image/upload',
-            'detect': '/api/image/detect-people',
-            'remove': '/api/image/remove-people',
-            'download': '/api/image/download/<result_id>'
-        }
-    })
-
+    return jsonify(status_payload(_storage()))
@@ -33,7 +33,8 @@ class ImageProcessingAPI {
     return await response.json()
   }
   
-  async removePeople(fileId, selectedPeople, peopleData, qualityMode = 'fast') {
+  async removePeople(fileId, selectedPeople, qualityMode = 'fast') {
+    // The server keeps this upload's detections, so only the selected ids are sent
     const response = await fetch(`${API_BASE_URL}/remove-people`, {
       method: 'POST',
       headers: {
@@ -42,7 +43,6 @@ class ImageProcessingAPI {
       body: JSON.stringify({
         file_id: fileId,
         selected_people: selectedPeople,
-        people_data: peopleData,
         quality_mode: qualityMode
       })
     })
@@ -54,6 +54,80 @@ class ImageProcessingAPI {
     return await response.json()
   }
   
+  async removePeopleProgressive(fileId, selectedPeople, qualityMode = 'fast', onPreview = null) {
+    // The server streams Server-Sent Events over the POST response: a low-res
+    // 'preview' first, then the full 'result' (or an 'error')
+    const response = await fetch(`${API_BASE_URL}/remove-people`, {
+      method: 'POST',
+      headers: {
+        'Content-Type': 'application/json',
+        'Accept': 'text/event-stream'
+      },
+      body: JSON.stringify({
+        file_id: fileId,
+        selected_people: selectedPeople,
+        quality_mode: qualityMode,
+        progressive: true
+      })
+    })
+    
+    if (!response.ok) {
+      throw new Error(`Processing failed: ${response.statusText}`)
+    }
+    
+    // Servers without progressive support answer with the plain JSON result
+    const contentType = response.headers.get('Content-Type') || ''
+    if (!contentType.startsWith('text/event-stream')) {
+      return await response.json()
+    }
+    
+    const reader = response.body.getReader()
+    const decoder = new TextDecoder()
+    let buffer = ''
+    
+    while (true) {
+      const { done, value } = await reader.read()
+      if (done) {
+        throw new Error('Processing failed: stream ended without a result')
+      }
+      buffer += decoder.decode(value, { stream: true })
+      
+      let boundary
+      while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+        const block = buffer.slice(0, boundary)
+        buffer = buffer.slice(boundary + 2)
+        
+        let event = 'message'
+        let data = ''
+        for (const line of block.split('\n')) {
+          if (line.startsWith('event: ')) event = line.slice(7)
+          else if (line.startsWith('data: ')) data += line.slice(6)
+        }
+        const payload = JSON.parse(data)
+        
+        if (event === 'preview' && onPreview) {
+          onPreview(payload)
+        } else if (event === 'result') {
+          reader.cancel()
+          return payload
+        } else if (event === 'error') {
+          reader.cancel()
+          throw new Error(payload.error)
+        }
+      }
+    }
+  }
+  
+  async getJob(jobId) {
+    const response = await fetch(`${API_BASE_URL}/jobs/${jobId}`)
+    
+    if (!response.ok) {
+      throw new Error(`Job lookup failed: ${response.statusText}`)
+    }
+    
+    return await response.json()
+  }
+  
   getDownloadUrl(resultId) {
     return `${API_BASE_URL}/download/${resultId}`
   }
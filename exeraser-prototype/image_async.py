@@ -0,0 +1,397 @@
+import os
+import asyncio
+import json
+import uuid
+from quart import Blueprint, request, jsonify, current_app, send_file, stream_with_context
+from src.services.metrics import instrument_async_blueprint, span
+from src.services.jobs import QueueFullError
+from src.services.content_hash import file_content_hash
+from src.services.storage import get_storage
+from src.services.circuit_breaker import VendorUnavailableError
+from src.services.admission import OverloadedError, admit_async_blueprint, overloaded_response
+from src.services.cpu_pool import cpu_pool
+from src.services.derivatives import SIZES
+# Caches, backends and job queue are shared with the WSGI routes
+from src.routes.common import (
+    ai_services, detection_cache, detection_sessions, result_cache, segment_cache, removal_jobs,
+    DERIVATIVE_MAX_AGE, DETECTION_BATCH_LIMIT, DETECTION_SEGMENTATION, INPAINT_FALLBACK, IMAGE_MAX_AGE,
+    SSE_HEADERS, cut_segments, enable_detection_disk_cache, image_data_uri, inpainting_unavailable,
+    job_payload, mark_segmented, prepare_removal, queue_full_response, removal_response, render_preview,
+    retry_after_seconds, run_removal, select_processor, sized_image_path, sse_event, status_payload,
+    store_result, store_upload, unavailable_response
+)
+
+# ASGI variant of the image routes: vendor calls are awaited on the event loop, so
+# one process holds hundreds of in-flight requests; decoding, hashing and disk
+# writes run in worker threads via asyncio.to_thread
+image_async_bp = admit_async_blueprint(instrument_async_blueprint(Blueprint('image_async', __name__)))
+image_async_bp.record_once(lambda state: cpu_pool.warm())
+image_async_bp.record_once(enable_detection_disk_cache)
+
+# Bounds concurrent vendor calls from batch detection across all requests
+detection_slots = asyncio.Semaphore(int(os.getenv('DETECTION_BATCH_CONCURRENCY', '8')))
+
+# Full passes of progressive removals outlive their request; the loop only holds weak references
+progressive_tasks = set()
+
+def _storage():
+    """Return the storage backend for this app's uploads"""
+    return get_storage(os.path.join(current_app.root_path, 'uploads'))
+
+async def _local_path(storage, key):
+    # S3 storage downloads on a cache miss, so never resolve paths on the loop
+    return await asyncio.to_thread(storage.local_path, key)
+
+async def _wants_inline(data=None):
+    """Whether the client asked for legacy base64 data URIs in the response"""
+    flag = request.args.get('inline')
+    if flag is None:
+        if data is None:
+            flag = (await request.form).get('inline')
+        else:
+            flag = data.get('inline')
+    return str(flag).lower() in ('1', 'true', 'yes')
+
+@image_async_bp.route('/upload', methods=['POST'])
+async def upload_image():
+    """Handle image upload and return image info"""
+    try:
+        files = await request.files
+        if 'image' not in files:
+            return jsonify({'error': 'No image file provided'}), 400
+
+        file = files['image']
+        if file.filename == '':
+            return jsonify({'error': 'No file selected'}), 400
+
+        if not file.content_type.startswith('image/'):
+            return jsonify({'error': 'File must be an image'}), 400
+
+        file_id = str(uuid.uuid4())
+        storage = _storage()
+
+        try:
+            # The spooled upload is copied to storage in chunks on a worker thread
+            response, stored = await asyncio.to_thread(store_upload, storage, file_id, file.stream)
+
+            if await _wants_inline():
+                response['image_data'] = await asyncio.to_thread(image_data_uri, storage, stored['key'])
+
+            return jsonify(response)
+
+        except Exception as e:
+            return jsonify({'error': f'Invalid image file: {str(e)}'}), 400
+
+    except Exception as e:
+        return jsonify({'error': f'Upload failed: {str(e)}'}), 500
+
+@image_async_bp.route('/detect-people', methods=['POST'])
+async def detect_people():
+    """Detect people in the uploaded image using AI"""
+    try:
+        data = await request.get_json()
+        file_id = data.get('file_id')
+
+        if not file_id:
+            return jsonify({'error': 'No file_id provided'}), 400
+
+        image_path = await _local_path(_storage(), f"{file_id}.jpg")
+
+        if not image_path:
+            return jsonify({'error': 'Image file not found'}), 404
+
+        with span('detect'), detection_cache.track() as lookups:
+            detected_people = await ai_services['person_detector'].detect_people_async(image_path)
+
+        if data.get('segment', DETECTION_SEGMENTATION):
+            mark_segmented(detected_people, await _segment_people_async(image_path, detected_people))
+
+        detection_sessions.set(file_id, detected_people)
+
+        return jsonify({
+            'success': True,
+            'people': detected_people,
+            'count': len(detected_people),
+            'cache': detection_cache.outcome(lookups),
+            'message': f'Detected {len(detected_people)} people in the image'
+        })
+
+    except OverloadedError as e:
+        return overloaded_response(jsonify, e)
+    except VendorUnavailableError as e:
+        return unavailable_response(jsonify, e)
+    except Exception as e:
+        return jsonify({'error': f'Detection failed: {str(e)}'}), 500
+
+async def _segment_people_async(image_path, people):
+    """Async _segment_people: the Segmind call is awaited, hashing and splitting run in threads"""
+    key = await asyncio.to_thread(file_content_hash, image_path)
+    segments = segment_cache.get(key)
+    if segments is None:
+        with span('segment'):
+            mask = await ai_services['mask_generator'].generate_person_mask_array_async(image_path)
+        if mask is None:
+            return {}
+        segments = await asyncio.to_thread(cut_segments, image_path, mask, people)
+        segment_cache.set(key, segments)
+    return segments
+
+@image_async_bp.route('/detect-people/batch', methods=['POST'])
+async def detect_people_batch():
+    """Detect people in many uploaded images, streaming NDJSON results as they finish"""
+    try:
+        data = await request.get_json()
+        file_ids = data.get('file_ids')
+
+        if not file_ids or not isinstance(file_ids, list):
+            return jsonify({'error': 'No file_ids provided'}), 400
+
+        if len(file_ids) > DETECTION_BATCH_LIMIT:
+            return jsonify({'error': f'At most {DETECTION_BATCH_LIMIT} file_ids per batch'}), 400
+
+        storage = _storage()
+
+    except Exception as e:
+        return jsonify({'error': f'Detection failed: {str(e)}'}), 500
+
+    async def detect_one(file_id):
+        try:
+            async with detection_slots:
+                image_path = await _local_path(storage, f"{file_id}.jpg")
+                if not image_path:
+                    return {'file_id': file_id, 'success': False, 'error': 'Image file not found'}
+                with span('detect'), detection_cache.track() as lookups:
+                    detected_people = await ai_services['person_detector'].detect_people_async(image_path)
+            detection_sessions.set(file_id, detected_people)
+        except Exception as e:
+            return {'file_id': file_id, 'success': False, 'error': f'Detection failed: {str(e)}'}
+        return {
+            'file_id': file_id,
+            'success': True,
+            'people': detected_people,
+            'count': len(detected_people),
+            'cache': detection_cache.outcome(lookups)
+        }
+
+    @stream_with_context
+    async def generate():
+        tasks = [asyncio.ensure_future(detect_one(str(file_id))) for file_id in file_ids]
+        completed = 0
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                result = await next_done
+                completed += 1
+                yield (json.dumps(result) + '\n').encode('utf-8')
+            yield (json.dumps({'done': True, 'count': completed}) + '\n').encode('utf-8')
+        finally:
+            # Client went away: don't spend vendor calls on results nobody will read
+            for task in tasks:
+                task.cancel()
+
+    return generate(), 200, {'Content-Type': 'application/x-ndjson'}
+
+@image_async_bp.route('/remove-people', methods=['POST'])
+async def remove_people():
+    """Remove selected people from the image using AI"""
+    try:
+        data = await request.get_json()
+        file_id = data.get('file_id')
+        selected_people = data.get('selected_people', [])
+        quality_mode = data.get('quality_mode', 'fast')  # 'fast' or 'quality'
+
+        if not file_id:
+            return jsonify({'error': 'No file_id provided'}), 400
+
+        if not selected_people:
+            return jsonify({'error': 'No people selected for removal'}), 400
+
+        storage = _storage()
+        image_path = await _local_path(storage, f"{file_id}.jpg")
+
+        if not image_path:
+            return jsonify({'error': 'Original image not found'}), 404
+
+        people_data, unknown = await _removal_people_async(
+            file_id, image_path, selected_people, data.get('people_data')
+        )
+        if unknown:
+            return jsonify({'error': f'Unknown person ids: {unknown}'}), 400
+
+        processor = select_processor(data.get('backend'), quality_mode)
+        if processor is None:
+            return jsonify({'error': f"Unknown backend: {data.get('backend')}"}), 400
+
+        inline = await _wants_inline(data)
+        if data.get('async'):
+            try:
+                job_id = removal_jobs.submit(
+                    run_removal, processor, image_path, storage, people_data,
+                    selected_people, quality_mode, inline
+                )
+            except QueueFullError:
+                return queue_full_response(jsonify)
+
+            return jsonify({
+                'success': True,
+                'job_id': job_id,
+                'status': 'queued',
+                'status_url': f"/api/image/jobs/{job_id}"
+            }), 202
+
+        if data.get('progressive'):
+            mask, cache_key = await asyncio.to_thread(
+                prepare_removal, processor, image_path, people_data, selected_people, quality_mode
+            )
+            full = asyncio.ensure_future(_finish_removal_async(
+                processor, image_path, storage, mask, cache_key, selected_people, quality_mode, inline
+            ))
+            progressive_tasks.add(full)
+            full.add_done_callback(progressive_tasks.discard)
+            return _progressive_events(image_path, mask, cache_key, full), 200, dict(
+                SSE_HEADERS, **{'Content-Type': 'text/event-stream'}
+            )
+
+        return jsonify(await _run_removal_async(
+            processor, image_path, storage, people_data, selected_people, quality_mode, inline
+        ))
+
+    except OverloadedError as e:
+        return overloaded_response(jsonify, e)
+    except VendorUnavailableError as e:
+        return unavailable_response(jsonify, e)
+    except Exception as e:
+        return jsonify({'error': f'Processing failed: {str(e)}'}), 500
+
+async def _removal_people_async(file_id, image_path, selected_people, people_data=None):
+    """Async _removal_people: a missing session is rebuilt with an awaited detection"""
+    if people_data:
+        return people_data, []
+    selection = detection_sessions.select(file_id, selected_people)
+    if selection is None:
+        with span('detect'):
+            detection_sessions.set(file_id, await ai_services['person_detector'].detect_people_async(image_path))
+        selection = detection_sessions.select(file_id, selected_people)
+    return selection
+
+async def _run_removal_async(processor, image_path, storage, people_data, selected_people,
+                             quality_mode, inline=False):
+    """Async twin of run_removal sharing its caches and fallback rules"""
+    mask, cache_key = await asyncio.to_thread(
+        prepare_removal, processor, image_path, people_data, selected_people, quality_mode
+    )
+    return await _finish_removal_async(
+        processor, image_path, storage, mask, cache_key, selected_people, quality_mode, inline
+    )
+
+async def _finish_removal_async(processor, image_path, storage, mask, cache_key, selected_people,
+                                quality_mode, inline=False):
+    """Async finish_removal: vendor calls are awaited, image work runs in threads"""
+    fallback = ai_services['image_processors'].get(INPAINT_FALLBACK)
+
+    async def compute():
+        try:
+            processed_image_data = await processor.inpaint_async(image_path, mask, quality_mode)
+        except OverloadedError:
+            # A saturated backend degrades to the fallback when there is one
+            if fallback is None or fallback is processor:
+                raise
+            processed_image_data = None
+        backend = processor.name
+        cacheable = processed_image_data is not None
+        if not cacheable and fallback is not None and fallback is not processor:
+            processed_image_data = await fallback.inpaint_async(image_path, mask, quality_mode)
+            backend = fallback.name
+        if processed_image_data is None:
+            raise inpainting_unavailable(processor)
+        entry = await asyncio.to_thread(store_result, storage, processed_image_data, backend)
+        return entry, cacheable
+
+    with span('remove'):
+        entry, source = await result_cache.get_or_compute_async(cache_key, compute)
+
+    return await asyncio.to_thread(removal_response, entry, source, storage, selected_people, inline)
+
+async def _progressive_events(image_path, mask, cache_key, full):
+    """Async _progressive_events: the preview renders in a thread while the full pass is awaited"""
+    if not result_cache.contains(cache_key) and not full.done():
+        preview = await asyncio.to_thread(render_preview, image_path, mask)
+        if preview is not None and not full.done():
+            yield sse_event('preview', preview).encode('utf-8')
+    try:
+        result = await asyncio.shield(full)
+        yield sse_event('result', result).encode('utf-8')
+    except VendorUnavailableError as e:
+        error = {'error': str(e), 'retry_after': retry_after_seconds(e)}
+        yield sse_event('error', error).encode('utf-8')
+    except Exception as e:
+        yield sse_event('error', {'error': f'Processing failed: {str(e)}'}).encode('utf-8')
+
+@image_async_bp.route('/jobs/<job_id>', methods=['GET'])
+async def get_job(job_id):
+    """Return the status and, once finished, the result of a removal job"""
+    job = removal_jobs.get(job_id)
+    if not job:
+        return jsonify({'error': 'Job not found'}), 404
+
+    return jsonify(job_payload(job))
+
+@image_async_bp.route('/images/<file_id>', methods=['GET'])
+async def get_image(file_id):
+    """Serve an uploaded image with ETag, Range and conditional GET support"""
+    image_path = await _local_path(_storage(), f"{file_id}.jpg")
+
+    if not image_path:
+        return jsonify({'error': 'Image file not found'}), 404
+
+    return await send_file(image_path, mimetype='image/jpeg', cache_timeout=IMAGE_MAX_AGE, conditional=True)
+
+@image_async_bp.route('/results/<result_id>', methods=['GET'])
+async def get_result(result_id):
+    """Serve a processed image inline with ETag, Range and conditional GET support"""
+    result_path = await _local_path(_storage(), f"{result_id}_result.jpg")
+
+    if not result_path:
+        return jsonify({'error': 'Result image not found'}), 404
+
+    return await send_file(result_path, mimetype='image/jpeg', cache_timeout=IMAGE_MAX_AGE, conditional=True)
+
+@image_async_bp.route('/images/<file_id>/<size>', methods=['GET'])
+async def get_image_size(file_id, size):
+    """Serve an upload as a thumbnail, preview or full image with long-lived cache headers"""
+    return await _send_derivative(f"{file_id}.jpg", size, 'Image file not found')
+
+@image_async_bp.route('/results/<result_id>/<size>', methods=['GET'])
+async def get_result_size(result_id, size):
+    """Serve a result as a thumbnail, preview or full image with long-lived cache headers"""
+    return await _send_derivative(f"{result_id}_result.jpg", size, 'Result image not found')
+
+async def _send_derivative(key, size, missing):
+    if size not in SIZES:
+        return jsonify({'error': f'Unknown size: {size}'}), 404
+
+    path = await asyncio.to_thread(sized_image_path, _storage(), key, size)
+    if not path:
+        return jsonify({'error': missing}), 404
+
+    response = await send_file(path, mimetype='image/jpeg', cache_timeout=DERIVATIVE_MAX_AGE, conditional=True)
+    response.cache_control.immutable = True
+    return response
+
+@image_async_bp.route('/download/<result_id>', methods=['GET'])
+async def download_result(result_id):
+    """Download the processed image"""
+    try:
+        result_path = await _local_path(_storage(), f"{result_id}_result.jpg")
+
+        if not result_path:
+            return jsonify({'error': 'Result image not found'}), 404
+
+        return await send_file(result_path, as_attachment=True)
+
+    except Exception as e:
+        return jsonify({'error': f'Download failed: {str(e)}'}), 500
+
+@image_async_bp.route('/status', methods=['GET'])
+async def api_status():
+    """API health check"""
+    return jsonify(status_payload(_storage()))
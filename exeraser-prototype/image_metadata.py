@@ -0,0 +1,65 @@
+import json
+import os
+import threading
+from collections import OrderedDict
+
+from src.services.startup import LazyModule
+
+Image = LazyModule('PIL.Image')
+
+
+_metadata = OrderedDict()
+_metadata_lock = threading.Lock()
+MAX_REMEMBERED_IMAGES = 4096
+
+
+def metadata_path(image_path):
+    """Return the sidecar metadata path for a stored image"""
+    return f"{os.path.splitext(image_path)[0]}.meta.json"
+
+
+def write_metadata(image_path, metadata):
+    """Persist metadata next to the image and remember it in memory"""
+    path = metadata_path(image_path)
+    tmp_path = f"{path}.{threading.get_ident()}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(metadata, f)
+    os.replace(tmp_path, path)
+    _remember(image_path, metadata)
+
+
+def read_metadata(image_path):
+    """Return the stored metadata for an image, or None if it has none"""
+    with _metadata_lock:
+        metadata = _metadata.get(image_path)
+    if metadata is not None:
+        return metadata
+
+    try:
+        with open(metadata_path(image_path), 'r') as f:
+            metadata = json.load(f)
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        print(f"Image metadata read error: {e}")
+        return None
+
+    _remember(image_path, metadata)
+    return metadata
+
+
+def image_dimensions(image_path):
+    """Return (width, height), reopening the image only if no metadata exists"""
+    metadata = read_metadata(image_path)
+    if metadata:
+        return metadata['width'], metadata['height']
+    with Image.open(image_path) as img:
+        return img.size
+
+
+def _remember(image_path, metadata):
+    with _metadata_lock:
+        _metadata[image_path] = metadata
+        _metadata.move_to_end(image_path)
+        while len(_metadata) > MAX_REMEMBERED_IMAGES:
+            _metadata.popitem(last=False)
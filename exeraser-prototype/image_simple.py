@@ -1,12 +1,19 @@
 import os
 import base64
 import uuid
-import requests
 from io import BytesIO
-from flask import Blueprint, request, jsonify, current_app, send_from_directory
+from flask import Blueprint, request, jsonify, current_app, send_file, Response
 import time
+import json
+from src.services.storage import get_storage
+from src.services.content_hash import HashingReader, remember_content_hash
+from src.services.image_metadata import write_metadata
+from src.services.metrics import instrument_blueprint
+from src.services.startup import LazyModule
 
-image_bp = Blueprint('image', __name__)
+Image = LazyModule('PIL.Image')
+
+image_bp = instrument_blueprint(Blueprint('image', __name__))
 
 # Mock person detection data for testing
 MOCK_PEOPLE_DATA = [
@@ -15,6 +22,20 @@ MOCK_PEOPLE_DATA = [
     {"id": 3, "x": 75, "y": 35, "width": 15, "height": 35, "confidence": 0.92}
 ]
 
+# Uploads and results are immutable under their uuid, so clients may cache them
+IMAGE_MAX_AGE = 24 * 3600
+
+def _storage():
+    """Return the storage backend for this app's uploads"""
+    return get_storage(os.path.join(current_app.root_path, 'uploads'))
+
+def _wants_inline():
+    """Whether the client asked for legacy base64 data URIs in the response"""
+    flag = request.args.get('inline') or request.form.get('inline')
+    if flag is None and request.is_json:
+        flag = (request.get_json(silent=True) or {}).get('inline')
+    return str(flag).lower() in ('1', 'true', 'yes')
+
 @image_bp.route('/upload', methods=['POST'])
 def upload_image():
     """Handle image upload and return image info"""
@@ -33,13 +54,6 @@ def upload_image():
         # Generate unique filename
         file_id = str(uuid.uuid4())
         
-        # Read image data
-        image_data = file.read()
-        
-        # Save image temporarily (in production, use cloud storage)
-        upload_dir = os.path.join(current_app.root_path, 'uploads')
-        os.makedirs(upload_dir, exist_ok=True)
-        
         # Determine file extension
         content_type = file.content_type
         if 'jpeg' in content_type or 'jpg' in content_type:
@@ -49,21 +63,43 @@ def upload_image():
         else:
             ext = 'jpg'  # default
         
-        image_path = os.path.join(upload_dir, f"{file_id}.{ext}")
-        with open(image_path, 'wb') as f:
-            f.write(image_data)
+        # Dimensions come from the header alone, the pixels are never decoded
+        with Image.open(file.stream) as image:
+            width, height = image.size
+            original_format = image.format
+        file.stream.seek(0)
         
-        # Convert to base64 for frontend
-        image_base64 = base64.b64encode(image_data).decode('utf-8')
+        # Stream the upload into storage in chunks (local disk or S3-compatible),
+        # hashing it on the way
+        storage = _storage()
+        reader = HashingReader(file.stream)
+        stored = storage.save_stream(f"{file_id}.{ext}", reader, content_type, alias=file_id)
+        remember_content_hash(stored['path'], reader.hexdigest())
+        write_metadata(stored['path'], {
+            'width': width,
+            'height': height,
+            'format': original_format,
+            'bytes': stored['size'],
+            'sha256': reader.hexdigest()
+        })
+        storage.refresh(stored['key'])
         
-        return jsonify({
+        response = {
             'success': True,
             'file_id': file_id,
-            'image_data': f"data:{content_type};base64,{image_base64}",
-            'width': 800,  # Mock dimensions
-            'height': 600,
+            'image_url': f"/api/image/images/{file_id}",
+            'width': width,
+            'height': height,
             'message': 'Image uploaded successfully'
-        })
+        }
+        
+        if _wants_inline():
+            # Legacy clients still expect the image inlined as a data URI
+            with storage.open(f"{file_id}.{ext}") as f:
+                image_base64 = base64.b64encode(f.read()).decode('utf-8')
+            response['image_data'] = f"data:{content_type};base64,{image_base64}"
+        
+        return jsonify(response)
         
     except Exception as e:
         return jsonify({'error': f'Upload failed: {str(e)}'}), 500
@@ -110,18 +146,11 @@ def remove_people():
         if not selected_people:
             return jsonify({'error': 'No people selected for removal'}), 400
         
-        # Find original image
-        upload_dir = os.path.join(current_app.root_path, 'uploads')
-        
-        # Try different extensions
-        image_path = None
-        for ext in ['jpg', 'png', 'jpeg']:
-            potential_path = os.path.join(upload_dir, f"{file_id}.{ext}")
-            if os.path.exists(potential_path):
-                image_path = potential_path
-                break
+        # Find original image through the file_id index, whatever its extension
+        storage = _storage()
+        original = storage.resolve(file_id)
         
-        if not image_path:
+        if not original:
             return jsonify({'error': 'Original image not found'}), 404
         
         # Simulate processing time
@@ -129,45 +158,76 @@ def remove_people():
         time.sleep(processing_time)
         
         # For demo purposes, return the same image
-        with open(image_path, 'rb') as f:
+        with storage.open(original['key']) as f:
             image_data = f.read()
-            image_base64 = base64.b64encode(image_data).decode('utf-8')
         
         # Generate result filename
         result_id = str(uuid.uuid4())
-        result_path = os.path.join(upload_dir, f"{result_id}_result.jpg")
         
         # Save result (copy of original for demo)
-        with open(result_path, 'wb') as f:
-            f.write(image_data)
-        
-        # Determine content type
-        content_type = 'image/jpeg'
-        if image_path.endswith('.png'):
-            content_type = 'image/png'
+        storage.save_bytes(f"{result_id}_result.jpg", image_data, original['content_type'])
         
-        return jsonify({
+        response = {
             'success': True,
             'result_id': result_id,
-            'result_image': f"data:{content_type};base64,{image_base64}",
+            'result_url': f"/api/image/results/{result_id}",
             'removed_people': selected_people,
             'message': f'Successfully removed {len(selected_people)} people from the image'
-        })
+        }
+        
+        if _wants_inline():
+            # Determine content type
+            content_type = original['content_type']
+            
+            # Legacy clients still expect the result inlined as a data URI
+            image_base64 = base64.b64encode(image_data).decode('utf-8')
+            response['result_image'] = f"data:{content_type};base64,{image_base64}"
+        
+        if data.get('progressive'):
+            # Same event stream as full mode; the demo has no preview, only the result
+            return Response(_sse_event('result', response), mimetype='text/event-stream', headers=SSE_HEADERS)
+        
+        return jsonify(response)
         
     except Exception as e:
         return jsonify({'error': f'Processing failed: {str(e)}'}), 500
 
+# Proxies must not buffer the stream or the preview arrives with the result
+SSE_HEADERS = {'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+
+def _sse_event(event, payload):
+    return f"event: {event}\ndata: {json.dumps(payload)}\n\n"
+
+@image_bp.route('/images/<file_id>', methods=['GET'])
+def get_image(file_id):
+    """Serve an uploaded image with ETag, Range and conditional GET support"""
+    original = _storage().resolve(file_id)
+    
+    if not original:
+        return jsonify({'error': 'Image file not found'}), 404
+    
+    return send_file(original['path'], mimetype=original['content_type'], max_age=IMAGE_MAX_AGE)
+
+@image_bp.route('/results/<result_id>', methods=['GET'])
+def get_result(result_id):
+    """Serve a processed image inline with ETag, Range and conditional GET support"""
+    result = _storage().lookup(f"{result_id}_result.jpg")
+    
+    if not result:
+        return jsonify({'error': 'Result image not found'}), 404
+    
+    return send_file(result['path'], mimetype=result['content_type'], max_age=IMAGE_MAX_AGE)
+
 @image_bp.route('/download/<result_id>', methods=['GET'])
 def download_result(result_id):
     """Download the processed image"""
     try:
-        upload_dir = os.path.join(current_app.root_path, 'uploads')
-        result_path = os.path.join(upload_dir, f"{result_id}_result.jpg")
+        result_path = _storage().local_path(f"{result_id}_result.jpg")
         
-        if not os.path.exists(result_path):
+        if not result_path:
             return jsonify({'error': 'Result image not found'}), 404
         
-        return send_from_directory(upload_dir, f"{result_id}_result.jpg", as_attachment=True)
+        return send_file(result_path, as_attachment=True)
         
     except Exception as e:
         return jsonify({'error': f'Download failed: {str(e)}'}), 500
@@ -189,7 +249,9 @@ def api_status():
             'upload': '/api/image/upload',
             'detect': '/api/image/detect-people',
             'remove': '/api/image/remove-people',
-            'download': '/api/image/download/<result_id>'
+            'download': '/api/image/download/<result_id>',
+            'image': '/api/image/images/<file_id>',
+            'result': '/api/image/results/<result_id>'
         }
     })
 
@@ -0,0 +1,109 @@
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+
+class QueueFullError(Exception):
+    """Raised when the job queue is at capacity"""
+
+
+class JobQueue:
+    """Bounded background worker pool for long-running image jobs"""
+
+    def __init__(self, max_workers=4, max_pending=32, result_ttl=600, name='jobs'):
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self.result_ttl = result_ttl
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=name)
+        self._jobs = {}
+        self._lock = threading.Lock()
+        self._queued = 0
+        self._running = 0
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+
+    def submit(self, fn, *args, **kwargs):
+        """Queue fn(*args, **kwargs) and return the new job id"""
+        with self._lock:
+            self._evict_expired()
+            if self._queued >= self.max_pending:
+                self.rejected += 1
+                raise QueueFullError(f'{self._queued} jobs already queued')
+            job_id = str(uuid.uuid4())
+            self._jobs[job_id] = {
+                'job_id': job_id,
+                'status': 'queued',
+                'created_at': time.time(),
+                'started_at': None,
+                'finished_at': None,
+                'result': None,
+                'error': None
+            }
+            self._queued += 1
+            self.submitted += 1
+
+        self._executor.submit(self._run, job_id, fn, args, kwargs)
+        return job_id
+
+    def _run(self, job_id, fn, args, kwargs):
+        with self._lock:
+            job = self._jobs[job_id]
+            job['status'] = 'running'
+            job['started_at'] = time.time()
+            self._queued -= 1
+            self._running += 1
+
+        try:
+            result = fn(*args, **kwargs)
+        except Exception as e:
+            print(f"Job {job_id} failed: {e}")
+            with self._lock:
+                job.update(status='failed', error=str(e), finished_at=time.time())
+                self._running -= 1
+                self.failed += 1
+        else:
+            with self._lock:
+                job.update(status='completed', result=result, finished_at=time.time())
+                self._running -= 1
+                self.completed += 1
+
+    def _evict_expired(self):
+        cutoff = time.time() - self.result_ttl
+        expired = [job_id for job_id, job in self._jobs.items()
+                   if job['finished_at'] is not None and job['finished_at'] < cutoff]
+        for job_id in expired:
+            del self._jobs[job_id]
+
+    def get(self, job_id):
+        """Return a snapshot of the job, or None if it is unknown or expired"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return dict(job) if job else None
+
+    def metrics(self):
+        """Return queue depth and throughput counters"""
+        with self._lock:
+            return {
+                'max_workers': self.max_workers,
+                'max_pending': self.max_pending,
+                'queue_depth': self._queued,
+                'running': self._running,
+                'submitted': self.submitted,
+                'completed': self.completed,
+                'failed': self.failed,
+                'rejected': self.rejected
+            }
+
+
+def create_job_queue(name):
+    """Create a job queue sized from environment settings"""
+    return JobQueue(
+        max_workers=int(os.getenv('JOB_WORKERS', '4')),
+        max_pending=int(os.getenv('JOB_QUEUE_LIMIT', '32')),
+        result_ttl=int(os.getenv('JOB_RESULT_TTL', '600')),
+        name=name
+    )
@@ -0,0 +1,268 @@
+import os
+import threading
+import time
+
+from src.services.startup import LazyModule
+
+np = LazyModule('numpy')
+Image = LazyModule('PIL.Image')
+
+# Only needed for DETECTOR_BACKEND=local or DETECTION_FALLBACK=local, and loaded
+# with the model rather than at startup
+onnxruntime = LazyModule('onnxruntime')
+
+PERSON_CLASS = 0
+# Letterbox padding grey used by YOLO training pipelines
+LETTERBOX_FILL = 114 / 255.0
+
+
+def letterbox_into(image_path, out, size):
+    """Decode an image straight into a preallocated (3, size, size) float32 slot
+
+    Returns (scale, pad_x, pad_y, width, height) for mapping boxes back.
+    """
+    with Image.open(image_path) as img:
+        width, height = img.size
+        scale = min(size / float(width), size / float(height))
+        target = (max(1, round(width * scale)), max(1, round(height * scale)))
+        if img.format == 'JPEG':
+            # Let libjpeg decode at 1/2, 1/4 or 1/8 scale instead of full resolution
+            img.draft('RGB', target)
+        image = img.convert('RGB')
+
+    if image.size != target:
+        image = image.resize(target, Image.BILINEAR, reducing_gap=2.0)
+
+    pad_x, pad_y = (size - target[0]) // 2, (size - target[1]) // 2
+    out.fill(LETTERBOX_FILL)
+    np.multiply(
+        np.asarray(image).transpose(2, 0, 1), np.float32(1 / 255.0),
+        out=out[:, pad_y:pad_y + target[1], pad_x:pad_x + target[0]]
+    )
+    return scale, pad_x, pad_y, width, height
+
+
+def nms(boxes, scores, iou_threshold=0.45, max_detections=100):
+    """Greedy non-maximum suppression over (N, 4) xyxy boxes, returning kept indices"""
+    x0, y0, x1, y1 = boxes.T
+    areas = (x1 - x0) * (y1 - y0)
+    order = np.argsort(-scores)
+    keep = []
+    while order.size and len(keep) < max_detections:
+        best, rest = order[0], order[1:]
+        keep.append(best)
+        # IoU of the best box against every remaining box at once
+        overlap_w = np.clip(np.minimum(x1[best], x1[rest]) - np.maximum(x0[best], x0[rest]), 0, None)
+        overlap_h = np.clip(np.minimum(y1[best], y1[rest]) - np.maximum(y0[best], y0[rest]), 0, None)
+        intersection = overlap_w * overlap_h
+        iou = intersection / (areas[best] + areas[rest] - intersection + 1e-9)
+        order = rest[iou <= iou_threshold]
+    return np.asarray(keep, dtype=np.intp)
+
+
+class _Batch:
+    __slots__ = ('tensor', 'created', 'reserved', 'filled', 'meta', 'results', 'closed', 'done')
+
+    def __init__(self, tensor):
+        self.tensor = tensor
+        self.created = time.monotonic()
+        self.reserved = 0
+        self.filled = 0
+        self.meta = []
+        self.results = []
+        self.closed = False
+        self.done = threading.Event()
+
+
+class OnnxPersonDetector:
+    """YOLO-family ONNX person detector that batches concurrent requests
+
+    Expects a YOLOv8/YOLO11-style export: input (batch, 3, size, size) RGB in
+    [0, 1], output (batch, 4 + classes, anchors) with centre-format boxes.
+    Callers arriving within batch_wait of each other share one inference call:
+    each decodes its own image into a slot of a preallocated input tensor, and
+    the first caller of the batch runs the model for all of them.
+    """
+
+    def __init__(self, session, input_size=640, max_batch=8, batch_wait=0.005, conf_threshold=0.35,
+                 iou_threshold=0.45, max_detections=100, parallel_batches=2):
+        self.session = session
+        model_input = session.get_inputs()[0]
+        self.input_name = model_input.name
+        batch_dim, _, height, width = model_input.shape
+        # Fixed-shape exports dictate the batch and input size
+        self.fixed_batch = batch_dim if isinstance(batch_dim, int) else None
+        self.input_size = height if isinstance(height, int) else input_size
+        self.max_batch = self.fixed_batch or max_batch
+        self.batch_wait = batch_wait
+        self.conf_threshold = conf_threshold
+        self.iou_threshold = iou_threshold
+        self.max_detections = max_detections
+
+        # Preallocated input tensors, reused by every batch
+        shape = (self.max_batch, 3, self.input_size, self.input_size)
+        self._free = [np.empty(shape, dtype=np.float32) for _ in range(parallel_batches)]
+        self._open = None
+        self._cond = threading.Condition()
+        self.batches = 0
+        self.images = 0
+        self.inference_seconds = 0.0
+
+    def detect(self, image_path):
+        """Return people in percentage-box format for one image"""
+        batch, slot = self._reserve()
+        try:
+            meta = letterbox_into(image_path, batch.tensor[slot], self.input_size)
+        except Exception as e:
+            meta = e
+        with self._cond:
+            batch.meta[slot] = meta
+            batch.filled += 1
+            self._cond.notify_all()
+
+        if slot == 0:
+            self._run(batch)
+        else:
+            batch.done.wait()
+
+        result = batch.results[slot]
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    def _reserve(self):
+        with self._cond:
+            while True:
+                batch = self._open
+                if batch is not None and not batch.closed and batch.reserved < self.max_batch:
+                    break
+                if self._free:
+                    batch = self._open = _Batch(self._free.pop())
+                    break
+                self._cond.wait()
+            slot = batch.reserved
+            batch.reserved += 1
+            batch.meta.append(None)
+            if batch.reserved == self.max_batch:
+                batch.closed = True
+                self._cond.notify_all()
+            return batch, slot
+
+    def _run(self, batch):
+        # Called by the batch leader: wait for company, then for every reserved slot to be filled
+        with self._cond:
+            while not batch.closed:
+                remaining = batch.created + self.batch_wait - time.monotonic()
+                if remaining <= 0:
+                    batch.closed = True
+                    break
+                self._cond.wait(remaining)
+            if self._open is batch:
+                self._open = None
+            while batch.filled < batch.reserved:
+                self._cond.wait()
+            count = batch.reserved
+
+        try:
+            start = time.perf_counter()
+            tensor = batch.tensor if self.fixed_batch else batch.tensor[:count]
+            output = self.session.run(None, {self.input_name: tensor})[0]
+            elapsed = time.perf_counter() - start
+            batch.results = [
+                meta if isinstance(meta, Exception) else self._decode(output[i], meta)
+                for i, meta in enumerate(batch.meta)
+            ]
+            with self._cond:
+                self.batches += 1
+                self.images += count
+                self.inference_seconds += elapsed
+        except Exception as e:
+            batch.results = [e] * count
+        finally:
+            with self._cond:
+                self._free.append(batch.tensor)
+                self._cond.notify_all()
+            batch.done.set()
+
+    def _decode(self, prediction, meta):
+        """Turn one image's raw output into percentage boxes like RoboflowPersonDetector"""
+        scale, pad_x, pad_y, width, height = meta
+        if prediction.shape[0] > prediction.shape[1]:
+            prediction = prediction.T
+        scores = prediction[4 + PERSON_CLASS]
+        candidates = np.nonzero(scores >= self.conf_threshold)[0]
+        if not candidates.size:
+            return []
+
+        cx, cy, w, h = prediction[:4, candidates]
+        boxes = np.stack([cx - w / 2, cy - h / 2, cx + w / 2, cy + h / 2], axis=1)
+        # Undo the letterbox, then clip to the original image
+        boxes -= np.array([pad_x, pad_y, pad_x, pad_y], dtype=boxes.dtype)
+        boxes /= scale
+        np.clip(boxes, 0, [width, height, width, height], out=boxes)
+        scores = scores[candidates]
+        # Boxes that were entirely in the padding collapse to nothing
+        visible = (boxes[:, 2] > boxes[:, 0]) & (boxes[:, 3] > boxes[:, 1])
+        boxes, scores = boxes[visible], scores[visible]
+        if not scores.size:
+            return []
+        keep = nms(boxes, scores, self.iou_threshold, self.max_detections)
+
+        people = []
+        for i, index in enumerate(keep):
+            x0, y0, x1, y1 = boxes[index]
+            people.append({
+                'id': i + 1,
+                'x': float(x0 / width * 100),
+                'y': float(y0 / height * 100),
+                'width': float((x1 - x0) / width * 100),
+                'height': float((y1 - y0) / height * 100),
+                'confidence': float(scores[index])
+            })
+        return people
+
+    def stats(self):
+        with self._cond:
+            return {
+                'batches': self.batches,
+                'images': self.images,
+                'avg_batch_size': (self.images / self.batches) if self.batches else None,
+                'avg_inference_ms': (self.inference_seconds / self.batches * 1000) if self.batches else None
+            }
+
+
+_detectors = {}
+_detectors_lock = threading.Lock()
+
+
+def get_local_detector(model_path):
+    """Return the process-wide detector for a model, loading it on first use"""
+    detector = _detectors.get(model_path)
+    if detector is not None:
+        return detector
+    with _detectors_lock:
+        detector = _detectors.get(model_path)
+        if detector is None:
+            if not onnxruntime.available:
+                raise RuntimeError('The local person detector requires the onnxruntime package')
+            options = onnxruntime.SessionOptions()
+            threads = int(os.getenv('LOCAL_DETECTOR_THREADS', '0'))  # 0 lets ONNX Runtime use every core
+            options.intra_op_num_threads = threads
+            options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+            session = onnxruntime.InferenceSession(
+                model_path, sess_options=options, providers=['CPUExecutionProvider']
+            )
+            detector = OnnxPersonDetector(
+                session,
+                input_size=int(os.getenv('LOCAL_DETECTOR_INPUT_SIZE', '640')),
+                max_batch=int(os.getenv('LOCAL_DETECTOR_BATCH', '8')),
+                batch_wait=float(os.getenv('LOCAL_DETECTOR_BATCH_WAIT_MS', '5')) / 1000.0,
+                conf_threshold=float(os.getenv('LOCAL_DETECTOR_CONFIDENCE', '0.35'))
+            )
+            _detectors[model_path] = detector
+        return detector
+
+
+def peek_local_detector(model_path):
+    """Return the detector for a model if it has been loaded, without loading it"""
+    return _detectors.get(model_path)
@@ -0,0 +1,90 @@
+from src.services.mask_engine import mask_bounds
+from src.services.startup import LazyModule
+
+np = LazyModule('numpy')
+
+# OpenCV is optional (the NumPy solver is always available) and slow to import,
+# so it loads on the first fill
+cv2 = LazyModule('cv2')
+
+
+def inpaint_array(image, mask, method='telea', radius=5):
+    """Fill masked pixels of an HxWx3 uint8 array, returning a new array"""
+    bounds = mask_bounds(mask, margin=max(radius * 4, 16))
+    if bounds is None:
+        return image.copy()
+
+    # Only the area around the mask influences the fill, so work on that crop
+    x0, y0, x1, y1 = bounds
+    region = np.ascontiguousarray(image[y0:y1, x0:x1])
+    region_mask = np.ascontiguousarray((mask[y0:y1, x0:x1] > 0).astype(np.uint8) * 255)
+
+    if cv2.available:
+        flags = cv2.INPAINT_NS if method == 'ns' else cv2.INPAINT_TELEA
+        filled = cv2.inpaint(region, region_mask, radius, flags)
+    else:
+        iterations = 60 if method == 'ns' else 30
+        filled = diffusion_inpaint(region, region_mask > 0, iterations=iterations)
+
+    result = image.copy()
+    result[y0:y1, x0:x1] = filled
+    return result
+
+
+def diffusion_inpaint(image, mask, iterations=30, min_size=16):
+    """Multi-scale harmonic fill of masked pixels in pure NumPy
+
+    The hole is first solved on a coarse pyramid level where a few Jacobi
+    iterations propagate colour across it, then refined level by level.
+    """
+    image = image.astype(np.float32)
+    levels = [(image, mask)]
+    while min(levels[-1][1].shape) > min_size and levels[-1][1].any():
+        levels.append(_downsample(*levels[-1]))
+
+    coarse, coarse_mask = levels[-1]
+    known = ~coarse_mask
+    fill = coarse[known].mean(axis=0) if known.any() else np.full(3, 127.0, dtype=np.float32)
+    current = np.where(coarse_mask[..., None], fill, coarse)
+    current = _relax(current, coarse_mask, iterations)
+
+    for level_image, level_mask in reversed(levels[:-1]):
+        upsampled = _upsample(current, level_mask.shape)
+        current = np.where(level_mask[..., None], upsampled, level_image)
+        current = _relax(current, level_mask, iterations)
+
+    return np.clip(current + 0.5, 0, 255).astype(np.uint8)
+
+
+def _downsample(image, mask):
+    # Average only known pixels in each 2x2 block; a block stays unknown if all of it is
+    height, width = mask.shape
+    height, width = height - height % 2, width - width % 2
+    weights = (~mask[:height, :width]).astype(np.float32)
+    weighted = image[:height, :width] * weights[..., None]
+    block_sum = weighted.reshape(height // 2, 2, width // 2, 2, 3).sum(axis=(1, 3))
+    block_weight = weights.reshape(height // 2, 2, width // 2, 2).sum(axis=(1, 3))
+    coarse_mask = block_weight == 0
+    coarse = block_sum / np.maximum(block_weight, 1)[..., None]
+    return coarse, coarse_mask
+
+
+def _upsample(image, shape):
+    height, width = shape
+    upsampled = image.repeat(2, axis=0).repeat(2, axis=1)
+    pad_y, pad_x = max(0, height - upsampled.shape[0]), max(0, width - upsampled.shape[1])
+    if pad_y or pad_x:
+        upsampled = np.pad(upsampled, ((0, pad_y), (0, pad_x), (0, 0)), mode='edge')
+    return upsampled[:height, :width]
+
+
+def _relax(image, mask, iterations):
+    # Jacobi iterations of the Laplace equation, updating masked pixels only
+    if not mask.any():
+        return image
+    selector = mask[..., None]
+    for _ in range(iterations):
+        padded = np.pad(image, ((1, 1), (1, 1), (0, 0)), mode='edge')
+        average = (padded[:-2, 1:-1] + padded[2:, 1:-1] + padded[1:-1, :-2] + padded[1:-1, 2:]) * 0.25
+        image = np.where(selector, average, image)
+    return image
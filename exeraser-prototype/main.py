@@ -1,13 +1,21 @@
 import os
 import sys
+import threading
 # DON'T CHANGE THIS !!!
 sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
 
+# First, so startup timing covers every other import
+from src.services.startup import mark_ready
 from flask import Flask, send_from_directory
 from flask_cors import CORS
 from src.models.user import db
 from src.routes.user import user_bp
-from src.routes.image_simple import image_bp
+# EXERASE_AI_MODE=full serves the real AI pipeline instead of the demo routes
+if os.getenv('EXERASE_AI_MODE') == 'full':
+    from src.routes.image import image_bp
+else:
+    from src.routes.image_simple import image_bp
+from src.services.metrics import metrics_bp
 
 app = Flask(__name__, static_folder=os.path.join(os.path.dirname(__file__), 'static'))
 app.config['SECRET_KEY'] = 'asdf#FGSgvasgf$5$WGT'
@@ -16,16 +24,28 @@ app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max file size
 # Enable CORS for all routes
 CORS(app, origins="*")
 
+# Tables are created by the first user API request, not on every cold start
+_tables_created = False
+_tables_lock = threading.Lock()
+
+@user_bp.before_request
+def _create_tables():
+    global _tables_created
+    if not _tables_created:
+        with _tables_lock:
+            if not _tables_created:
+                db.create_all()
+                _tables_created = True
+
 # Register blueprints
 app.register_blueprint(user_bp, url_prefix='/api')
 app.register_blueprint(image_bp, url_prefix='/api/image')
+app.register_blueprint(metrics_bp)
 
 # uncomment if you need to use database
 app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{os.path.join(os.path.dirname(__file__), 'database', 'app.db')}"
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 db.init_app(app)
-with app.app_context():
-    db.create_all()
 
 @app.route('/', defaults={'path': ''})
 @app.route('/<path:path>')
@@ -44,5 +64,7 @@ def serve(path):
             return "index.html not found", 404
 
 
+mark_ready('wsgi')
+
 if __name__ == '__main__':
     app.run(host='0.0.0.0', port=5000, debug=True)
@@ -0,0 +1,158 @@
+import hashlib
+from io import BytesIO
+
+from src.services.startup import LazyModule
+
+np = LazyModule('numpy')
+Image = LazyModule('PIL.Image')
+ImageDraw = LazyModule('PIL.ImageDraw')
+ImageFilter = LazyModule('PIL.ImageFilter')
+
+
+def percent_boxes_to_pixels(people, width, height):
+    """Convert percentage boxes to clipped integer pixel boxes (x0, y0, x1, y1)"""
+    if not people:
+        return np.empty((0, 4), dtype=np.int64)
+    boxes = np.array(
+        [[p['x'], p['y'], p['x'] + p['width'], p['y'] + p['height']] for p in people],
+        dtype=np.float64
+    )
+    boxes *= np.array([width, height, width, height], dtype=np.float64) / 100.0
+    boxes = np.floor(boxes).astype(np.int64)
+    # Rectangles have always been drawn inclusive of their far edge
+    boxes[:, 2:] += 1
+    np.clip(boxes, 0, [width, height, width, height], out=boxes)
+    return boxes
+
+
+def percent_polygon_to_pixels(points, width, height):
+    """Convert a polygon given as [[x%, y%], ...] to pixel coordinates"""
+    points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+    return points * (np.array([width, height], dtype=np.float64) / 100.0)
+
+
+def build_mask(width, height, boxes=None, polygons=None, segments=None, dilate=0, feather=0):
+    """Build a single-channel uint8 mask (255 = remove) from boxes, polygons and segments
+
+    boxes are pixel (x0, y0, x1, y1) rows, polygons are pixel point arrays and
+    segments are (x, y, array) tuples whose non-zero pixels are placed at x, y.
+    """
+    mask = np.zeros((height, width), dtype=np.uint8)
+
+    if boxes is not None and len(boxes):
+        boxes = np.asarray(boxes, dtype=np.int64)
+        if dilate:
+            boxes = boxes + np.array([-dilate, -dilate, dilate, dilate])
+            np.clip(boxes, 0, [width, height, width, height], out=boxes)
+        # Each fill is a single memset over the box rows, much cheaper than
+        # broadcasting every box over the full image
+        for x0, y0, x1, y1 in boxes:
+            mask[y0:y1, x0:x1] = 255
+
+    region_masks = []
+    for points in polygons or []:
+        region_masks.append(_rasterize_polygon(points, width, height))
+    for x, y, array in segments or []:
+        region_masks.append((int(x), int(y), (np.asarray(array) > 0).astype(np.uint8) * 255))
+
+    for x, y, region in region_masks:
+        if dilate:
+            x, y, region = _dilate(x, y, region, dilate, width, height)
+        _paste_max(mask, x, y, region)
+
+    if feather:
+        mask = feather_mask(mask, feather)
+
+    return mask
+
+
+def feather_mask(mask, radius):
+    """Soften mask edges with a Gaussian blur, touching only the masked area"""
+    bounds = mask_bounds(mask, margin=radius * 3)
+    if bounds is None:
+        return mask
+    x0, y0, x1, y1 = bounds
+    region = Image.fromarray(mask[y0:y1, x0:x1], 'L')
+    mask[y0:y1, x0:x1] = np.asarray(region.filter(ImageFilter.GaussianBlur(radius)))
+    return mask
+
+
+def mask_bounds(mask, margin=0):
+    """Return the (x0, y0, x1, y1) bounding box of non-zero pixels, or None"""
+    rows = np.flatnonzero(mask.any(axis=1))
+    if not len(rows):
+        return None
+    cols = np.flatnonzero(mask.any(axis=0))
+    height, width = mask.shape
+    return (
+        max(0, int(cols[0]) - margin),
+        max(0, int(rows[0]) - margin),
+        min(width, int(cols[-1]) + 1 + margin),
+        min(height, int(rows[-1]) + 1 + margin)
+    )
+
+
+def encode_mask_png(mask):
+    """Encode a mask as PNG bytes in memory"""
+    buffer = BytesIO()
+    # Masks are mostly flat runs, so the fastest zlib level is nearly as small
+    Image.fromarray(mask, 'L').save(buffer, format='PNG', compress_level=1)
+    return buffer.getvalue()
+
+
+def mask_hash(mask):
+    """Return a canonical hash of a mask's pixels"""
+    mask = np.ascontiguousarray(mask)
+    digest = hashlib.sha256(f"{mask.dtype}:{mask.shape[1]}x{mask.shape[0]}:".encode('utf-8'))
+    digest.update(memoryview(mask).cast('B'))
+    return digest.hexdigest()
+
+
+def _rasterize_polygon(points, width, height):
+    # Draw only within the polygon's bounding box instead of a full-size canvas
+    points = np.asarray(points, dtype=np.float64)
+    x0 = max(0, int(np.floor(points[:, 0].min())))
+    y0 = max(0, int(np.floor(points[:, 1].min())))
+    x1 = min(width, int(np.ceil(points[:, 0].max())) + 1)
+    y1 = min(height, int(np.ceil(points[:, 1].max())) + 1)
+    if x1 <= x0 or y1 <= y0:
+        return x0, y0, np.zeros((0, 0), dtype=np.uint8)
+    canvas = Image.new('L', (x1 - x0, y1 - y0), 0)
+    shifted = [(float(px) - x0, float(py) - y0) for px, py in points]
+    ImageDraw.Draw(canvas).polygon(shifted, fill=255)
+    return x0, y0, np.asarray(canvas)
+
+
+def _dilate(x, y, region, radius, width, height):
+    # Grow the region canvas so dilation can spill past its original bounds
+    padded = np.pad(region, radius)
+    x -= radius
+    y -= radius
+    for axis in (0, 1):
+        padded = _max_filter_1d(padded, radius, axis)
+    return x, y, padded
+
+
+def _max_filter_1d(array, radius, axis):
+    # Windowed maximum of width 2 * radius + 1 using log-doubling passes
+    size = 2 * radius + 1
+    padded = np.pad(array, [(radius, radius) if a == axis else (0, 0) for a in range(2)])
+    out = padded if axis == 0 else padded.T
+    covered = 1
+    while covered < size:
+        step = min(covered, size - covered)
+        np.maximum(out[:-step], out[step:], out=out[:-step])
+        covered += step
+    length = array.shape[axis]
+    return out[:length] if axis == 0 else out[:length].T
+
+
+def _paste_max(mask, x, y, region):
+    height, width = mask.shape
+    rh, rw = region.shape
+    dx0, dy0 = max(0, x), max(0, y)
+    dx1, dy1 = min(width, x + rw), min(height, y + rh)
+    if dx1 <= dx0 or dy1 <= dy0:
+        return
+    src = region[dy0 - y:dy1 - y, dx0 - x:dx1 - x]
+    np.maximum(mask[dy0:dy1, dx0:dx1], src, out=mask[dy0:dy1, dx0:dx1])
@@ -0,0 +1,250 @@
+import os
+import sys
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+from flask import Blueprint, Response, g, has_request_context, request
+
+try:
+    from opentelemetry import trace as otel_trace
+except ImportError:  # Tracing is optional, metrics work without it
+    otel_trace = None
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+class Histogram:
+    """Thread-safe Prometheus histogram with a fixed label set"""
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(str(labels.get(name, '')) for name in self.labelnames)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = {'counts': [0] * len(self.buckets), 'sum': 0.0, 'count': 0}
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series['counts'][i] += 1
+            series['sum'] += value
+            series['count'] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = {key: (list(s['counts']), s['sum'], s['count']) for key, s in self._series.items()}
+        for key, (counts, total, count) in sorted(series.items()):
+            base = list(zip(self.labelnames, key))
+            for bound, bucket_count in zip(self.buckets, counts):
+                lines.append(f"{self.name}_bucket{_labels(base + [('le', _float(bound))])} {bucket_count}")
+            lines.append(f"{self.name}_bucket{_labels(base + [('le', '+Inf')])} {count}")
+            lines.append(f"{self.name}_sum{_labels(base)} {total}")
+            lines.append(f"{self.name}_count{_labels(base)} {count}")
+        return '\n'.join(lines)
+
+
+class Counter:
+    """Thread-safe Prometheus counter with a fixed label set"""
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(str(labels.get(name, '')) for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            values = dict(self._values)
+        for key, value in sorted(values.items()):
+            lines.append(f"{self.name}{_labels(list(zip(self.labelnames, key)))} {value}")
+        return '\n'.join(lines)
+
+
+def _labels(pairs):
+    if not pairs:
+        return ''
+    escaped = [(k, str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')) for k, v in pairs]
+    return '{' + ','.join(f'{k}="{v}"' for k, v in escaped) + '}'
+
+
+def _float(value):
+    return repr(float(value))
+
+
+STAGE_DURATION = Histogram(
+    'exeraser_stage_duration_seconds',
+    'Time spent in each image pipeline stage',
+    ('stage',)
+)
+VENDOR_REQUEST_DURATION = Histogram(
+    'exeraser_vendor_request_duration_seconds',
+    'Latency of AI vendor HTTP calls, including retries',
+    ('vendor', 'outcome')
+)
+VENDOR_ERRORS = Counter(
+    'exeraser_vendor_errors_total',
+    'AI vendor calls that failed or returned an error status',
+    ('vendor',)
+)
+HTTP_REQUEST_DURATION = Histogram(
+    'exeraser_http_request_duration_seconds',
+    'End-to-end API request latency',
+    ('endpoint', 'method', 'status')
+)
+ADMISSION_WAIT = Histogram(
+    'exeraser_admission_wait_seconds',
+    'Time admitted calls queued for a backend concurrency slot',
+    ('backend', 'priority')
+)
+ADMISSION_REJECTED = Counter(
+    'exeraser_admission_rejected_total',
+    'Requests rejected with 429 by client rate limits or load shedding',
+    ('backend', 'priority')
+)
+CPU_TASK_DURATION = Histogram(
+    'exeraser_cpu_task_seconds',
+    'CPU pool tasks: time running in a worker, and time waiting for one (including transfer)',
+    ('task', 'phase')
+)
+
+REGISTRY = [
+    STAGE_DURATION, VENDOR_REQUEST_DURATION, VENDOR_ERRORS, HTTP_REQUEST_DURATION,
+    ADMISSION_WAIT, ADMISSION_REJECTED, CPU_TASK_DURATION
+]
+
+_tracer = otel_trace.get_tracer('exeraser') if otel_trace and os.getenv('OTEL_TRACING', '0') == '1' else None
+
+
+@contextmanager
+def span(stage, **attributes):
+    """Time a pipeline stage into the stage histogram (and an OpenTelemetry span if enabled)"""
+    start = time.perf_counter()
+    otel_span = _tracer.start_as_current_span(stage, attributes=attributes) if _tracer else None
+    if otel_span is not None:
+        otel_span.__enter__()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        if otel_span is not None:
+            otel_span.__exit__(None, None, None)
+        STAGE_DURATION.observe(elapsed, stage=stage)
+        request_globals = _request_globals()
+        if request_globals is not None:
+            spans = request_globals.setdefault('stage_timings', {})
+            spans[stage] = spans.get(stage, 0.0) + elapsed
+
+
+def _request_globals():
+    # Flask's g, or Quart's when serving through the ASGI app
+    if has_request_context():
+        return g
+    quart = sys.modules.get('quart')
+    # Another thread may still be importing quart; a half-initialized module has no context
+    has_quart_context = getattr(quart, 'has_request_context', None)
+    if has_quart_context is not None and has_quart_context():
+        return quart.g
+    return None
+
+
+def record_vendor_call(vendor, elapsed, failed):
+    """Record one vendor HTTP call"""
+    VENDOR_REQUEST_DURATION.observe(elapsed, vendor=vendor, outcome='error' if failed else 'ok')
+    if failed:
+        VENDOR_ERRORS.inc(vendor=vendor)
+
+
+def record_admission(backend, priority, waited, admitted):
+    """Record one admission decision ('client' is the per-client rate limiter)"""
+    if admitted:
+        ADMISSION_WAIT.observe(waited, backend=backend, priority=priority)
+    else:
+        ADMISSION_REJECTED.inc(backend=backend, priority=priority)
+
+
+def record_cpu_task(task, run_seconds, wait_seconds):
+    """Record one task handed to the CPU worker pool"""
+    CPU_TASK_DURATION.observe(run_seconds, task=task, phase='run')
+    CPU_TASK_DURATION.observe(wait_seconds, task=task, phase='wait')
+
+
+def instrument_blueprint(blueprint):
+    """Attach request ids, request timing and a Server-Timing header to a blueprint"""
+
+    @blueprint.before_request
+    def _start_request():
+        _start(g, request)
+
+    @blueprint.after_request
+    def _finish_request(response):
+        return _finish(g, request, response)
+
+    return blueprint
+
+
+def instrument_async_blueprint(blueprint):
+    """instrument_blueprint for Quart blueprints served by the ASGI app"""
+    from quart import g as quart_g, request as quart_request
+
+    @blueprint.before_request
+    async def _start_request():
+        _start(quart_g, quart_request)
+
+    @blueprint.after_request
+    async def _finish_request(response):
+        return _finish(quart_g, quart_request, response)
+
+    return blueprint
+
+
+def _start(request_globals, current_request):
+    request_globals.request_id = current_request.headers.get('X-Request-ID') or str(uuid.uuid4())
+    request_globals.request_start = time.perf_counter()
+
+
+def _finish(request_globals, current_request, response):
+    elapsed = time.perf_counter() - request_globals.get('request_start', time.perf_counter())
+    HTTP_REQUEST_DURATION.observe(
+        elapsed, endpoint=current_request.endpoint or 'unknown', method=current_request.method,
+        status=response.status_code
+    )
+    response.headers['X-Request-ID'] = request_globals.get('request_id', '')
+    timings = request_globals.get('stage_timings')
+    if timings:
+        response.headers['Server-Timing'] = ', '.join(
+            f"{stage};dur={seconds * 1000:.1f}" for stage, seconds in timings.items()
+        )
+    return response
+
+
+METRICS_CONTENT_TYPE = 'text/plain; version=0.0.4'
+
+
+def render_metrics():
+    """Return every registered metric in the Prometheus text format"""
+    return '\n'.join(metric.render() for metric in REGISTRY) + '\n'
+
+
+metrics_bp = Blueprint('metrics', __name__)
+
+
+@metrics_bp.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    """Prometheus text exposition of all pipeline metrics"""
+    return Response(render_metrics(), mimetype=METRICS_CONTENT_TYPE)
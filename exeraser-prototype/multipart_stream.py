@@ -0,0 +1,98 @@
+import os
+import uuid
+from bisect import bisect_right
+
+CHUNK_SIZE = 256 * 1024
+
+
+class StreamingMultipart:
+    """Seekable multipart/form-data request body that never materializes file parts
+
+    files follows requests' {'field': (filename, content, content_type)} form;
+    content may be bytes (referenced, not copied) or an os.PathLike whose file
+    is read from disk in chunks while the request is sent. Seeking lets
+    urllib3 rewind the body when it retries.
+    """
+
+    def __init__(self, data=None, files=None, boundary=None):
+        self.boundary = boundary or uuid.uuid4().hex
+        self.content_type = f"multipart/form-data; boundary={self.boundary}"
+        self._parts = []
+        for field, value in (data or {}).items():
+            self._add_bytes(self._part_header(field))
+            self._add_bytes(str(value).encode('utf-8') + b'\r\n')
+        for field, (filename, content, content_type) in (files or {}).items():
+            self._add_bytes(self._part_header(field, filename, content_type))
+            if isinstance(content, os.PathLike):
+                self._parts.append((os.fspath(content), os.path.getsize(content)))
+            else:
+                self._parts.append((memoryview(content), len(content)))
+            self._add_bytes(b'\r\n')
+        self._add_bytes(f"--{self.boundary}--\r\n".encode('ascii'))
+
+        self._starts = []
+        offset = 0
+        for _, length in self._parts:
+            self._starts.append(offset)
+            offset += length
+        self._length = offset
+        self._position = 0
+        self._files = {}
+
+    def _part_header(self, field, filename=None, content_type=None):
+        disposition = f'form-data; name="{field}"'
+        if filename is not None:
+            disposition += f'; filename="{filename}"'
+        header = f"--{self.boundary}\r\nContent-Disposition: {disposition}\r\n"
+        if content_type:
+            header += f"Content-Type: {content_type}\r\n"
+        return (header + "\r\n").encode('utf-8')
+
+    def _add_bytes(self, data):
+        self._parts.append((memoryview(data), len(data)))
+
+    def __len__(self):
+        return self._length
+
+    def __iter__(self):
+        for chunk in iter(lambda: self.read(CHUNK_SIZE), b''):
+            yield chunk
+
+    def tell(self):
+        return self._position
+
+    def seek(self, offset, whence=os.SEEK_SET):
+        if whence == os.SEEK_CUR:
+            offset += self._position
+        elif whence == os.SEEK_END:
+            offset += self._length
+        self._position = max(0, min(self._length, offset))
+        return self._position
+
+    def read(self, size=-1):
+        """Return up to size bytes from the current part (b'' at the end)"""
+        if self._position >= self._length:
+            return b''
+        if size is None or size < 0:
+            size = CHUNK_SIZE
+        index = bisect_right(self._starts, self._position) - 1
+        source, length = self._parts[index]
+        offset = self._position - self._starts[index]
+        count = min(size, length - offset)
+        if isinstance(source, memoryview):
+            chunk = source[offset:offset + count].tobytes()
+        else:
+            handle = self._files.get(index)
+            if handle is None:
+                handle = self._files[index] = open(source, 'rb')
+            handle.seek(offset)
+            chunk = handle.read(count)
+            if not chunk:
+                raise IOError(f"{source} shrank while being sent")
+        self._position += len(chunk)
+        return chunk
+
+    def close(self):
+        for handle in self._files.values():
+            handle.close()
+        self._files.clear()
@@ -0,0 +1,72 @@
+import math
+from io import BytesIO
+
+from src.services.mask_engine import build_mask, mask_bounds
+from src.services.startup import LazyModule
+
+np = LazyModule('numpy')
+Image = LazyModule('PIL.Image')
+
+
+def region_bounds(mask, margin_ratio=0.25, min_margin=32, max_area_ratio=0.6):
+    """Return the masked area plus context margin, or None when cropping would not help"""
+    bounds = mask_bounds(mask)
+    if bounds is None:
+        return None
+    height, width = mask.shape
+    x0, y0, x1, y1 = bounds
+    margin_x = max(min_margin, int((x1 - x0) * margin_ratio))
+    margin_y = max(min_margin, int((y1 - y0) * margin_ratio))
+    x0, y0 = max(0, x0 - margin_x), max(0, y0 - margin_y)
+    x1, y1 = min(width, x1 + margin_x), min(height, y1 + margin_y)
+    if (x1 - x0) * (y1 - y0) > max_area_ratio * width * height:
+        return None
+    return x0, y0, x1, y1
+
+
+def budget_scale(width, height, max_pixels):
+    """Return the downscale factor (<= 1) that fits width x height into max_pixels"""
+    if not max_pixels or width * height <= max_pixels:
+        return 1.0
+    return math.sqrt(max_pixels / float(width * height))
+
+
+def prepare_region(image, mask, bounds, max_pixels):
+    """Crop image and mask to bounds and downscale both to the pixel budget"""
+    x0, y0, x1, y1 = bounds
+    region_image = image.crop(bounds)
+    region_mask = mask[y0:y1, x0:x1]
+
+    scale = budget_scale(x1 - x0, y1 - y0, max_pixels)
+    if scale < 1.0:
+        size = (max(1, int((x1 - x0) * scale)), max(1, int((y1 - y0) * scale)))
+        region_image = region_image.resize(size, Image.LANCZOS, reducing_gap=3.0)
+        # Bilinear plus "any coverage" keeps thin mask strokes from vanishing
+        scaled = Image.fromarray(np.ascontiguousarray(region_mask), 'L').resize(size, Image.BILINEAR)
+        region_mask = np.where(np.asarray(scaled) > 0, 255, 0).astype(np.uint8)
+    return region_image, region_mask
+
+
+def composite_region(image, result_data, mask, bounds, seam_feather=8):
+    """Blend an inpainted region back into the full image with a soft seam"""
+    x0, y0, x1, y1 = bounds
+    size = (x1 - x0, y1 - y0)
+    with Image.open(BytesIO(result_data)) as result:
+        result = result.convert('RGB')
+    if result.size != size:
+        result = result.resize(size, Image.LANCZOS)
+
+    # Grow the mask before blurring so masked pixels are fully replaced and
+    # only the surrounding seam is blended
+    region_mask = np.ascontiguousarray(mask[y0:y1, x0:x1])
+    alpha = build_mask(size[0], size[1], segments=[(0, 0, region_mask)],
+                       dilate=seam_feather, feather=seam_feather)
+    image.paste(result, (x0, y0), Image.fromarray(alpha, 'L'))
+    return image
+
+
+def encode_jpeg(image, quality=95):
+    """Encode an RGB image as JPEG bytes in memory"""
+    buffer = BytesIO()
+    image.save(buffer, format='JPEG', quality=quality)
+    return buffer.getvalue()
@@ -0,0 +1,127 @@
+import asyncio
+import hashlib
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+
+
+class ResultCache:
+    """Memoizes inpainting results and collapses concurrent identical requests"""
+
+    def __init__(self, max_entries=512, validate=None):
+        self.max_entries = max_entries
+        # Cached values point at files that may be deleted behind our back,
+        # so entries are re-checked with validate() before being served.
+        self.validate = validate
+        self._entries = OrderedDict()
+        self._in_flight = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.shared = 0
+
+    @staticmethod
+    def make_key(image_hash, mask_hash, quality_mode):
+        """Build the cache key for an (image, mask, quality mode) combination"""
+        raw = f"{image_hash}:{mask_hash}:{quality_mode}"
+        return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+    def get_or_compute(self, key, compute):
+        """Return (value, source) where source is 'cache', 'shared' or 'computed'
+
+        compute() must return (value, cacheable); uncacheable values are still
+        handed to callers waiting on the same key but are not stored.
+        """
+        value, flight, leader = self._claim(key)
+        if flight is None:
+            return value, 'cache'
+        if not leader:
+            return flight.result(), 'shared'
+
+        try:
+            value, cacheable = compute()
+        except BaseException as e:
+            self._settle(key, flight, exception=e)
+            raise
+        self._settle(key, flight, value, cacheable)
+        return value, 'computed'
+
+    async def get_or_compute_async(self, key, compute):
+        """Awaitable get_or_compute where compute is a coroutine function
+
+        Waiters share in-flight work with threaded callers of get_or_compute.
+        """
+        value, flight, leader = self._claim(key)
+        if flight is None:
+            return value, 'cache'
+        if not leader:
+            return await asyncio.wrap_future(flight), 'shared'
+
+        try:
+            value, cacheable = await compute()
+        except BaseException as e:
+            self._settle(key, flight, exception=e)
+            raise
+        self._settle(key, flight, value, cacheable)
+        return value, 'computed'
+
+    def contains(self, key):
+        """Whether a valid result is cached for key, without counting a lookup"""
+        with self._lock:
+            value = self._entries.get(key)
+        return value is not None and self._valid(value)
+
+    def _valid(self, value):
+        # validate() may go to storage (an S3 round trip), so it is never called under the lock
+        return self.validate is None or self.validate(value)
+
+    def _claim(self, key):
+        # Returns (value, None, False) on a hit, otherwise the in-flight future
+        # and whether this caller leads the computation
+        with self._lock:
+            value = self._entries.get(key)
+        valid = value is not None and self._valid(value)
+
+        with self._lock:
+            if valid:
+                if self._entries.get(key) is value:
+                    self._entries.move_to_end(key)
+                self.hits += 1
+                return value, None, False
+            if value is not None and self._entries.get(key) is value:
+                del self._entries[key]
+
+            flight = self._in_flight.get(key)
+            if flight is not None:
+                self.shared += 1
+                return None, flight, False
+            flight = Future()
+            self._in_flight[key] = flight
+            self.misses += 1
+            return None, flight, True
+
+    def _settle(self, key, flight, value=None, cacheable=False, exception=None):
+        with self._lock:
+            if exception is None and cacheable:
+                self._entries[key] = value
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+            self._in_flight.pop(key, None)
+        if exception is not None:
+            flight.set_exception(exception)
+        else:
+            flight.set_result(value)
+
+    def stats(self):
+        """Return hit/miss/shared counters for the cache"""
+        with self._lock:
+            lookups = self.hits + self.misses + self.shared
+            return {
+                'entries': len(self._entries),
+                'in_flight': len(self._in_flight),
+                'hits': self.hits,
+                'misses': self.misses,
+                'shared': self.shared,
+                'hit_rate': ((self.hits + self.shared) / lookups) if lookups else 0.0
+            }
@@ -0,0 +1,112 @@
+import threading
+from collections import OrderedDict
+
+from src.services.mask_engine import percent_boxes_to_pixels
+from src.services.startup import LazyModule
+
+np = LazyModule('numpy')
+Image = LazyModule('PIL.Image')
+
+# A person's box may move this much (percent of the image) between detection
+# and removal before their cached segment is no longer trusted
+BOX_TOLERANCE = 0.5
+
+
+def split_person_masks(mask, people, width, height, pad_ratio=0.1):
+    """Cut a whole-image person mask into one bit-packed segment per detected person
+
+    mask is a 2-D array covering the full image at any resolution (usually the
+    segmentation model's). Each person keeps only the mask pixels inside their
+    padded box, scaled up to full resolution for that box alone.
+    """
+    mask_height, mask_width = mask.shape
+    scale_x, scale_y = mask_width / float(width), mask_height / float(height)
+    segments = {}
+    for person, (x0, y0, x1, y1) in zip(people, percent_boxes_to_pixels(people, width, height)):
+        pad_x, pad_y = int((x1 - x0) * pad_ratio), int((y1 - y0) * pad_ratio)
+        x0, y0 = max(0, x0 - pad_x), max(0, y0 - pad_y)
+        x1, y1 = min(width, x1 + pad_x), min(height, y1 + pad_y)
+
+        # Mask cells covering the box, and the full-resolution area those cells span
+        mx0, my0 = int(x0 * scale_x), int(y0 * scale_y)
+        mx1 = min(mask_width, int(np.ceil(x1 * scale_x)))
+        my1 = min(mask_height, int(np.ceil(y1 * scale_y)))
+        crop = mask[my0:my1, mx0:mx1]
+        if not crop.size or not crop.any():
+            continue
+        fx0, fy0 = int(round(mx0 / scale_x)), int(round(my0 / scale_y))
+        fx1, fy1 = min(width, int(round(mx1 / scale_x))), min(height, int(round(my1 / scale_y)))
+        if (fx1 - fx0, fy1 - fy0) != (crop.shape[1], crop.shape[0]):
+            crop = np.asarray(Image.fromarray(crop).resize((fx1 - fx0, fy1 - fy0), Image.NEAREST))
+
+        region = crop[max(0, y0 - fy0):y1 - fy0, max(0, x0 - fx0):x1 - fx0] > 0
+        if region.any():
+            segments[person['id']] = pack_segment(max(x0, fx0), max(y0, fy0), region, person)
+    return segments
+
+
+def pack_segment(x, y, region, person):
+    """Store a boolean region at 1 bit per pixel along with the box it was cut for"""
+    height, width = region.shape
+    return {
+        'x': int(x),
+        'y': int(y),
+        'width': width,
+        'height': height,
+        'bits': np.packbits(region, axis=None),
+        'box': tuple(float(person[k]) for k in ('x', 'y', 'width', 'height'))
+    }
+
+
+def unpack_segment(segment):
+    """Return (x, y, uint8 region) for build_mask's segments argument"""
+    count = segment['width'] * segment['height']
+    region = np.unpackbits(segment['bits'], count=count).reshape(segment['height'], segment['width'])
+    return segment['x'], segment['y'], region * np.uint8(255)
+
+
+def segment_matches(segment, person):
+    """Whether a cached segment was cut for (roughly) the box the client sent"""
+    box = tuple(float(person.get(k, -1)) for k in ('x', 'y', 'width', 'height'))
+    return all(abs(a - b) <= BOX_TOLERANCE for a, b in zip(segment['box'], box))
+
+
+class SegmentCache:
+    """LRU of per-person bit-packed segments keyed by image content hash"""
+
+    def __init__(self, max_entries=256):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        """Return {person_id: segment} for an image, or None"""
+        with self._lock:
+            segments = self._entries.get(key)
+            if segments is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return segments
+
+    def set(self, key, segments):
+        with self._lock:
+            self._entries[key] = segments
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def stats(self):
+        with self._lock:
+            packed = sum(
+                segment['bits'].nbytes for segments in self._entries.values() for segment in segments.values()
+            )
+            return {
+                'images': len(self._entries),
+                'bytes': packed,
+                'hits': self.hits,
+                'misses': self.misses
+            }
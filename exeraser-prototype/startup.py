@@ -0,0 +1,72 @@
+import importlib
+import importlib.util
+import os
+import threading
+import time
+
+# Entry points import this module first, so this is close to process start
+_started = time.perf_counter()
+_ready_seconds = {}
+_load_seconds = {}
+_lock = threading.Lock()
+
+
+class LazyModule:
+    """Stand-in for a heavy module that is imported on first attribute access
+
+    Keeps packages only some requests need (ONNX Runtime, OpenCV, aiohttp,
+    requests) and the image stack (NumPy, Pillow) out of cold start. `available` answers whether the module is
+    installed without importing it, for optional dependencies.
+    """
+
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+        self._available = None
+
+    @property
+    def available(self):
+        if self._module is not None:
+            return True
+        if self._available is None:
+            try:
+                self._available = importlib.util.find_spec(self._name) is not None
+            except (ImportError, ValueError):
+                self._available = False
+        return self._available
+
+    def load(self):
+        """Import the module now (once) and return it"""
+        if self._module is None:
+            start = time.perf_counter()
+            module = importlib.import_module(self._name)
+            with _lock:
+                _load_seconds.setdefault(self._name, time.perf_counter() - start)
+            self._module = module
+        return self._module
+
+    def __getattr__(self, attr):
+        return getattr(self.load(), attr)
+
+
+def mark_ready(app_name):
+    """Record how long an app took from startup to being ready to serve
+
+    Warns when that exceeds STARTUP_BUDGET_SECONDS.
+    """
+    elapsed = time.perf_counter() - _started
+    with _lock:
+        _ready_seconds.setdefault(app_name, elapsed)
+    budget = float(os.getenv('STARTUP_BUDGET_SECONDS', '0'))
+    if budget and elapsed > budget:
+        print(f"Startup warning: {app_name} took {elapsed:.2f}s to load, over the {budget:.2f}s budget")
+    return elapsed
+
+
+def startup_stats():
+    """Time to ready per app, and the deferred modules loaded since then"""
+    with _lock:
+        return {
+            'ready_seconds': dict(_ready_seconds),
+            'deferred_imports': dict(_load_seconds)
+        }
@@ -0,0 +1,105 @@
+"""Cold-start import-time report for the backend, with an optional budget gate
+
+Imports an entry module in a fresh interpreter under `python -X importtime`,
+then reports the wall time, the total import time, the packages that cost
+the most, and the slowest first-party modules. Exits non-zero when the total
+import time is over --budget-ms.
+
+    python startup_report.py --project-root /home/ubuntu/exerase-backend --mode full \\
+        --budget-ms 800 --output startup.json
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+from collections import defaultdict
+
+
+def parse_importtime(stderr):
+    """Return [(module, self_us, cumulative_us)] from -X importtime output"""
+    modules = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:'):
+            continue
+        fields = line[len('import time:'):].split('|')
+        # Skips the "self [us] | cumulative | imported package" header
+        if len(fields) != 3 or not fields[0].strip().isdigit():
+            continue
+        self_us, cumulative_us, name = fields
+        modules.append((name.strip(), int(self_us), int(cumulative_us)))
+    return modules
+
+
+def build_report(modules, wall_seconds, top=15):
+    packages = defaultdict(int)
+    for name, self_us, _ in modules:
+        packages[name.split('.', 1)[0]] += self_us
+    first_party = [m for m in modules if m[0].startswith('src.')]
+    return {
+        'wall_ms': wall_seconds * 1000,
+        'import_ms': sum(self_us for _, self_us, _ in modules) / 1000.0,
+        'modules': len(modules),
+        'packages': [
+            {'package': name, 'ms': us / 1000.0}
+            for name, us in sorted(packages.items(), key=lambda item: -item[1])[:top]
+        ],
+        'first_party': [
+            {'module': name, 'self_ms': self_us / 1000.0, 'cumulative_ms': cumulative_us / 1000.0}
+            for name, self_us, cumulative_us in sorted(first_party, key=lambda m: -m[2])[:top]
+        ]
+    }
+
+
+def print_report(report, entry):
+    print(f"{entry}: {report['wall_ms']:.0f} ms wall, {report['import_ms']:.0f} ms in "
+          f"{report['modules']} imports")
+    print('\nSlowest packages (self time)')
+    for row in report['packages']:
+        print(f"  {row['ms']:8.1f} ms  {row['package']}")
+    print('\nFirst-party modules (cumulative, including what they import)')
+    for row in report['first_party']:
+        print(f"  {row['cumulative_ms']:8.1f} ms  {row['module']}")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--project-root', default='.', help='directory containing the src package')
+    parser.add_argument('--entry', default='src.main', help='module to import (e.g. src.main or src.asgi)')
+    parser.add_argument('--mode', default='full', choices=['full', 'demo'], help='EXERASE_AI_MODE to import with')
+    parser.add_argument('--top', type=int, default=15, help='rows per table')
+    parser.add_argument('--budget-ms', type=float, help='fail when total import time exceeds this')
+    parser.add_argument('--output', help='also write the JSON report here')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    env = dict(os.environ, EXERASE_AI_MODE='full' if args.mode == 'full' else '')
+    start = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f"import {args.entry}"],
+        cwd=args.project_root, env=env, capture_output=True, text=True
+    )
+    wall_seconds = time.perf_counter() - start
+    if result.returncode != 0:
+        print(result.stderr.splitlines()[-1] if result.stderr else 'import failed', file=sys.stderr)
+        return 2
+
+    report = build_report(parse_importtime(result.stderr), wall_seconds, args.top)
+    report['entry'] = args.entry
+    report['mode'] = args.mode
+    print_report(report, args.entry)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+
+    if args.budget_ms and report['import_ms'] > args.budget_ms:
+        print(f"OVER BUDGET: {report['import_ms']:.0f} ms > {args.budget_ms:.0f} ms", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
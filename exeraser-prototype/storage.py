@@ -0,0 +1,520 @@
+import mimetypes
+import os
+import threading
+import time
+from collections import OrderedDict
+
+try:
+    import boto3
+except ImportError:  # Only needed for STORAGE_BACKEND=s3
+    boto3 = None
+
+CHUNK_SIZE = 1024 * 1024
+IMAGE_EXTENSIONS = ('jpg', 'jpeg', 'png')
+# Files written next to a stored image that share its lifetime: metadata and
+# the thumbnail/preview derivatives (see derivatives.py)
+COMPANION_SUFFIXES = ('.meta.json', '.thumb.jpg', '.preview.jpg')
+# S3 keys found missing are not fetched again for this long
+MISSING_TTL = 30
+MAX_MISSING = 4096
+
+
+class LocalStorage:
+    """Disk storage with a key index, chunked streaming I/O and TTL/LRU eviction
+
+    The index is this process's view of the directory. Other web workers write
+    to the same directory, so a key missing from the index is looked up on
+    disk before it is reported missing, and every sweep re-measures the
+    directory: the quota bounds what is on disk, not what this process wrote.
+    Entry sizes include the entry's companion files.
+    """
+
+    def __init__(self, root, max_bytes=None, ttl=None, sweep_interval=60):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.sweep_interval = sweep_interval
+        self._entries = OrderedDict()
+        self._aliases = {}
+        self._lock = threading.Lock()
+        self._total_bytes = 0
+        self._last_sweep = time.time()
+        self._sweeping = False
+        self.evictions = 0
+
+        os.makedirs(self.root, exist_ok=True)
+        self._rebuild_index()
+
+    def _rebuild_index(self):
+        # One directory scan at startup replaces per-request existence probes
+        files = self._scan()
+        with self._lock:
+            for key in sorted(files, key=lambda k: files[k][2]):
+                size, created_at, accessed_at = files[key]
+                self._index(key, size, created_at, accessed_at)
+
+    def _scan(self):
+        """Return {key: (bytes with companions, mtime, atime)} for the files on disk"""
+        files = {}
+        companions = {}
+        for entry in os.scandir(self.root):
+            try:
+                if not entry.is_file() or entry.name.endswith('.tmp'):
+                    continue
+                st = entry.stat()
+            except FileNotFoundError:
+                continue
+            suffix = next((suffix for suffix in COMPANION_SUFFIXES if entry.name.endswith(suffix)), None)
+            if suffix:
+                stem = entry.name[:-len(suffix)]
+                companions[stem] = companions.get(stem, 0) + st.st_size
+            else:
+                files[entry.name] = (st.st_size, st.st_mtime, st.st_atime)
+        for key, (size, created_at, accessed_at) in files.items():
+            files[key] = (size + companions.get(os.path.splitext(key)[0], 0), created_at, accessed_at)
+        return files
+
+    def _measure(self, key):
+        """Return (bytes with companions, mtime, atime) for key on disk, or None"""
+        path = os.path.join(self.root, key)
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            return None
+        size = st.st_size
+        stem = os.path.splitext(path)[0]
+        for suffix in COMPANION_SUFFIXES:
+            try:
+                size += os.stat(f"{stem}{suffix}").st_size
+            except FileNotFoundError:
+                pass
+        return size, st.st_mtime, st.st_atime
+
+    def _index(self, key, size, created_at=None, accessed_at=None, content_type=None):
+        # Caller holds the lock
+        self._add_entry(key, size, content_type or _guess_type(key), created_at, accessed_at)
+        stem, _, ext = key.rpartition('.')
+        if ext.lower() in IMAGE_EXTENSIONS and '_' not in stem:
+            self._aliases.setdefault(stem, key)
+
+    def _discover(self, key):
+        """Index key if another process stored it, returning its entry or None"""
+        # Keys come from request URLs; only plain file names in the root are valid
+        if not key or os.path.basename(key) != key or key.startswith('.') or key.endswith(('.tmp',) + COMPANION_SUFFIXES):
+            return None
+        measured = self._measure(key)
+        if measured is None:
+            return None
+        with self._lock:
+            if key not in self._entries:
+                self._index(key, *measured)
+            entry = self._entries[key]
+            entry['accessed_at'] = time.time()
+            self._entries.move_to_end(key)
+            return dict(entry)
+
+    def _add_entry(self, key, size, content_type, created_at=None, accessed_at=None):
+        now = time.time()
+        previous = self._entries.pop(key, None)
+        if previous:
+            self._total_bytes -= previous['size']
+        self._entries[key] = {
+            'key': key,
+            'path': os.path.join(self.root, key),
+            'size': size,
+            'content_type': content_type,
+            'created_at': created_at or now,
+            'accessed_at': accessed_at or now
+        }
+        self._total_bytes += size
+
+    def save_stream(self, key, stream, content_type=None, alias=None, chunk_size=CHUNK_SIZE):
+        """Write a file-like object to key in chunks and return the stored entry"""
+        path = os.path.join(self.root, key)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        size = 0
+        try:
+            with open(tmp_path, 'wb') as f:
+                for chunk in iter(lambda: stream.read(chunk_size), b''):
+                    f.write(chunk)
+                    size += len(chunk)
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        return self._register(key, size, content_type, alias)
+
+    def save_bytes(self, key, data, content_type=None, alias=None):
+        """Write bytes to key and return the stored entry"""
+        path = os.path.join(self.root, key)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+        return self._register(key, len(data), content_type, alias)
+
+    def _register(self, key, size, content_type, alias):
+        with self._lock:
+            self._add_entry(key, size, content_type or _guess_type(key))
+            if alias:
+                self._aliases[alias] = key
+            entry = dict(self._entries[key])
+        self.evict()
+        return entry
+
+    def refresh(self, key):
+        """Re-measure key after companion files (metadata, derivatives) were written beside it"""
+        measured = self._measure(key)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or measured is None:
+                return
+            self._total_bytes += measured[0] - entry['size']
+            entry['size'] = measured[0]
+        self.evict()
+
+    def lookup(self, key):
+        """Return the index entry for key (marking it recently used), or None"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                entry['accessed_at'] = time.time()
+                self._entries.move_to_end(key)
+                return dict(entry)
+        # Not stored by this process, but maybe by another worker
+        return self._discover(key)
+
+    def resolve(self, alias):
+        """Return the index entry registered under an alias such as a file_id"""
+        with self._lock:
+            key = self._aliases.get(alias)
+        if key:
+            return self.lookup(key)
+        # Uploads are stored as <file_id>.<ext>
+        for ext in IMAGE_EXTENSIONS:
+            entry = self._discover(f"{alias}.{ext}")
+            if entry is not None:
+                return entry
+        return None
+
+    def local_path(self, key):
+        """Return a local filesystem path for key, or None if it is not stored"""
+        entry = self.lookup(key)
+        return entry['path'] if entry else None
+
+    def open(self, key):
+        """Open key for binary streaming reads"""
+        path = self.local_path(key)
+        if path is None:
+            raise FileNotFoundError(key)
+        return open(path, 'rb')
+
+    def iter_chunks(self, key, chunk_size=CHUNK_SIZE):
+        """Yield the contents of key in chunks"""
+        with self.open(key) as f:
+            for chunk in iter(lambda: f.read(chunk_size), b''):
+                yield chunk
+
+    def delete(self, key):
+        """Remove key, its companion files and any alias pointing at it"""
+        with self._lock:
+            self._forget(key)
+        self._remove_files(key)
+
+    def _forget(self, key):
+        entry = self._entries.pop(key, None)
+        if entry:
+            self._total_bytes -= entry['size']
+        for alias in [a for a, k in self._aliases.items() if k == key]:
+            del self._aliases[alias]
+        return entry
+
+    def _remove_files(self, key):
+        path = os.path.join(self.root, key)
+        stem = os.path.splitext(path)[0]
+        for candidate in [path] + [f"{stem}{suffix}" for suffix in COMPANION_SUFFIXES]:
+            try:
+                os.remove(candidate)
+            except FileNotFoundError:
+                pass
+            except Exception as e:
+                print(f"Storage delete error: {e}")
+
+    def evict(self, force=False):
+        """Drop expired entries, then least recently used ones until under quota
+
+        Sweeps (every sweep_interval) first reconcile the index with the
+        directory, so files written or removed by other processes count.
+        """
+        now = time.time()
+        with self._lock:
+            sweep_due = not self._sweeping and (force or now - self._last_sweep >= self.sweep_interval)
+            if sweep_due:
+                self._last_sweep = now
+                self._sweeping = True
+        if sweep_due:
+            try:
+                self._reconcile(self._scan(), now)
+            except Exception as e:
+                print(f"Storage sweep error: {e}")
+            finally:
+                with self._lock:
+                    self._sweeping = False
+
+        victims = []
+        with self._lock:
+            if self.ttl and sweep_due:
+                cutoff = now - self.ttl
+                victims.extend(key for key, entry in self._entries.items() if entry['accessed_at'] < cutoff)
+                for key in victims:
+                    self._forget(key)
+            if self.max_bytes:
+                while self._total_bytes > self.max_bytes and len(self._entries) > 1:
+                    key = next(iter(self._entries))
+                    self._forget(key)
+                    victims.append(key)
+            self.evictions += len(victims)
+
+        for key in victims:
+            self._remove_files(key)
+        return victims
+
+    def _reconcile(self, files, started):
+        with self._lock:
+            for key, (size, created_at, accessed_at) in files.items():
+                entry = self._entries.get(key)
+                if entry is None:
+                    self._index(key, size, created_at, accessed_at)
+                    # Unseen here, so least recently used as far as this process knows
+                    self._entries.move_to_end(key, last=False)
+                elif entry['size'] != size:
+                    self._total_bytes += size - entry['size']
+                    entry['size'] = size
+            # Gone from disk (another worker evicted it), unless written after the scan began
+            for key in [k for k, e in self._entries.items() if k not in files and e['created_at'] < started]:
+                self._forget(key)
+
+    def stats(self):
+        """Return usage counters for the storage"""
+        with self._lock:
+            return {
+                'backend': 'local',
+                'files': len(self._entries),
+                'bytes': self._total_bytes,
+                'max_bytes': self.max_bytes,
+                'ttl': self.ttl,
+                'evictions': self.evictions
+            }
+
+
+class S3Storage:
+    """S3-compatible object storage (AWS, MinIO) with a local disk cache
+
+    Image stages need real files, so objects are written through to and read
+    back into a LocalStorage cache that has its own quota.
+    """
+
+    def __init__(self, bucket, cache, prefix='', endpoint_url=None, ttl=None, sweep_interval=300):
+        if boto3 is None:
+            raise RuntimeError('STORAGE_BACKEND=s3 requires the boto3 package')
+        self.bucket = bucket
+        self.cache = cache
+        self.prefix = prefix
+        self.ttl = ttl
+        self.sweep_interval = sweep_interval
+        self.client = boto3.client('s3', endpoint_url=endpoint_url)
+        self._aliases = {}
+        self._lock = threading.Lock()
+        self._last_sweep = time.time()
+        self._sweeping = False
+        # Keys recently found missing from the bucket, so bogus or expired ids
+        # do not cost a download attempt each
+        self._missing = OrderedDict()
+        self.evictions = 0
+
+    def _object_key(self, key):
+        return f"{self.prefix}{key}"
+
+    def save_stream(self, key, stream, content_type=None, alias=None, chunk_size=CHUNK_SIZE):
+        entry = self.cache.save_stream(key, stream, content_type, alias, chunk_size)
+        self._upload(entry)
+        return self._remember(key, alias, entry)
+
+    def save_bytes(self, key, data, content_type=None, alias=None):
+        entry = self.cache.save_bytes(key, data, content_type, alias)
+        self._upload(entry)
+        return self._remember(key, alias, entry)
+
+    def _upload(self, entry):
+        # upload_file streams from disk using multipart transfers for large files
+        self.client.upload_file(
+            entry['path'], self.bucket, self._object_key(entry['key']),
+            ExtraArgs={'ContentType': entry['content_type']}
+        )
+
+    def _remember(self, key, alias, entry):
+        with self._lock:
+            self._missing.pop(key, None)
+            if alias:
+                self._aliases[alias] = key
+        self.evict()
+        return entry
+
+    def refresh(self, key):
+        self.cache.refresh(key)
+
+    def lookup(self, key):
+        entry = self.cache.lookup(key)
+        if entry is not None:
+            return entry
+        with self._lock:
+            missed_at = self._missing.get(key)
+            if missed_at is not None and time.time() - missed_at < MISSING_TTL:
+                return None
+        entry = self._fetch(key)
+        if entry is None:
+            with self._lock:
+                self._missing[key] = time.time()
+                self._missing.move_to_end(key)
+                while len(self._missing) > MAX_MISSING:
+                    self._missing.popitem(last=False)
+        return entry
+
+    def _fetch(self, key):
+        if not key or os.path.basename(key) != key or key.startswith('.'):
+            return None
+        path = os.path.join(self.cache.root, key)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        try:
+            self.client.download_file(self.bucket, self._object_key(key), tmp_path)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            return None
+        os.replace(tmp_path, path)
+        return self.cache._register(key, self.cache._measure(key)[0], None, None)
+
+    def resolve(self, alias):
+        with self._lock:
+            key = self._aliases.get(alias)
+        if key:
+            return self.lookup(key)
+        entry = self.cache.resolve(alias)
+        if entry is not None:
+            return entry
+        # Uploaded through another worker and not in the local cache
+        for ext in IMAGE_EXTENSIONS:
+            entry = self.lookup(f"{alias}.{ext}")
+            if entry is not None:
+                return entry
+        return None
+
+    def local_path(self, key):
+        entry = self.lookup(key)
+        return entry['path'] if entry else None
+
+    def open(self, key):
+        path = self.local_path(key)
+        if path is None:
+            raise FileNotFoundError(key)
+        return open(path, 'rb')
+
+    def iter_chunks(self, key, chunk_size=CHUNK_SIZE):
+        with self.open(key) as f:
+            for chunk in iter(lambda: f.read(chunk_size), b''):
+                yield chunk
+
+    def delete(self, key):
+        self.cache.delete(key)
+        with self._lock:
+            for alias in [a for a, k in self._aliases.items() if k == key]:
+                del self._aliases[alias]
+        try:
+            self.client.delete_object(Bucket=self.bucket, Key=self._object_key(key))
+        except Exception as e:
+            print(f"Storage delete error: {e}")
+
+    def evict(self, force=False):
+        """Expire old objects in the bucket; the local cache enforces its own quota
+
+        Listing the bucket is O(objects), so a due sweep runs on a background
+        thread instead of the save() that triggered it; force sweeps inline.
+        """
+        victims = self.cache.evict(force)
+        now = time.time()
+        with self._lock:
+            if not self.ttl or self._sweeping or (not force and now - self._last_sweep < self.sweep_interval):
+                return victims
+            self._last_sweep = now
+            self._sweeping = True
+
+        if force:
+            self._sweep_bucket(now - self.ttl)
+        else:
+            threading.Thread(
+                target=self._sweep_bucket, args=(now - self.ttl,), name='s3-evict', daemon=True
+            ).start()
+        return victims
+
+    def _sweep_bucket(self, cutoff):
+        try:
+            paginator = self.client.get_paginator('list_objects_v2')
+            for page in paginator.paginate(Bucket=self.bucket, Prefix=self.prefix):
+                for obj in page.get('Contents', []):
+                    if obj['LastModified'].timestamp() < cutoff:
+                        self.delete(obj['Key'][len(self.prefix):])
+                        with self._lock:
+                            self.evictions += 1
+        except Exception as e:
+            print(f"Storage eviction error: {e}")
+        finally:
+            with self._lock:
+                self._sweeping = False
+
+    def stats(self):
+        stats = self.cache.stats()
+        with self._lock:
+            evictions = self.evictions
+        stats.update({'backend': 's3', 'bucket': self.bucket, 'evictions': evictions,
+                      'cache_evictions': stats['evictions']})
+        return stats
+
+
+def _guess_type(key):
+    return mimetypes.guess_type(key)[0] or 'application/octet-stream'
+
+
+_storages = {}
+_storages_lock = threading.Lock()
+
+
+def create_storage(root):
+    """Create the storage backend selected by environment settings"""
+    max_bytes = int(os.getenv('STORAGE_MAX_BYTES', str(2 * 1024 ** 3)))
+    ttl = int(os.getenv('STORAGE_TTL', str(24 * 3600)))
+    backend = os.getenv('STORAGE_BACKEND', 'local')
+
+    if backend == 's3':
+        cache = LocalStorage(root, max_bytes=max_bytes)
+        return S3Storage(
+            os.environ['STORAGE_S3_BUCKET'],
+            cache,
+            prefix=os.getenv('STORAGE_S3_PREFIX', 'uploads/'),
+            endpoint_url=os.getenv('STORAGE_S3_ENDPOINT'),  # e.g. http://localhost:9000 for MinIO
+            ttl=ttl
+        )
+    return LocalStorage(root, max_bytes=max_bytes, ttl=ttl)
+
+
+def get_storage(root):
+    """Return the process-wide storage for an uploads directory"""
+    storage = _storages.get(root)
+    if storage is not None:
+        return storage
+    with _storages_lock:
+        storage = _storages.get(root)
+        if storage is None:
+            storage = create_storage(root)
+            _storages[root] = storage
+        return storage
@@ -0,0 +1,66 @@
+import threading
+import time
+
+import pytest
+
+from src.services.admission import ConcurrencyBudget, OverloadedError
+
+
+def _wait_for(condition, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, 'timed out'
+        time.sleep(0.001)
+
+
+def test_sheds_when_estimated_wait_exceeds_slo():
+    budget = ConcurrencyBudget('vendor', 1, slo={'interactive': 2.0, 'batch': 30.0})
+    # Tokens are acquire timestamps, so an older one records a 5 s hold
+    budget.release(budget.acquire('interactive') - 5)
+    token = budget.acquire('interactive')
+
+    start = time.monotonic()
+    with pytest.raises(OverloadedError) as error:
+        budget.acquire('interactive')
+    assert time.monotonic() - start < 0.5
+    assert error.value.retry_after == pytest.approx(5, rel=0.05)
+    # The batch SLO is looser, so the same queue is still worth joining
+    assert budget.estimated_wait('batch') <= 30.0
+    assert budget.stats()['shed'] == {'interactive': 1, 'batch': 0}
+    budget.release(token)
+
+
+def test_interactive_waiters_go_before_batch():
+    budget = ConcurrencyBudget('vendor', 1, batch_share=1.0)
+    token = budget.acquire('interactive')
+    order = []
+
+    def worker(priority):
+        held = budget.acquire(priority)
+        order.append(priority)
+        budget.release(held)
+
+    batch = threading.Thread(target=worker, args=('batch',))
+    batch.start()
+    _wait_for(lambda: budget.stats()['waiting']['batch'] == 1)
+    interactive = threading.Thread(target=worker, args=('interactive',))
+    interactive.start()
+    _wait_for(lambda: budget.stats()['waiting']['interactive'] == 1)
+
+    budget.release(token)
+    batch.join(2)
+    interactive.join(2)
+    assert order == ['interactive', 'batch']
+
+
+def test_batch_keeps_to_its_share_of_slots():
+    budget = ConcurrencyBudget('vendor', 4, slo={'interactive': 2.0, 'batch': 0.05}, batch_share=0.5)
+    tokens = [budget.acquire('batch'), budget.acquire('batch')]
+
+    with pytest.raises(OverloadedError):
+        budget.acquire('batch')
+    tokens.append(budget.acquire('interactive'))
+    assert budget.stats()['active'] == 3
+
+    for token in tokens:
+        budget.release(token)
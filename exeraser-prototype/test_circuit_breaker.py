@@ -0,0 +1,103 @@
+import pytest
+
+from src.services import circuit_breaker
+from src.services.circuit_breaker import CircuitBreaker, CircuitOpenError
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(circuit_breaker.time, 'monotonic', clock)
+    return clock
+
+
+def _breaker():
+    return CircuitBreaker('vendor', window=4, min_calls=4, open_seconds=30, slow_call_seconds=5)
+
+
+def _fail(breaker, calls):
+    for _ in range(calls):
+        breaker.record(True, 0.1, breaker.before_call())
+
+
+def test_trips_on_error_rate_and_fails_fast(clock):
+    breaker = _breaker()
+    breaker.record(False, 0.1, breaker.before_call())
+    _fail(breaker, 2)
+    assert breaker.state == 'closed'
+
+    _fail(breaker, 1)
+    assert breaker.state == 'open'
+    with pytest.raises(CircuitOpenError) as error:
+        breaker.before_call()
+    assert error.value.retry_after == pytest.approx(30)
+    assert breaker.stats() == {'state': 'open', 'opened': 1, 'rejected': 1}
+
+
+def test_trips_on_slow_calls(clock):
+    breaker = _breaker()
+    for _ in range(4):
+        breaker.record(False, 6.0, breaker.before_call())
+    assert breaker.state == 'open'
+
+
+def test_half_open_probe_success_closes(clock):
+    breaker = _breaker()
+    _fail(breaker, 4)
+    clock.now += 31
+
+    probe = breaker.before_call()
+    assert breaker.state == 'half_open'
+    # Only one probe at a time while half-open
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+
+    breaker.record(False, 0.1, probe)
+    assert breaker.state == 'closed'
+    breaker.before_call()
+
+
+def test_half_open_probe_failure_reopens(clock):
+    breaker = _breaker()
+    _fail(breaker, 4)
+    clock.now += 31
+
+    breaker.record(True, 0.1, breaker.before_call())
+    assert breaker.state == 'open'
+    assert breaker.retry_after() == pytest.approx(30)
+    assert breaker.opened == 2
+
+
+def test_calls_started_before_the_trip_do_not_decide_the_probe(clock):
+    breaker = _breaker()
+    in_flight = breaker.before_call()
+    _fail(breaker, 4)
+    clock.now += 31
+    probe = breaker.before_call()
+
+    # A hedge from before the outage finishing now says nothing about recovery
+    breaker.record(False, 0.1, in_flight)
+    assert breaker.state == 'half_open'
+    breaker.record(True, 0.1, in_flight)
+    assert breaker.state == 'half_open'
+
+    breaker.record(False, 0.1, probe)
+    assert breaker.state == 'closed'
+
+
+def test_cancelled_probe_frees_the_slot(clock):
+    breaker = _breaker()
+    _fail(breaker, 4)
+    clock.now += 31
+
+    breaker.cancel_call(breaker.before_call())
+    breaker.record(False, 0.1, breaker.before_call())
+    assert breaker.state == 'closed'
@@ -0,0 +1,60 @@
+import io
+import json
+
+import pytest
+from flask import Flask
+from PIL import Image
+
+from src.routes import image_simple
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    # The demo sleeps to imitate vendor latency
+    monkeypatch.setattr(image_simple.time, 'sleep', lambda seconds: None)
+    app = Flask(__name__, root_path=str(tmp_path))
+    app.register_blueprint(image_simple.image_bp, url_prefix='/api/image')
+    return app.test_client()
+
+
+def _upload(client):
+    buffer = io.BytesIO()
+    Image.new('RGB', (64, 48), 'white').save(buffer, format='JPEG')
+    buffer.seek(0)
+    response = client.post(
+        '/api/image/upload', data={'image': (buffer, 'photo.jpg', 'image/jpeg')},
+        content_type='multipart/form-data'
+    )
+    assert response.status_code == 200
+    return response.get_json()['file_id']
+
+
+def test_remove_people_returns_json(client):
+    file_id = _upload(client)
+    response = client.post('/api/image/remove-people', json={'file_id': file_id, 'selected_people': [1]})
+    assert response.status_code == 200
+    assert response.mimetype == 'application/json'
+    assert response.get_json()['success'] is True
+
+
+def test_remove_people_progressive_streams_result_event(client):
+    file_id = _upload(client)
+    response = client.post(
+        '/api/image/remove-people',
+        json={'file_id': file_id, 'selected_people': [1], 'progressive': True}
+    )
+    assert response.status_code == 200
+    assert response.mimetype == 'text/event-stream'
+
+    body = response.get_data(as_text=True)
+    assert body.endswith('\n\n')
+    event, data = body.strip().split('\n')
+    assert event == 'event: result'
+    result = json.loads(data[len('data: '):])
+    assert result['success'] is True
+    assert client.get(result['result_url']).status_code == 200
+
+
+def test_remove_people_progressive_validates_before_streaming(client):
+    response = client.post('/api/image/remove-people', json={'file_id': 'x', 'progressive': True})
+    assert response.status_code == 400
@@ -0,0 +1,67 @@
+import numpy as np
+
+from src.services.mask_engine import build_mask, mask_bounds, mask_hash, percent_boxes_to_pixels
+
+
+def _square(mask):
+    """Bounds of the mask, checking every pixel inside them is set"""
+    bounds = mask_bounds(mask)
+    x0, y0, x1, y1 = bounds
+    assert (mask[y0:y1, x0:x1] == 255).all()
+    assert int((mask > 0).sum()) == (x1 - x0) * (y1 - y0)
+    return bounds
+
+
+def test_percent_boxes_are_clipped_to_the_image():
+    people = [
+        {'x': 90, 'y': 80, 'width': 20, 'height': 40},
+        {'x': -5, 'y': -10, 'width': 10, 'height': 20}
+    ]
+    boxes = percent_boxes_to_pixels(people, 200, 100)
+    assert boxes.tolist() == [[180, 80, 200, 100], [0, 0, 11, 11]]
+    assert percent_boxes_to_pixels([], 200, 100).shape == (0, 4)
+
+
+def test_box_dilation_stops_at_image_edges():
+    mask = build_mask(40, 30, boxes=[(0, 0, 10, 10), (35, 25, 40, 30)], dilate=3)
+    assert mask.shape == (30, 40)
+    assert (mask[:13, :13] == 255).all()
+    assert (mask[22:, 32:] == 255).all()
+    assert int((mask > 0).sum()) == 13 * 13 + 8 * 8
+
+
+def test_segment_dilation_matches_a_square_window():
+    segment = np.zeros((5, 5), dtype=np.uint8)
+    segment[2, 2] = 1
+    mask = build_mask(50, 50, segments=[(20, 10, segment)], dilate=4)
+    assert _square(mask) == (18, 8, 27, 17)
+
+
+def test_segment_dilation_is_clipped_at_every_edge():
+    corner = np.ones((1, 1), dtype=np.uint8)
+    mask = build_mask(20, 10, segments=[(0, 0, corner), (19, 9, corner)], dilate=2)
+    assert (mask[:3, :3] == 255).all()
+    assert (mask[7:, 17:] == 255).all()
+    assert int((mask > 0).sum()) == 2 * 3 * 3
+    # Nothing wraps around to the opposite side
+    assert mask[0, 19] == 0 and mask[9, 0] == 0
+
+
+def test_polygon_outside_the_image_is_clipped():
+    polygon = np.array([[-10, -10], [15, -10], [15, 15], [-10, 15]], dtype=np.float64)
+    mask = build_mask(30, 20, polygons=[polygon])
+    assert _square(mask) == (0, 0, 16, 16)
+
+
+def test_feathering_only_spreads_near_the_mask():
+    mask = build_mask(60, 60, boxes=[(20, 20, 40, 40)], feather=2)
+    x0, y0, x1, y1 = mask_bounds(mask)
+    assert 20 - 6 <= x0 < 20 and 40 < x1 <= 40 + 6
+    assert mask[30, 30] == 255 and mask[0, 0] == 0
+
+
+def test_mask_hash_depends_only_on_pixels_and_shape():
+    mask = build_mask(16, 8, boxes=[(2, 2, 6, 6)])
+    assert mask_hash(mask) == mask_hash(mask.copy())
+    assert mask_hash(mask) != mask_hash(mask.reshape(8, 16).T.copy())
+    assert mask_hash(mask) != mask_hash(build_mask(16, 8, boxes=[(2, 2, 6, 7)]))
@@ -0,0 +1,67 @@
+import io
+import os
+
+from werkzeug.test import EnvironBuilder
+from werkzeug.wrappers import Request
+
+from src.services.multipart_stream import StreamingMultipart
+
+
+def _read_all(body, size):
+    return b''.join(iter(lambda: body.read(size), b''))
+
+
+def _body(tmp_path):
+    image = tmp_path / 'photo.jpg'
+    image.write_bytes(os.urandom(700 * 1024))
+    mask = os.urandom(300 * 1024)
+    return StreamingMultipart(
+        {'mode': 'fast'},
+        {'image_file': ('image.jpg', image, 'image/jpeg'), 'mask_file': ('mask.png', mask, 'image/png')}
+    ), image.read_bytes(), mask
+
+
+def test_resent_body_is_byte_identical(tmp_path):
+    body, _, _ = _body(tmp_path)
+    first = _read_all(body, 100 * 1024 + 7)
+    assert len(first) == len(body)
+
+    # A retry after a partial send rewinds to the start and must produce the same bytes
+    body.seek(0)
+    body.read(12345)
+    assert body.seek(0) == 0
+    second = b''.join(body)
+    body.close()
+    assert second == first
+
+
+def test_seek_and_tell_follow_the_file_protocol(tmp_path):
+    body, _, _ = _body(tmp_path)
+    whole = _read_all(body, 64 * 1024)
+
+    assert body.seek(0, os.SEEK_END) == len(body)
+    assert body.read() == b''
+    body.seek(-100, os.SEEK_END)
+    assert body.tell() == len(body) - 100
+    assert _read_all(body, 33) == whole[-100:]
+    body.seek(500 * 1024)
+    body.seek(10, os.SEEK_CUR)
+    assert _read_all(body, 4096) == whole[500 * 1024 + 10:]
+    body.close()
+
+
+def test_body_parses_as_multipart_form(tmp_path):
+    body, image, mask = _body(tmp_path)
+    payload = _read_all(body, 256 * 1024)
+    body.close()
+
+    environ = EnvironBuilder(
+        method='POST', input_stream=io.BytesIO(payload), content_type=body.content_type,
+        content_length=len(payload)
+    ).get_environ()
+    request = Request(environ)
+    assert request.form['mode'] == 'fast'
+    assert request.files['image_file'].filename == 'image.jpg'
+    assert request.files['image_file'].read() == image
+    assert request.files['mask_file'].mimetype == 'image/png'
+    assert request.files['mask_file'].read() == mask
@@ -0,0 +1,95 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from src.services.result_cache import ResultCache
+
+
+def _wait_for(condition, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, 'timed out'
+        time.sleep(0.001)
+
+
+def test_concurrent_identical_removals_compute_once():
+    cache = ResultCache()
+    release = threading.Event()
+    calls = []
+
+    def compute():
+        calls.append(1)
+        release.wait(2)
+        return {'result_id': 'r1'}, True
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        futures = [executor.submit(cache.get_or_compute, 'key', compute) for _ in range(8)]
+        _wait_for(lambda: cache.stats()['shared'] == 7)
+        release.set()
+        results = [future.result(timeout=2) for future in futures]
+
+    assert len(calls) == 1
+    assert all(value == {'result_id': 'r1'} for value, _ in results)
+    assert sorted(source for _, source in results) == ['computed'] + ['shared'] * 7
+    assert cache.get_or_compute('key', compute) == ({'result_id': 'r1'}, 'cache')
+    assert len(calls) == 1
+
+
+def test_async_and_threaded_callers_share_one_computation():
+    cache = ResultCache()
+    started = threading.Event()
+    release = threading.Event()
+
+    def compute():
+        started.set()
+        release.wait(2)
+        return 'value', True
+
+    async def main():
+        leader = asyncio.get_running_loop().run_in_executor(None, cache.get_or_compute, 'key', compute)
+        await asyncio.to_thread(started.wait, 2)
+
+        async def never_called():
+            raise AssertionError('computed twice')
+
+        follower = asyncio.ensure_future(cache.get_or_compute_async('key', never_called))
+        await asyncio.sleep(0)
+        release.set()
+        return await leader, await follower
+
+    assert asyncio.run(main()) == (('value', 'computed'), ('value', 'shared'))
+
+
+def test_failure_reaches_waiters_and_is_not_cached():
+    cache = ResultCache()
+    release = threading.Event()
+
+    def compute():
+        release.wait(2)
+        raise RuntimeError('vendor down')
+
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        futures = [executor.submit(cache.get_or_compute, 'key', compute) for _ in range(2)]
+        _wait_for(lambda: cache.stats()['shared'] == 1)
+        release.set()
+        for future in futures:
+            with pytest.raises(RuntimeError):
+                future.result(timeout=2)
+
+    assert cache.get_or_compute('key', lambda: ('retried', True)) == ('retried', 'computed')
+
+
+def test_uncacheable_result_is_shared_but_not_stored():
+    cache = ResultCache()
+    assert cache.get_or_compute('key', lambda: ('fallback', False)) == ('fallback', 'computed')
+    assert cache.get_or_compute('key', lambda: ('vendor', True)) == ('vendor', 'computed')
+
+
+def test_entries_failing_validation_are_recomputed():
+    cache = ResultCache(validate=lambda entry: entry != 'deleted')
+    cache.get_or_compute('key', lambda: ('deleted', True))
+    assert not cache.contains('key')
+    assert cache.get_or_compute('key', lambda: ('fresh', True)) == ('fresh', 'computed')
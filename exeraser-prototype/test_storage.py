@@ -0,0 +1,76 @@
+import os
+import time
+
+from src.services import storage as storage_module
+from src.services.storage import LocalStorage
+
+
+def _store(storage, file_id, size):
+    """Save an upload with the metadata and derivatives written beside it"""
+    stored = storage.save_bytes(f"{file_id}.jpg", b'x' * size, 'image/jpeg', alias=file_id)
+    for suffix, companion_size in (('.meta.json', 100), ('.thumb.jpg', 200), ('.preview.jpg', 300)):
+        with open(os.path.join(storage.root, f"{file_id}{suffix}"), 'wb') as f:
+            f.write(b'y' * companion_size)
+    storage.refresh(stored['key'])
+    return stored
+
+
+def _files(storage):
+    return sorted(os.listdir(storage.root))
+
+
+def test_sizes_include_companion_files(tmp_path):
+    storage = LocalStorage(str(tmp_path))
+    _store(storage, 'a', 1000)
+    assert storage.stats()['bytes'] == 1600
+    assert storage.lookup('a.jpg')['size'] == 1600
+
+
+def test_lru_eviction_removes_companions_and_updates_total(tmp_path):
+    storage = LocalStorage(str(tmp_path), max_bytes=4000)
+    _store(storage, 'a', 1000)
+    _store(storage, 'b', 1000)
+    # Reading a makes b the least recently used
+    storage.lookup('a.jpg')
+    _store(storage, 'c', 1000)
+
+    assert _files(storage) == [
+        'a.jpg', 'a.meta.json', 'a.preview.jpg', 'a.thumb.jpg',
+        'c.jpg', 'c.meta.json', 'c.preview.jpg', 'c.thumb.jpg'
+    ]
+    stats = storage.stats()
+    assert stats['bytes'] == 3200
+    assert stats['files'] == 2
+    assert stats['evictions'] == 1
+    assert storage.resolve('b') is None
+
+
+def test_ttl_eviction_removes_expired_entries_with_companions(tmp_path, monkeypatch):
+    storage = LocalStorage(str(tmp_path), ttl=3600)
+    _store(storage, 'old', 1000)
+    later = time.time() + 7200
+    monkeypatch.setattr(storage_module.time, 'time', lambda: later)
+
+    # Saving is enough to trigger the overdue sweep
+    _store(storage, 'new', 500)
+    assert _files(storage) == ['new.jpg', 'new.meta.json', 'new.preview.jpg', 'new.thumb.jpg']
+    stats = storage.stats()
+    assert stats['bytes'] == 1100
+    assert stats['evictions'] == 1
+    assert storage.lookup('old.jpg') is None
+
+
+def test_other_workers_files_are_found_and_count_toward_the_quota(tmp_path):
+    first = LocalStorage(str(tmp_path), max_bytes=3000)
+    second = LocalStorage(str(tmp_path), max_bytes=3000)
+    _store(first, 'a', 1000)
+
+    assert second.resolve('a')['size'] == 1600
+    assert second.lookup('a.meta.json') is None
+    assert second.lookup('../a.jpg') is None
+
+    _store(second, 'b', 1000)
+    # a was written by the other worker but still counts toward this one's quota
+    second.evict(force=True)
+    assert second.stats()['bytes'] <= 3000
+    assert not os.path.exists(os.path.join(str(tmp_path), 'a.jpg'))
@@ -0,0 +1,56 @@
+from io import BytesIO
+
+from src.services.startup import LazyModule
+
+np = LazyModule('numpy')
+Image = LazyModule('PIL.Image')
+
+
+def prepare_image_payload(image_path, max_side, quality=85):
+    """Return (jpeg_bytes, original_size, sent_size) downscaled to a model's input size"""
+    with Image.open(image_path) as img:
+        original_size = img.size
+        target = fit_size(original_size, max_side)
+        if img.format == 'JPEG':
+            # Let libjpeg decode at 1/2, 1/4 or 1/8 scale instead of full resolution
+            img.draft('RGB', target)
+        image = img.convert('RGB')
+
+    if image.size != target:
+        image = image.resize(target, Image.BILINEAR, reducing_gap=2.0)
+
+    buffer = BytesIO()
+    image.save(buffer, format='JPEG', quality=quality)
+    return buffer.getvalue(), original_size, image.size
+
+
+def downscale_with_mask(image_path, mask, max_side):
+    """Return (rgb_array, mask) decoded and scaled so the longer side is at most max_side"""
+    with Image.open(image_path) as img:
+        target = fit_size(img.size, max_side)
+        if img.format == 'JPEG':
+            img.draft('RGB', target)
+        image = img.convert('RGB')
+
+    if image.size != target:
+        image = image.resize(target, Image.BILINEAR, reducing_gap=2.0)
+    if mask.shape[::-1] != target:
+        # Bilinear plus "any coverage" keeps thin mask strokes from vanishing
+        scaled = Image.fromarray(np.ascontiguousarray(mask), 'L').resize(target, Image.BILINEAR)
+        mask = np.where(np.asarray(scaled) > 0, 255, 0).astype(np.uint8)
+    return np.asarray(image), mask
+
+
+def decode_mask(mask_data):
+    """Decode an encoded mask image to a uint8 array at its own resolution"""
+    with Image.open(BytesIO(mask_data)) as mask:
+        return np.asarray(mask.convert('L'))
+
+
+def fit_size(size, max_side):
+    """(width, height) scaled down so the longest side is at most max_side (falsy: no limit)"""
+    width, height = size
+    if not max_side or max(width, height) <= max_side:
+        return size
+    scale = max_side / float(max(width, height))
+    return max(1, round(width * scale)), max(1, round(height * scale))
@@ -0,0 +1,326 @@
+import asyncio
+import contextvars
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from src.services.startup import LazyModule
+from src.services.metrics import record_vendor_call
+from src.services.circuit_breaker import CircuitBreaker, VendorUnavailableError
+from src.services.admission import get_budget
+from src.services.multipart_stream import StreamingMultipart
+
+# Tuned per-vendor settings. Detection is quick and small, so it gets a short
+# read timeout; cleanup and mask generation upload full images and take longer.
+VENDOR_TRANSPORT_CONFIG = {
+    'roboflow': {'pool_size': 20, 'connect_timeout': 3.05, 'read_timeout': 15},
+    'clipdrop': {'pool_size': 10, 'connect_timeout': 3.05, 'read_timeout': 60},
+    'segmind': {'pool_size': 10, 'connect_timeout': 3.05, 'read_timeout': 60},
+}
+
+# Calls slower than this count against the vendor's circuit breaker
+# (override with <VENDOR>_BREAKER_SLOW_SECONDS)
+BREAKER_SLOW_CALL_SECONDS = {'roboflow': 5, 'clipdrop': 30, 'segmind': 30}
+
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+# Loaded with the first vendor transport rather than at startup
+requests = LazyModule('requests')
+urllib3_retry = LazyModule('urllib3.util.retry')
+
+# Hedges only start once p95 is known, never fire sooner than HEDGE_MIN_DELAY and
+# may add at most HEDGE_BUDGET extra requests per request sent
+HEDGE_MIN_SAMPLES = 20
+HEDGE_MIN_DELAY = 0.05
+HEDGE_BUDGET = 0.1
+
+# Runs the first attempt of a hedged call while the caller waits on the hedge delay
+hedge_executor = ThreadPoolExecutor(max_workers=32, thread_name_prefix='hedge')
+
+
+class RateLimiter:
+    """Blocking token bucket allowing `rate` requests per second"""
+
+    def __init__(self, rate, burst=None):
+        self.rate = float(rate)
+        self.capacity = float(burst or max(1.0, rate))
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Wait until a request may be sent"""
+        while True:
+            wait = self._try_take()
+            if not wait:
+                return
+            time.sleep(wait)
+
+    async def acquire_async(self):
+        """Wait until a request may be sent without blocking the event loop"""
+        while True:
+            wait = self._try_take()
+            if not wait:
+                return
+            await asyncio.sleep(wait)
+
+    def _try_take(self):
+        # Take a token and return 0, or return how long until one is available
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return 0
+            return (1 - self._tokens) / self.rate
+
+
+class VendorTransport:
+    """Pooled keep-alive HTTP session for a single AI vendor"""
+
+    def __init__(self, name, pool_size=10, connect_timeout=3.05, read_timeout=30,
+                 max_retries=2, backoff_factor=0.5, backoff_jitter=0.5, latency_window=512,
+                 rate_limit=None, breaker=None, budget=None):
+        self.name = name
+        self.timeout = (connect_timeout, read_timeout)
+        self.rate_limiter = RateLimiter(rate_limit) if rate_limit else None
+        self.breaker = breaker
+        # Concurrency budget with priority queueing; sheds calls with OverloadedError
+        self.budget = budget
+        self.session = requests.Session()
+
+        # Retries happen inside urllib3 so the prepared body (including
+        # multipart uploads) is re-sent as-is on each attempt.
+        retry = urllib3_retry.Retry(
+            total=max_retries,
+            connect=max_retries,
+            read=0,
+            status=max_retries,
+            status_forcelist=RETRY_STATUSES,
+            allowed_methods=frozenset(['GET', 'POST']),
+            backoff_factor=backoff_factor,
+            backoff_jitter=backoff_jitter,
+            respect_retry_after_header=True,
+            raise_on_status=False
+        )
+        adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=pool_size,
+                                                max_retries=retry, pool_block=False)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+        self._lock = threading.Lock()
+        self._latencies = deque(maxlen=latency_window)
+        self._outcomes = deque(maxlen=latency_window)
+        self.requests = 0
+        self.errors = 0
+        self.retries = 0
+        self.total_seconds = 0.0
+        self.hedges = 0
+        self.hedges_won = 0
+
+    def post(self, url, **kwargs):
+        """POST through the pooled session, recording latency and errors"""
+        return self.request('POST', url, **kwargs)
+
+    def request(self, method, url, files=None, **kwargs):
+        body = None
+        if files:
+            # requests would copy every part into one buffer; stream them instead
+            body = StreamingMultipart(kwargs.pop('data', None), files)
+            kwargs['data'] = body
+            kwargs['headers'] = dict(kwargs.get('headers') or {}, **{'Content-Type': body.content_type})
+        token = None
+        generation = None
+        try:
+            if self.breaker:
+                # Fail fast with CircuitOpenError while the vendor is known to be down,
+                # before queueing for (and counting against) its concurrency budget
+                generation = self.breaker.before_call()
+            try:
+                token = self.budget.acquire() if self.budget else None
+            except BaseException:
+                # Shed while queueing; the call never reached the vendor
+                if self.breaker:
+                    self.breaker.cancel_call(generation)
+                raise
+            return self._request(method, url, generation, **kwargs)
+        finally:
+            if token is not None:
+                self.budget.release(token)
+            if body is not None:
+                body.close()
+
+    def _request(self, method, url, generation=None, **kwargs):
+        kwargs.setdefault('timeout', self.timeout)
+        if self.rate_limiter:
+            self.rate_limiter.acquire()
+        start = time.perf_counter()
+        failed = True
+        vendor_failed = True
+        retries = 0
+        try:
+            try:
+                response = self.session.request(method, url, **kwargs)
+            except requests.RequestException as e:
+                raise VendorUnavailableError(f"{self.name} request failed: {e}") from e
+            history = getattr(getattr(response.raw, 'retries', None), 'history', None)
+            retries = len(history) if history else 0
+            failed = response.status_code >= 400
+            vendor_failed = response.status_code in RETRY_STATUSES or response.status_code >= 500
+            return response
+        finally:
+            self._record(time.perf_counter() - start, failed, retries, vendor_failed, generation)
+
+    def hedge_delay(self):
+        """Seconds to wait before hedging a call, or None when hedging is not allowed"""
+        if self.breaker and self.breaker.state != 'closed':
+            return None
+        with self._lock:
+            if len(self._latencies) < HEDGE_MIN_SAMPLES or self.hedges > self.requests * HEDGE_BUDGET:
+                return None
+        return max(HEDGE_MIN_DELAY, self.percentile(95))
+
+    def hedged_post(self, url, **kwargs):
+        """POST an idempotent request, racing a duplicate if the first outlives p95
+
+        Request bodies must be re-sendable (bytes or paths, not open files).
+        """
+        delay = self.hedge_delay()
+        if delay is None:
+            return self.post(url, **kwargs)
+
+        # Both attempts keep the caller's priority class for the concurrency budget
+        first = hedge_executor.submit(contextvars.copy_context().run, self.post, url, **kwargs)
+        done, _ = wait([first], timeout=delay)
+        if done:
+            return first.result()
+
+        with self._lock:
+            self.hedges += 1
+        second = hedge_executor.submit(contextvars.copy_context().run, self.post, url, **kwargs)
+        pending = {first, second}
+        response, error = None, None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                try:
+                    result = future.result()
+                except Exception as e:
+                    error = error or e
+                    continue
+                if result.status_code < 500:
+                    if future is second:
+                        with self._lock:
+                            self.hedges_won += 1
+                    # The slower duplicate finishes in the background and is discarded
+                    return result
+                response = result
+        if response is not None:
+            return response
+        raise error
+
+    def _record(self, elapsed, failed, retries, vendor_failed=None, generation=None):
+        record_vendor_call(self.name, elapsed, failed)
+        if self.breaker:
+            self.breaker.record(failed if vendor_failed is None else vendor_failed, elapsed, generation)
+        with self._lock:
+            self.requests += 1
+            self.retries += retries
+            self.total_seconds += elapsed
+            self._latencies.append(elapsed)
+            self._outcomes.append(failed)
+            if failed:
+                self.errors += 1
+
+    def health(self):
+        """Classify the vendor from its recent error rate: unknown/healthy/degraded/down"""
+        if self.breaker and self.breaker.state == 'open':
+            return 'down'
+        with self._lock:
+            outcomes = list(self._outcomes)
+        if not outcomes:
+            return 'unknown'
+        error_rate = sum(outcomes) / len(outcomes)
+        if error_rate < 0.1:
+            return 'healthy'
+        return 'degraded' if error_rate < 0.5 else 'down'
+
+    def percentile(self, pct):
+        """Return the given latency percentile (seconds) over the recent window"""
+        with self._lock:
+            samples = sorted(self._latencies)
+        if not samples:
+            return None
+        index = min(len(samples) - 1, int(round(pct / 100.0 * (len(samples) - 1))))
+        return samples[index]
+
+    def stats(self):
+        """Return a snapshot of the latency and error counters"""
+        with self._lock:
+            count = self.requests
+            snapshot = {
+                'requests': count,
+                'errors': self.errors,
+                'retries': self.retries,
+                'hedges': self.hedges,
+                'hedges_won': self.hedges_won,
+                'error_rate': (self.errors / count) if count else 0.0,
+                'avg_latency_ms': (self.total_seconds / count * 1000) if count else None,
+            }
+        if self.breaker:
+            snapshot['circuit'] = self.breaker.stats()
+        for pct in (50, 95, 99):
+            value = self.percentile(pct)
+            snapshot[f'p{pct}_latency_ms'] = value * 1000 if value is not None else None
+        snapshot['health'] = self.health()
+        return snapshot
+
+    def close(self):
+        self.session.close()
+
+
+_transports = {}
+_transports_lock = threading.Lock()
+
+
+def get_transport(name):
+    """Return the process-wide shared transport for a vendor, creating it on first use"""
+    transport = _transports.get(name)
+    if transport is not None:
+        return transport
+    with _transports_lock:
+        transport = _transports.get(name)
+        if transport is None:
+            config = dict(VENDOR_TRANSPORT_CONFIG.get(name, {}))
+            # e.g. ROBOFLOW_RATE_LIMIT=10 caps Roboflow at 10 requests/second
+            rate_limit = os.getenv(f'{name.upper()}_RATE_LIMIT')
+            if rate_limit:
+                config['rate_limit'] = float(rate_limit)
+            config['breaker'] = create_breaker(name)
+            config['budget'] = get_budget(name)
+            transport = VendorTransport(name, **config)
+            _transports[name] = transport
+        return transport
+
+
+def create_breaker(name):
+    """Build a vendor's circuit breaker from environment settings (CIRCUIT_BREAKERS=0 disables)"""
+    if os.getenv('CIRCUIT_BREAKERS', '1') != '1':
+        return None
+    slow = os.getenv(f'{name.upper()}_BREAKER_SLOW_SECONDS')
+    return CircuitBreaker(
+        name,
+        error_rate=float(os.getenv('CIRCUIT_BREAKER_ERROR_RATE', '0.5')),
+        slow_call_seconds=float(slow) if slow else BREAKER_SLOW_CALL_SECONDS.get(name),
+        open_seconds=float(os.getenv('CIRCUIT_BREAKER_OPEN_SECONDS', '30'))
+    )
+
+
+def transport_stats():
+    """Return latency/error counters for every vendor transport created so far"""
+    with _transports_lock:
+        transports = list(_transports.values())
+    return {transport.name: transport.stats() for transport in transports}